@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from grpc_interceptor import ServerInterceptor
+
+from deadlines import deadline_passed
+
+DEFAULT_MAX_QUEUE = 100  # requests waiting for a worker before new ones are shed
+TARGET_DELAY = 0.05  # seconds in the queue that count as a standing queue
+INTERVAL = 0.1  # how long the queue may stand before requests are dropped
+SHED_WORKERS = 2  # threads that answer shed requests
+RETRY_AFTER_MIN = 0.1
+RETRY_AFTER_MAX = 5.0
+RATE_WINDOW = 10  # seconds the shed rate is measured over
+EXEMPT_METHODS = ("HealthCheck",)  # always served, so overload stays visible
+
+ADMIT = "ADMIT"
+SHED = "SHED"  # the queue was full
+DROP = "DROP"  # waited too long in a standing queue
+
+_current = threading.local()
+
+
+class AdmissionControl:
+    """Bounded request queue in front of the gateway's worker threads.
+
+    A request that arrives to a full queue is shed. A request taken off
+    the queue is dropped CoDel-style when the time spent waiting has stayed
+    above TARGET_DELAY for a whole INTERVAL, which means the queue is not
+    draining and the client is likely to time out anyway.
+    """
+
+    def __init__(self, workers, max_queue=DEFAULT_MAX_QUEUE, target=TARGET_DELAY, interval=INTERVAL):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.target = target
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.first_above = None
+        self.service_time = 0.0
+        self.buckets = {}  # whole second -> [requests, shed]
+
+    def enter(self):
+        """Reserve a place in the queue; False if the request must be shed."""
+        with self.lock:
+            if self.queued >= self.max_queue:
+                return False
+            self.queued += 1
+            return True
+
+    def leave(self, waited):
+        """Take a request off the queue after `waited` seconds and decide whether to run it."""
+        now = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            if waited < self.target or self.queued == 0:
+                self.first_above = None
+                return ADMIT
+            if self.first_above is None:
+                self.first_above = now + self.interval
+                return ADMIT
+            return DROP if now >= self.first_above else ADMIT
+
+    def finished(self, seconds):
+        with self.lock:
+            self.service_time += 0.1 * (seconds - self.service_time)
+
+    def record(self, shed):
+        second = int(time.monotonic())
+        with self.lock:
+            bucket = self.buckets.setdefault(second, [0, 0])
+            bucket[0] += 1
+            bucket[1] += shed
+            if len(self.buckets) > RATE_WINDOW:
+                for old in [s for s in self.buckets if s <= second - RATE_WINDOW]:
+                    del self.buckets[old]
+
+    def retry_after(self):
+        """Seconds until the queue ahead of a retry should have drained."""
+        with self.lock:
+            drain = (self.queued / self.workers + 1) * self.service_time
+        return min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, drain))
+
+    def snapshot(self):
+        """Queue depth and the fraction of requests shed over the last RATE_WINDOW seconds."""
+        since = int(time.monotonic()) - RATE_WINDOW
+        with self.lock:
+            requests = sum(b[0] for s, b in self.buckets.items() if s > since)
+            shed = sum(b[1] for s, b in self.buckets.items() if s > since)
+            return self.queued, shed / requests if requests else 0.0
+
+
+def _run(verdict, fn, args, kwargs, waited=0.0):
+    _current.verdict = verdict
+    _current.waited = waited
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current.verdict = ADMIT
+        _current.waited = 0.0
+
+
+def queue_wait():
+    """Seconds the request running on this thread waited in the admission queue."""
+    return getattr(_current, "waited", 0.0)
+
+
+def untimed():
+    """Leave the request running on this thread out of the service time, as a stream that stays open should be."""
+    _current.timed = False
+
+
+class AdmissionExecutor(futures.ThreadPoolExecutor):
+    """Executor for grpc.server that queues at most admission.max_queue requests.
+
+    gRPC cannot be told "no" by its executor, so a shed request still runs,
+    but on a small separate pool where AdmissionInterceptor rejects it
+    before any work is done.
+    """
+
+    def __init__(self, admission, max_workers):
+        super().__init__(max_workers=max_workers)
+        self.admission = admission
+        self.shed_pool = futures.ThreadPoolExecutor(max_workers=SHED_WORKERS)
+
+    def submit(self, fn, /, *args, **kwargs):
+        if not self.admission.enter():
+            return self.shed_pool.submit(_run, SHED, fn, args, kwargs)
+        return super().submit(self._dequeue, time.monotonic(), fn, args, kwargs)
+
+    def _dequeue(self, enqueued, fn, args, kwargs):
+        waited = time.monotonic() - enqueued
+        verdict = self.admission.leave(waited)
+        start = time.monotonic()
+        _current.timed = True
+        try:
+            return _run(verdict, fn, args, kwargs, waited)
+        finally:
+            if _current.timed:
+                self.admission.finished(time.monotonic() - start)
+
+    def shutdown(self, wait=True, **kwargs):
+        self.shed_pool.shutdown(wait, **kwargs)
+        super().shutdown(wait, **kwargs)
+
+
+class AdmissionInterceptor(ServerInterceptor):
+    """Rejects what AdmissionExecutor shed or dropped, and requests already past their deadline."""
+
+    def __init__(self, admission):
+        self.admission = admission
+
+    def intercept(self, method, request, context, method_name):
+        verdict = getattr(_current, "verdict", ADMIT)
+        if str(method_name).split('/')[-1] in EXEMPT_METHODS:
+            verdict = ADMIT
+        if verdict == ADMIT and deadline_passed(context):
+            self.admission.record(shed=True)
+            context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline passed while queued at the gateway")
+        if verdict != ADMIT:
+            self.admission.record(shed=True)
+            retry_after_ms = int(self.admission.retry_after() * 1000)
+            context.set_trailing_metadata((("retry-after-ms", str(retry_after_ms)),))
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                          f"Gateway overloaded, retry after {retry_after_ms}ms")
+        self.admission.record(shed=False)
+        return method(request, context)
@@ -0,0 +1,74 @@
+import collections
+import hmac
+import threading
+import time
+
+DEFAULT_TTL = 2.0  # seconds a bank's answer is served from the cache
+DEFAULT_MAX_ENTRIES = 10000
+FILL_WINDOW = 30.0  # how long an invalidation is remembered to reject answers asked for before it
+
+
+def _same_key(a, b):
+    return hmac.compare_digest(a.encode("utf-8"), b.encode("utf-8"))
+
+
+class BalanceCache:
+    """Read-through LRU cache of balances keyed by (bank_name, account number).
+
+    Only balances the bank actually returned are cached, together with the
+    account key that was accepted for them; a lookup with any other key is
+    a miss and goes to the bank, which checks it as usual. Payments
+    invalidate the accounts they touch, and an answer the bank gave to a
+    request sent before the latest invalidation of that account is not
+    stored.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # account -> (expires, key, balance)
+        self.invalidated = collections.OrderedDict()  # account -> time of its last invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bank_name, number, key):
+        """The cached balance, or None on a miss."""
+        account = (bank_name, number)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(account)
+            if entry is not None and entry[0] <= now:
+                del self.entries[account]
+                entry = None
+            if entry is None or not _same_key(entry[1], key):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(account)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, bank_name, number, key, balance, asked_at):
+        """Cache a balance the bank returned for a request sent at `asked_at` (time.monotonic())."""
+        account = (bank_name, number)
+        with self.lock:
+            if account in self.invalidated and self.invalidated[account] >= asked_at:
+                return
+            self.entries[account] = (asked_at + self.ttl, key, balance)
+            self.entries.move_to_end(account)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, accounts):
+        now = time.monotonic()
+        with self.lock:
+            for account in accounts:
+                self.entries.pop(account, None)
+                self.invalidated[account] = now
+                self.invalidated.move_to_end(account)
+            while self.invalidated and next(iter(self.invalidated.values())) < now - FILL_WINDOW:
+                self.invalidated.popitem(last=False)
+
+    def snapshot(self):
+        with self.lock:
+            return self.hits, self.misses
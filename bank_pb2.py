@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nbank.proto\"Y\n\x07\x41\x63\x63ount\x12\x0e\n\x06number\x18\x01 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x02 \x01(\x01\x12\r\n\x05owner\x18\x03 \x01(\t\x12\x11\n\tbank_name\x18\x04 \x01(\t\x12\x0b\n\x03key\x18\x05 \x01(\t\"\x88\x01\n\x0bTransaction\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05\x66rom_\x18\x02 \x01(\t\x12\x11\n\tfrom_bank\x18\x03 \x01(\t\x12\n\n\x02to\x18\x04 \x01(\t\x12\x0f\n\x07to_bank\x18\x05 \x01(\t\x12\x0b\n\x03key\x18\x06 \x01(\t\x12\x0e\n\x06\x61mount\x18\x07 \x01(\x01\x12\x11\n\ttimestamp\x18\x08 \x01(\x03\"%\n\x0fPrepareResponse\x12\x12\n\ncan_commit\x18\x01 \x01(\x08\"$\n\x11OperationResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"B\n\x0f\x42\x61lanceResponse\x12\x0f\n\x07\x62\x61lance\x18\x01 \x01(\x01\x12\r\n\x05\x65rror\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t2\xb9\x01\n\x0b\x42\x61nkService\x12)\n\x07Prepare\x12\x0c.Transaction\x1a\x10.PrepareResponse\x12*\n\x06\x43ommit\x12\x0c.Transaction\x1a\x12.OperationResponse\x12)\n\x05\x41\x62ort\x12\x0c.Transaction\x1a\x12.OperationResponse\x12(\n\nGetBalance\x12\x08.Account\x1a\x10.BalanceResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nbank.proto\"Y\n\x07\x41\x63\x63ount\x12\x0e\n\x06number\x18\x01 \x01(\t\x12\x0f\n\x07\x62\x61lance\x18\x02 \x01(\x01\x12\r\n\x05owner\x18\x03 \x01(\t\x12\x11\n\tbank_name\x18\x04 \x01(\t\x12\x0b\n\x03key\x18\x05 \x01(\t\"\x88\x01\n\x0bTransaction\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05\x66rom_\x18\x02 \x01(\t\x12\x11\n\tfrom_bank\x18\x03 \x01(\t\x12\n\n\x02to\x18\x04 \x01(\t\x12\x0f\n\x07to_bank\x18\x05 \x01(\t\x12\x0b\n\x03key\x18\x06 \x01(\t\x12\x0e\n\x06\x61mount\x18\x07 \x01(\x01\x12\x11\n\ttimestamp\x18\x08 \x01(\x03\"6\n\x10TransactionBatch\x12\"\n\x0ctransactions\x18\x01 \x03(\x0b\x32\x0c.Transaction\"%\n\x0fPrepareResponse\x12\x12\n\ncan_commit\x18\x01 \x01(\x08\"*\n\x14PrepareBatchResponse\x12\x12\n\ncan_commit\x18\x01 \x03(\x08\"$\n\x11OperationResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\")\n\x16\x42\x61tchOperationResponse\x12\x0f\n\x07success\x18\x01 \x03(\x08\"B\n\x0f\x42\x61lanceResponse\x12\x0f\n\x07\x62\x61lance\x18\x01 \x01(\x01\x12\r\n\x05\x65rror\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t2\xd3\x03\n\x0b\x42\x61nkService\x12)\n\x07Prepare\x12\x0c.Transaction\x1a\x10.PrepareResponse\x12*\n\x06\x43ommit\x12\x0c.Transaction\x1a\x12.OperationResponse\x12)\n\x05\x41\x62ort\x12\x0c.Transaction\x1a\x12.OperationResponse\x12(\n\nGetBalance\x12\x08.Account\x1a\x10.BalanceResponse\x12,\n\x08Transfer\x12\x0c.Transaction\x1a\x12.OperationResponse\x12\x38\n\x0cPrepareBatch\x12\x11.TransactionBatch\x1a\x15.PrepareBatchResponse\x12;\n\rTransferBatch\x12\x11.TransactionBatch\x1a\x17.BatchOperationResponse\x12\x39\n\x0b\x43ommitBatch\x12\x11.TransactionBatch\x1a\x17.BatchOperationResponse\x12\x38\n\nAbortBatch\x12\x11.TransactionBatch\x1a\x17.BatchOperationResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,12 +35,18 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_ACCOUNT']._serialized_end=103
   _globals['_TRANSACTION']._serialized_start=106
   _globals['_TRANSACTION']._serialized_end=242
-  _globals['_PREPARERESPONSE']._serialized_start=244
-  _globals['_PREPARERESPONSE']._serialized_end=281
-  _globals['_OPERATIONRESPONSE']._serialized_start=283
-  _globals['_OPERATIONRESPONSE']._serialized_end=319
-  _globals['_BALANCERESPONSE']._serialized_start=321
-  _globals['_BALANCERESPONSE']._serialized_end=387
-  _globals['_BANKSERVICE']._serialized_start=390
-  _globals['_BANKSERVICE']._serialized_end=575
+  _globals['_TRANSACTIONBATCH']._serialized_start=244
+  _globals['_TRANSACTIONBATCH']._serialized_end=298
+  _globals['_PREPARERESPONSE']._serialized_start=300
+  _globals['_PREPARERESPONSE']._serialized_end=337
+  _globals['_PREPAREBATCHRESPONSE']._serialized_start=339
+  _globals['_PREPAREBATCHRESPONSE']._serialized_end=381
+  _globals['_OPERATIONRESPONSE']._serialized_start=383
+  _globals['_OPERATIONRESPONSE']._serialized_end=419
+  _globals['_BATCHOPERATIONRESPONSE']._serialized_start=421
+  _globals['_BATCHOPERATIONRESPONSE']._serialized_end=462
+  _globals['_BALANCERESPONSE']._serialized_start=464
+  _globals['_BALANCERESPONSE']._serialized_end=530
+  _globals['_BANKSERVICE']._serialized_start=533
+  _globals['_BANKSERVICE']._serialized_end=1000
 # @@protoc_insertion_point(module_scope)
@@ -54,6 +54,31 @@ class BankServiceStub(object):
                 request_serializer=bank__pb2.Account.SerializeToString,
                 response_deserializer=bank__pb2.BalanceResponse.FromString,
                 _registered_method=True)
+        self.Transfer = channel.unary_unary(
+                '/BankService/Transfer',
+                request_serializer=bank__pb2.Transaction.SerializeToString,
+                response_deserializer=bank__pb2.OperationResponse.FromString,
+                _registered_method=True)
+        self.PrepareBatch = channel.unary_unary(
+                '/BankService/PrepareBatch',
+                request_serializer=bank__pb2.TransactionBatch.SerializeToString,
+                response_deserializer=bank__pb2.PrepareBatchResponse.FromString,
+                _registered_method=True)
+        self.TransferBatch = channel.unary_unary(
+                '/BankService/TransferBatch',
+                request_serializer=bank__pb2.TransactionBatch.SerializeToString,
+                response_deserializer=bank__pb2.BatchOperationResponse.FromString,
+                _registered_method=True)
+        self.CommitBatch = channel.unary_unary(
+                '/BankService/CommitBatch',
+                request_serializer=bank__pb2.TransactionBatch.SerializeToString,
+                response_deserializer=bank__pb2.BatchOperationResponse.FromString,
+                _registered_method=True)
+        self.AbortBatch = channel.unary_unary(
+                '/BankService/AbortBatch',
+                request_serializer=bank__pb2.TransactionBatch.SerializeToString,
+                response_deserializer=bank__pb2.BatchOperationResponse.FromString,
+                _registered_method=True)
 
 
 class BankServiceServicer(object):
@@ -83,6 +108,37 @@ class BankServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Transfer(self, request, context):
+        """both accounts at this bank, no 2PC
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PrepareBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def TransferBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CommitBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AbortBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_BankServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -106,6 +162,31 @@ def add_BankServiceServicer_to_server(servicer, server):
                     request_deserializer=bank__pb2.Account.FromString,
                     response_serializer=bank__pb2.BalanceResponse.SerializeToString,
             ),
+            'Transfer': grpc.unary_unary_rpc_method_handler(
+                    servicer.Transfer,
+                    request_deserializer=bank__pb2.Transaction.FromString,
+                    response_serializer=bank__pb2.OperationResponse.SerializeToString,
+            ),
+            'PrepareBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.PrepareBatch,
+                    request_deserializer=bank__pb2.TransactionBatch.FromString,
+                    response_serializer=bank__pb2.PrepareBatchResponse.SerializeToString,
+            ),
+            'TransferBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.TransferBatch,
+                    request_deserializer=bank__pb2.TransactionBatch.FromString,
+                    response_serializer=bank__pb2.BatchOperationResponse.SerializeToString,
+            ),
+            'CommitBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.CommitBatch,
+                    request_deserializer=bank__pb2.TransactionBatch.FromString,
+                    response_serializer=bank__pb2.BatchOperationResponse.SerializeToString,
+            ),
+            'AbortBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.AbortBatch,
+                    request_deserializer=bank__pb2.TransactionBatch.FromString,
+                    response_serializer=bank__pb2.BatchOperationResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'BankService', rpc_method_handlers)
@@ -224,3 +305,138 @@ class BankService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Transfer(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/BankService/Transfer',
+            bank__pb2.Transaction.SerializeToString,
+            bank__pb2.OperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PrepareBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/BankService/PrepareBatch',
+            bank__pb2.TransactionBatch.SerializeToString,
+            bank__pb2.PrepareBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def TransferBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/BankService/TransferBatch',
+            bank__pb2.TransactionBatch.SerializeToString,
+            bank__pb2.BatchOperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CommitBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/BankService/CommitBatch',
+            bank__pb2.TransactionBatch.SerializeToString,
+            bank__pb2.BatchOperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AbortBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/BankService/AbortBatch',
+            bank__pb2.TransactionBatch.SerializeToString,
+            bank__pb2.BatchOperationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
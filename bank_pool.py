@@ -0,0 +1,537 @@
+import asyncio
+import collections
+import contextlib
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+import grpc
+
+import auth_pb2_grpc
+import bank_pb2_grpc
+
+logger = logging.getLogger('GatewayServer')
+
+DEFAULT_SUBCHANNELS = 2
+WARMUP_TIMEOUT = 2.0
+RETIRE_AFTER = 60.0  # seconds replaced channels stay open for calls already using them
+
+# Reads that any replica of a bank can answer. Everything else, and all of
+# 2PC, goes to the bank's first (primary) endpoint, which holds the funds
+# a Prepare put on hold.
+READ_METHODS = ("GetBalance", "LoginAccount")
+EJECT_AFTER = 3  # consecutive failed calls that take an endpoint out of rotation
+EJECT_FOR = 5.0  # seconds of the first ejection; doubles on each repeat
+EJECT_MAX = 60.0
+# Errors that say the endpoint itself is unhealthy rather than the request.
+ENDPOINT_ERRORS = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+# Keep connections to the banks open between payments and come back quickly
+# after a bank restarts. Every sub-channel gets its own subchannel pool,
+# otherwise gRPC would collapse them onto a single TCP connection.
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.initial_reconnect_backoff_ms', 200),
+    ('grpc.min_reconnect_backoff_ms', 200),
+    ('grpc.max_reconnect_backoff_ms', 5000),
+    ('grpc.use_local_subchannel_pool', 1),
+]
+
+
+def bank_tls_paths(cert_dir, key_name="gateway"):
+    """(ca, cert, key) paths of the gateway's client certificate in `cert_dir`."""
+    return (os.path.join(cert_dir, "ca.crt"),
+            os.path.join(cert_dir, f"{key_name}.crt"),
+            os.path.join(cert_dir, f"{key_name}.key"))
+
+
+def load_tls_credentials(tls):
+    """mTLS credentials for talking to banks served on a secure port."""
+    ca, cert, key = tls
+    with open(key, 'rb') as f:
+        private_key = f.read()
+    with open(cert, 'rb') as f:
+        certificate_chain = f.read()
+    with open(ca, 'rb') as f:
+        root_certificates = f.read()
+    return grpc.ssl_channel_credentials(
+        root_certificates=root_certificates,
+        private_key=private_key,
+        certificate_chain=certificate_chain
+    )
+
+
+class BankConfig:
+    """How to reach one bank: its endpoints, mTLS files (None for plaintext) and limits."""
+
+    __slots__ = ("name", "endpoints", "tls", "subchannels", "timeout")
+
+    def __init__(self, name, endpoints, tls=None, subchannels=DEFAULT_SUBCHANNELS, timeout=None):
+        self.name = name
+        self.endpoints = list(endpoints)
+        self.tls = tuple(tls) if tls else None
+        self.subchannels = subchannels
+        self.timeout = timeout  # upper bound on any one call to this bank, in seconds
+
+    def _key(self):
+        return (self.name, tuple(self.endpoints), self.tls, self.subchannels, self.timeout)
+
+    def __eq__(self, other):
+        return isinstance(other, BankConfig) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def credentials(self):
+        return load_tls_credentials(self.tls) if self.tls else None
+
+
+def bank_configs(bank_to_ip, subchannels=DEFAULT_SUBCHANNELS, tls=None):
+    """BankConfig for every bank of a name -> address map, all with the same settings."""
+    return {
+        bank_name: BankConfig(bank_name, [address], tls, subchannels)
+        for bank_name, address in bank_to_ip.items()
+    }
+
+
+class Endpoint:
+    """One replica of a bank: calls outstanding to it and whether it is in rotation.
+
+    After EJECT_AFTER consecutive ENDPOINT_ERRORS it is ejected for
+    EJECT_FOR seconds, doubling up to EJECT_MAX each time it is ejected
+    again. Once the time is up it is re-admitted on trial: one failure
+    ejects it again, one success clears its record.
+    """
+
+    def __init__(self, bank_name, address):
+        self.bank_name = bank_name
+        self.address = address
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def available(self, now=None):
+        return (time.monotonic() if now is None else now) >= self.ejected_until
+
+    def begin(self):
+        with self.lock:
+            self.outstanding += 1
+
+    def end(self, error):
+        failed = isinstance(error, grpc.RpcError) and error.code() in ENDPOINT_ERRORS
+        now = time.monotonic()
+        with self.lock:
+            self.outstanding -= 1
+            if not failed:
+                if self.ejections and now >= self.ejected_until:
+                    logger.info(f"{self.bank_name} endpoint {self.address} is healthy again")
+                    self.ejections = 0
+                self.failures = 0
+                return
+            if now < self.ejected_until:
+                return  # a call that started before the ejection
+            self.failures += 1
+            if self.failures >= (1 if self.ejections else EJECT_AFTER):
+                eject_for = min(EJECT_MAX, EJECT_FOR * 2 ** self.ejections)
+                logger.warning(f"Ejecting {self.bank_name} endpoint {self.address} for {eject_for:.0f}s")
+                self.ejections += 1
+                self.ejected_until = now + eject_for
+                self.failures = 0
+
+
+def choose_endpoint(endpoints):
+    """Power of two choices: of two random endpoints in rotation, the one with fewer calls outstanding.
+
+    If every endpoint is ejected the primary is used, so the bank is still
+    tried rather than failed outright.
+    """
+    now = time.monotonic()
+    candidates = [endpoint for endpoint in endpoints if endpoint.available(now)]
+    if not candidates:
+        return endpoints[0]
+    if len(candidates) == 1:
+        return candidates[0]
+    first, second = random.sample(candidates, 2)
+    return first if first.outstanding <= second.outstanding else second
+
+
+class SubChannel:
+    """One long-lived channel to a bank endpoint, with its Bank and Auth stubs."""
+
+    def __init__(self, address, credentials=None, endpoint=None):
+        self.address = address
+        self.credentials = credentials
+        self.endpoint = endpoint
+        self.state = grpc.ChannelConnectivity.IDLE
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        if self.credentials is not None:
+            self.channel = grpc.secure_channel(self.address, self.credentials, options=CHANNEL_OPTIONS)
+        else:
+            self.channel = grpc.insecure_channel(self.address, options=CHANNEL_OPTIONS)
+        self.bank = bank_pb2_grpc.BankServiceStub(self.channel)
+        self.auth = auth_pb2_grpc.AuthServiceStub(self.channel)
+        self.channel.subscribe(self._on_state_change, try_to_connect=True)
+
+    def _on_state_change(self, state):
+        self.state = state
+
+    def ready(self):
+        return self.state == grpc.ChannelConnectivity.READY
+
+    def reconnect(self):
+        with self._lock:
+            old = self.channel
+            self.state = grpc.ChannelConnectivity.IDLE
+            self._connect()
+        old.unsubscribe(self._on_state_change)
+        old.close()
+
+    def ready_future(self):
+        return grpc.channel_ready_future(self.channel)
+
+    def close(self):
+        self.channel.unsubscribe(self._on_state_change)
+        self.channel.close()
+
+
+class BankChannels:
+    """Sub-channels to every endpoint of one bank.
+
+    Reads are balanced over the endpoints with choose_endpoint(); other
+    calls go to the primary. Within an endpoint sub-channels are used
+    round-robin.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.bank_name = config.name
+        credentials = config.credentials()
+        self.endpoints = [Endpoint(config.name, address) for address in config.endpoints]
+        self.by_endpoint = {
+            endpoint: [SubChannel(endpoint.address, credentials, endpoint)
+                       for _ in range(max(1, config.subchannels))]
+            for endpoint in self.endpoints
+        }
+        self.subchannels = [sub for subs in self.by_endpoint.values() for sub in subs]
+        self._next = itertools.count()
+
+    def get(self, read=False):
+        endpoint = choose_endpoint(self.endpoints) if read else self.endpoints[0]
+        # Prefer a connected sub-channel; if none is up yet hand out the next
+        # one anyway and let gRPC report UNAVAILABLE to the caller.
+        subchannels = self.by_endpoint[endpoint]
+        size = len(subchannels)
+        start = next(self._next)
+        for i in range(size):
+            sub = subchannels[(start + i) % size]
+            if sub.ready():
+                return sub
+        return subchannels[start % size]
+
+    def report_failure(self, sub):
+        # A dropped connection sits in reconnect backoff; replace it so the
+        # next call does not have to wait for the backoff timer.
+        if sub.state in (grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+                         grpc.ChannelConnectivity.SHUTDOWN):
+            logger.warning(f"Reconnecting channel to {self.bank_name} at {sub.address}")
+            sub.reconnect()
+
+    def close(self):
+        for sub in self.subchannels:
+            sub.close()
+
+
+def cap_timeout(config, timeout):
+    if config.timeout is None:
+        return timeout
+    return config.timeout if timeout is None else min(timeout, config.timeout)
+
+
+def plan_reload(current, configs, build):
+    """Work out a routing change: the new name -> channels map and the channels it retires.
+
+    Banks whose config is unchanged keep their channels, so payments in
+    flight to them are not disturbed.
+    """
+    banks, fresh, retired = {}, [], []
+    for bank_name, config in configs.items():
+        channels = current.get(bank_name)
+        if channels is not None and channels.config == config:
+            banks[bank_name] = channels
+            continue
+        banks[bank_name] = build(config)
+        fresh.append(banks[bank_name])
+        if channels is not None:
+            retired.append(channels)
+    retired.extend(channels for bank_name, channels in current.items() if bank_name not in configs)
+    return banks, fresh, retired
+
+
+class Draining:
+    """Channels of banks a reload removed while payments were still using them.
+
+    A payment pins its banks for as long as it runs. A removed bank that
+    is still pinned is kept here rather than retired, so the Commit or
+    Abort still to be sent finds its channels; the last unpin hands them
+    back to be retired.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pins = collections.Counter()
+        self.banks = {}
+
+    def pin(self, bank_names):
+        with self.lock:
+            self.pins.update(bank_names)
+
+    def unpin(self, bank_names):
+        """Drop a pin; returns the channels of removed banks no payment uses any more."""
+        with self.lock:
+            self.pins.subtract(bank_names)
+            done = [bank_name for bank_name in set(bank_names) if self.pins[bank_name] <= 0]
+            for bank_name in done:
+                del self.pins[bank_name]
+            return [self.banks.pop(bank_name) for bank_name in done if bank_name in self.banks]
+
+    def hold(self, current, configs, retired):
+        """Keep pinned banks of `current` that are not in `configs`; returns the rest of `retired`."""
+        # Caller holds self.lock while it also swaps in the new map, so a
+        # payment pins its banks either before (and is kept) or after (and
+        # finds them gone).
+        for bank_name, channels in current.items():
+            if bank_name not in configs and self.pins[bank_name] > 0:
+                self.banks[bank_name] = channels
+        held = set(map(id, self.banks.values()))
+        return [channels for channels in retired if id(channels) not in held]
+
+    def get(self, banks, bank_name):
+        channels = banks.get(bank_name)
+        return channels if channels is not None else self.banks[bank_name]
+
+
+class BankChannelPool:
+    """Pre-warmed channels from the gateway to every bank.
+
+    reload() swaps in a new set of banks with a single assignment: channels
+    for new or changed banks are connected first, and the ones they
+    replace are closed only after RETIRE_AFTER, once calls already using
+    them are done.
+    """
+
+    def __init__(self, configs):
+        self.banks = {bank_name: BankChannels(config) for bank_name, config in configs.items()}
+        self.draining = Draining()
+        self.reload_lock = threading.Lock()
+
+    def __contains__(self, bank_name):
+        return bank_name in self.banks
+
+    def get(self, bank_name):
+        """A sub-channel to the bank's primary, for calls that are not tracked with acquire()."""
+        return self.draining.get(self.banks, bank_name).get()
+
+    def acquire(self, bank_name, read=False):
+        """A sub-channel for one call, counted against its endpoint until release()."""
+        sub = self.draining.get(self.banks, bank_name).get(read)
+        sub.endpoint.begin()
+        return sub
+
+    def release(self, bank_name, sub, error=None):
+        sub.endpoint.end(error)
+        if isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.UNAVAILABLE:
+            channels = self.banks.get(bank_name)
+            if channels is not None:
+                channels.report_failure(sub)
+
+    def timeout(self, bank_name, timeout):
+        return cap_timeout(self.draining.get(self.banks, bank_name).config, timeout)
+
+    @contextlib.contextmanager
+    def pinned(self, bank_names):
+        """Keep these banks' channels reachable by name until the block ends, even across a reload."""
+        self.pin(bank_names)
+        try:
+            yield
+        finally:
+            self.unpin(bank_names)
+
+    def pin(self, bank_names):
+        self.draining.pin(bank_names)
+
+    def unpin(self, bank_names):
+        self._retire(self.draining.unpin(bank_names))
+
+    def reload(self, configs, timeout=WARMUP_TIMEOUT):
+        with self.reload_lock:
+            banks, fresh, retired = plan_reload(self.banks, configs, BankChannels)
+            self._warm(fresh, timeout)
+            with self.draining.lock:
+                retired = self.draining.hold(self.banks, configs, retired)
+                self.banks = banks
+        self._retire(retired)
+        return fresh, retired
+
+    def _retire(self, retired):
+        if retired:
+            timer = threading.Timer(RETIRE_AFTER, lambda: [channels.close() for channels in retired])
+            timer.daemon = True
+            timer.start()
+
+    def warm_up(self, timeout=WARMUP_TIMEOUT):
+        self._warm(self.banks.values(), timeout)
+
+    def _warm(self, banks, timeout):
+        # Connect all sub-channels at once and wait for them together, so a
+        # bank that is down costs one timeout rather than one per channel.
+        pending = [
+            (channels, sub.ready_future())
+            for channels in banks
+            for sub in channels.subchannels
+        ]
+        deadline = time.monotonic() + timeout
+        not_ready = {}
+        for channels, future in pending:
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except grpc.FutureTimeoutError:
+                future.cancel()
+                not_ready[channels.bank_name] = not_ready.get(channels.bank_name, 0) + 1
+        for bank_name, count in not_ready.items():
+            logger.warning(f"{bank_name}: {count} channel(s) not ready")
+
+    def close(self):
+        for channels in self.banks.values():
+            channels.close()
+
+
+class AsyncSubChannel:
+    """grpc.aio channel to one bank endpoint, with its Bank and Auth stubs."""
+
+    def __init__(self, address, credentials, endpoint):
+        self.address = address
+        self.endpoint = endpoint
+        if credentials is not None:
+            self.channel = grpc.aio.secure_channel(address, credentials, options=CHANNEL_OPTIONS)
+        else:
+            self.channel = grpc.aio.insecure_channel(address, options=CHANNEL_OPTIONS)
+        self.bank = bank_pb2_grpc.BankServiceStub(self.channel)
+        self.auth = auth_pb2_grpc.AuthServiceStub(self.channel)
+
+
+class AsyncBankChannels:
+    """grpc.aio channels to every endpoint of one bank, chosen as in BankChannels."""
+
+    def __init__(self, config):
+        self.config = config
+        self.bank_name = config.name
+        credentials = config.credentials()
+        self.endpoints = [Endpoint(config.name, address) for address in config.endpoints]
+        self.by_endpoint = {
+            endpoint: [AsyncSubChannel(endpoint.address, credentials, endpoint)
+                       for _ in range(max(1, config.subchannels))]
+            for endpoint in self.endpoints
+        }
+        self.channels = [sub for subs in self.by_endpoint.values() for sub in subs]
+        self._next = itertools.count()
+
+    def pick(self, read=False):
+        endpoint = choose_endpoint(self.endpoints) if read else self.endpoints[0]
+        subchannels = self.by_endpoint[endpoint]
+        return subchannels[next(self._next) % len(subchannels)]
+
+    async def close(self):
+        for sub in self.channels:
+            await sub.channel.close()
+
+
+class AsyncBankChannelPool:
+    """grpc.aio counterpart of BankChannelPool for the asyncio gateway."""
+
+    def __init__(self, configs):
+        self.banks = {bank_name: AsyncBankChannels(config) for bank_name, config in configs.items()}
+        self.draining = Draining()
+
+    def __contains__(self, bank_name):
+        return bank_name in self.banks
+
+    def bank(self, bank_name):
+        return self.draining.get(self.banks, bank_name).pick().bank
+
+    def auth(self, bank_name):
+        return self.draining.get(self.banks, bank_name).pick().auth
+
+    def acquire(self, bank_name, read=False):
+        sub = self.draining.get(self.banks, bank_name).pick(read)
+        sub.endpoint.begin()
+        return sub
+
+    def release(self, bank_name, sub, error=None):
+        sub.endpoint.end(error)
+
+    def timeout(self, bank_name, timeout):
+        return cap_timeout(self.draining.get(self.banks, bank_name).config, timeout)
+
+    @contextlib.contextmanager
+    def pinned(self, bank_names):
+        """As BankChannelPool.pinned; the block may await."""
+        self.pin(bank_names)
+        try:
+            yield
+        finally:
+            self.unpin(bank_names)
+
+    def pin(self, bank_names):
+        self.draining.pin(bank_names)
+
+    def unpin(self, bank_names):
+        self._retire(self.draining.unpin(bank_names))
+
+    async def reload(self, configs, timeout=WARMUP_TIMEOUT):
+        # Runs on the event loop, so nothing can observe a half-built map.
+        banks, fresh, retired = plan_reload(self.banks, configs, AsyncBankChannels)
+        await self._warm(fresh, timeout)
+        with self.draining.lock:
+            retired = self.draining.hold(self.banks, configs, retired)
+            self.banks = banks
+        self._retire(retired)
+        return fresh, retired
+
+    def _retire(self, retired):
+        if retired:
+            async def close_later():
+                await asyncio.sleep(RETIRE_AFTER)
+                for channels in retired:
+                    await channels.close()
+            asyncio.ensure_future(close_later())
+
+    async def warm_up(self, timeout=WARMUP_TIMEOUT):
+        await self._warm(self.banks.values(), timeout)
+
+    async def _warm(self, banks, timeout):
+        async def ready(bank_name, channel):
+            try:
+                await asyncio.wait_for(channel.channel_ready(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{bank_name}: channel not ready")
+
+        await asyncio.gather(*(
+            ready(channels.bank_name, sub.channel)
+            for channels in banks
+            for sub in channels.channels
+        ))
+
+    async def close(self):
+        for channels in self.banks.values():
+            await channels.close()
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import signal
+import threading
+
+from bank_pool import BankConfig, DEFAULT_SUBCHANNELS
+
+logger = logging.getLogger('GatewayServer')
+
+DEFAULT_CONFIG = "banks.json"
+POLL_INTERVAL = 2.0  # seconds between checks of the config file's mtime
+
+
+def load_bank_config(path, default_tls=None, default_subchannels=DEFAULT_SUBCHANNELS):
+    """Parse a bank registry file into {bank_name: BankConfig}.
+
+    The file holds {"banks": [...]}, one object per bank:
+
+        {"name": "bank_a",
+         "endpoints": ["localhost:50055"],
+         "tls": {"ca": "certs/ca.crt", "cert": "certs/gateway.crt", "key": "certs/gateway.key"},
+         "limits": {"subchannels": 2, "timeout": 10.0}}
+
+    "tls" and "limits" are optional; a bank without them uses `default_tls`
+    and `default_subchannels`.
+    Raises ValueError if the file is not a valid registry.
+    """
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    configs = {}
+    for entry in document.get("banks", []):
+        name = entry.get("name")
+        endpoints = entry.get("endpoints")
+        if not name or not endpoints:
+            raise ValueError(f"{path}: every bank needs a name and at least one endpoint")
+        if name in configs:
+            raise ValueError(f"{path}: bank {name} is listed twice")
+        tls = entry.get("tls")
+        if tls is not None:
+            tls = (tls["ca"], tls["cert"], tls["key"])
+            for file in tls:
+                if not os.path.exists(file):
+                    raise ValueError(f"{path}: {name}: {file} does not exist")
+        limits = entry.get("limits", {})
+        configs[name] = BankConfig(
+            name, endpoints, tls or default_tls,
+            subchannels=int(limits.get("subchannels", default_subchannels)),
+            timeout=limits.get("timeout"),
+        )
+    if not configs:
+        raise ValueError(f"{path}: no banks configured")
+    return configs
+
+
+class BankRegistry:
+    """Re-reads the bank registry file when it changes or on SIGHUP.
+
+    Each successfully parsed version is handed to `apply`. A file that
+    fails to parse is logged and ignored, leaving the current routing in
+    place.
+    """
+
+    def __init__(self, path, apply, default_tls=None, default_subchannels=DEFAULT_SUBCHANNELS):
+        self.path = path
+        self.apply = apply
+        self.default_tls = default_tls
+        self.default_subchannels = default_subchannels
+        self.lock = threading.Lock()
+        self.mtime = self._mtime()
+        self.stopped = threading.Event()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        return load_bank_config(self.path, self.default_tls, self.default_subchannels)
+
+    def reload(self):
+        with self.lock:
+            self.mtime = self._mtime()
+            try:
+                configs = self.load()
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Keeping current banks, could not load {self.path}: {e}")
+                return False
+            self.apply(configs)
+            logger.info(f"Bank registry reloaded from {self.path}: {', '.join(sorted(configs))}")
+            return True
+
+    def watch(self, interval=POLL_INTERVAL):
+        def poll():
+            while not self.stopped.wait(interval):
+                if self._mtime() != self.mtime:
+                    self.reload()
+
+        threading.Thread(target=poll, name="bank-registry", daemon=True).start()
+
+    def reload_on_sighup(self):
+        # The handler runs in the main thread between bytecodes; do the
+        # reload (which connects to banks) elsewhere.
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+                target=self.reload, daemon=True).start())
+
+    def stop(self):
+        self.stopped.set()
@@ -1,12 +1,11 @@
 import grpc
 from concurrent import futures
-import sys
+import argparse
 
 import bank_pb2 
 import bank_pb2_grpc 
 
 import uuid
-import hashlib
 
 import os
 
@@ -15,45 +14,60 @@ import json
 import auth_pb2
 import auth_pb2_grpc
 
-from threading import Lock
-
 from cryptography.fernet import Fernet
 
 import logging
 
-import base64
-
 from grpc_interceptor import ServerInterceptor
 
+from credentials import HasherBusy, PasswordHasher
+from storage import STORES, open_store
+from deadlines import deadline_passed
+from metrics import Counter, Gauge, Histogram, MetricsInterceptor, start_http_server
+import tracing
+
+
+# The gateway keeps pooled channels open and pings them while idle.
+SERVER_OPTIONS = [
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_recv_ping_interval_without_data_ms', 10000),
+    ('grpc.http2.max_ping_strikes', 0),
+]
+
+
+RPC_LATENCY = Histogram("bank_rpc_seconds", "Time to serve a bank RPC", ["method"])
+RPC_ERRORS = Counter("bank_rpc_errors_total", "Bank RPCs that ended with an error status", ["method", "code"])
+COMMITS = Counter("bank_commits_total", "Prepared transactions committed", ["bank"])
+ABORTS = Counter("bank_aborts_total", "Prepared transactions aborted", ["bank"])
+PREPARE_NO_VOTES = Counter("bank_prepare_no_votes_total", "Prepare requests answered NO", ["bank"])
+
+
+def stop_if_expired(context):
+    # Called once the locks are held, since waiting for them is where a request
+    # stalls. A caller that has given up will not read the answer, and a
+    # Prepare applied now would hold funds nobody is waiting on. Commit and
+    # Abort are always applied: they settle a decision already made.
+    if deadline_passed(context):
+        context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline passed before the request was served")
+
+
+def txn_locks(locks, request):
+    """The locks a payment message needs: both accounts and the transaction ID."""
+    return locks.hold(request.id, request.from_, request.to)
+
 
 class BankService(bank_pb2_grpc.BankServiceServicer):
-    def __init__(self,bank_name,all_accounts,lock):
+    def __init__(self,bank_name,store):
         self.bank_name=bank_name
-        self.accounts=all_accounts
-        self.prepared_transaction={}
-        self.lock=lock
+        # Accounts and prepared transactions live in the store (storage.py);
+        # this class serves them, under the store's account locks.
+        self.store=store
+        self.locks=store.locks
 
-    def register_account(self, username, password, initial_amount):
-        # Generate a unique account number
-        account_number = str(uuid.uuid4())
-        # Generate the encryption key
-        key = generate_key(username, password)
-        # Store account details
-        self.accounts[account_number] = {
-            'username': username,
-            'password': password,  # Note: In a real system, store a hash
-            'balance': initial_amount,
-            'key': key
-        }
-        return account_number
-
-    def login_account(self):
-        pass
     def GetBalance(self, request, context):
-        print("RAN")
-        print(self.accounts)
-        with self.lock:
-            account = self.accounts.get(request.number)
+        with self.locks.hold(request.number):
+            stop_if_expired(context)
+            account = self.store.account(request.number)
             if not account:
                 return bank_pb2.BalanceResponse(error=True, message="Account not found")
             if account['key'] != request.key:  # Compare keys as strings
@@ -61,123 +75,158 @@ class BankService(bank_pb2_grpc.BankServiceServicer):
             return bank_pb2.BalanceResponse(balance=account['balance'], error=False)
 
     def Prepare(self,request,context):
-        print("Prepare started")
-        with self.lock:
-            #sender
-            if request.id in self.prepared_transaction:
-                print(f"{self.bank_name}: Duplicate transaction ID {request.id} found")
-                return bank_pb2.PrepareResponse(can_commit=False)  # Reject duplicate
-            print(request.from_)
-            print(self.accounts)
-            is_sender = request.from_bank == self.bank_name and request.from_ in self.accounts
-            is_recipient = request.to_bank == self.bank_name and request.to in self.accounts
-            print("BANK:",request.from_bank,self.bank_name)
-            print("So, is this a sender:",is_sender)
-            if not is_sender and not is_recipient:
-                print(f"{self.bank_name} No relevant account")
-                return bank_pb2.PrepareResponse(can_commit=False)
-
-            if is_sender:
-                print("It is the sender")
-                if self.accounts[request.from_]["balance"]<request.amount:
-                    print("Insufficient funds")
-                    return bank_pb2.PrepareResponse(can_commit=False)
-                else:
-                    self.accounts[request.from_]["balance"]-=request.amount
-                    self.prepared_transaction[request.id]=request
-                    self.prepared_transaction[request.id] = {'role': 'sender', 'amount': request.amount}
-                    print(f"{self.bank_name} PREPARED as sender")
-                    # return bank_pb2.PrepareResponse(can_commit=True)
-            #receiver
-            if is_recipient:
-                print("It is the receiver")
-                self.prepared_transaction[request.id] = {'role': 'recipient', 'amount': request.amount}
-                print(f"{self.bank_name} PREPARED as recipient")
-            return bank_pb2.PrepareResponse(can_commit=True)
-            # else:
-            #     print(f"{self.bank_name} No relevant account")
-            #     return bank_pb2.PrepareResponse(can_commit=False)
+        with txn_locks(self.locks, request):
+            stop_if_expired(context)
+            return bank_pb2.PrepareResponse(can_commit=self._vote(request))
+
+    def PrepareBatch(self, request, context):
+        stop_if_expired(context)
+        return bank_pb2.PrepareBatchResponse(
+            can_commit=[self._locked(self._vote, txn) for txn in request.transactions])
+
+    def Transfer(self, request, context):
+        # Debit and credit in one step for payments that stay inside this bank.
+        with txn_locks(self.locks, request):
+            stop_if_expired(context)
+            return bank_pb2.OperationResponse(success=self._transfer(request))
+
+    def TransferBatch(self, request, context):
+        stop_if_expired(context)
+        return bank_pb2.BatchOperationResponse(
+            success=[self._locked(self._transfer, txn) for txn in request.transactions])
 
+    def _locked(self, operation, request):
+        # Batches lock one transaction at a time, so a long batch does not
+        # hold up payments on other accounts.
+        with txn_locks(self.locks, request):
+            return operation(request)
+
+    def _vote(self, request):
+        can_commit = self._prepare(request)
+        if not can_commit:
+            PREPARE_NO_VOTES.inc(self.bank_name)
+        return can_commit
+
+    def _prepare(self, request):
+        # Caller holds txn_locks(self.locks, request).
+        return self.store.prepare(request)
+
+    def _transfer(self, request):
+        # Caller holds txn_locks(self.locks, request).
+        return self.store.transfer(request)
 
     def Commit(self, request, context):
-        with self.lock:
-            if request.id in self.prepared_transaction:
-                role = self.prepared_transaction[request.id]['role']
-                if role == 'recipient':
-                    self.accounts[request.to]["balance"] += self.prepared_transaction[request.id]['amount']
-                    print(f"{self.bank_name} COMMITTED as recipient")
-                # Sender already deducted funds in Prepare, so no action needed
-                del self.prepared_transaction[request.id]
-                return bank_pb2.OperationResponse(success=True)
-            print(f"{self.bank_name} Commit failed: no prepared transaction")
-            return bank_pb2.OperationResponse(success=False)
+        with txn_locks(self.locks, request):
+            return bank_pb2.OperationResponse(success=self._commit(request))
 
     def Abort(self, request, context):
-        with self.lock:
-            if request.id in self.prepared_transaction:
-                role = self.prepared_transaction[request.id]['role']
-                if role == 'sender':
-                    self.accounts[request.from_]["balance"] += self.prepared_transaction[request.id]['amount']
-                    print(f"{self.bank_name} ABORTED as sender")
-                # Recipient didn’t add funds yet, so no action needed
-                del self.prepared_transaction[request.id]
-                return bank_pb2.OperationResponse(success=True)
-            print(f"{self.bank_name} Abort failed: no prepared transaction")
-            return bank_pb2.OperationResponse(success=False)
+        with txn_locks(self.locks, request):
+            return bank_pb2.OperationResponse(success=self._abort(request))
+
+    def CommitBatch(self, request, context):
+        return bank_pb2.BatchOperationResponse(
+            success=[self._locked(self._commit, txn) for txn in request.transactions])
+
+    def AbortBatch(self, request, context):
+        return bank_pb2.BatchOperationResponse(
+            success=[self._locked(self._abort, txn) for txn in request.transactions])
+
+    def _commit(self, request):
+        # Caller holds txn_locks(self.locks, request).
+        committed = self.store.commit(request)
+        if committed:
+            COMMITS.inc(self.bank_name)
+        return committed
+
+    def _abort(self, request):
+        # Caller holds txn_locks(self.locks, request).
+        aborted = self.store.abort(request)
+        if aborted:
+            ABORTS.inc(self.bank_name)
+        return aborted
 
 
 class AuthService(auth_pb2_grpc.AuthServiceServicer):
-    def __init__(self, accounts,bank_name,all_accounts, lock):
-        self.accounts = all_accounts
-        self.lock = lock
+    def __init__(self, bank_name, store, hasher=None):
         self.bank_name=bank_name
-        # self.accounts = {}
-        self.usernames=set()
+        self.store = store
+        # Passwords are hashed with scrypt in a process pool; inline without one.
+        self.hasher = hasher or PasswordHasher(workers=0)
 
     def RegisterAccount(self, request, context):
-        with self.lock:
-            if request.username in self.usernames:
-                return auth_pb2.RegisterResponse(
-                    account_number="",
-                    success=False,
-                    message=f"Username '{request.username}' is already registered in {self.bank_name}"
-                )
-            # Generate a unique account number
-            account_number = str(uuid.uuid4())
-            # Derive encryption key from username and password
-            combined = request.username + request.password
-            key = hashlib.sha256(combined.encode()).digest()[:32]  # 32 bytes for Fernet
-            fernet_key = base64.urlsafe_b64encode(key)  # Fernet requires base64-encoded key
-            # Store account details
-            
-            self.accounts[account_number] = {
-                'username': request.username,
-                'password': request.password,  # In practice, store a hash instead
-                'balance': request.initial_amount,
-                'key': fernet_key.decode()  # Encryption key for future use
-            }
-            self.usernames.add(request.username)
-            return auth_pb2.RegisterResponse(
-                account_number=account_number,
-                message="Account registered successfully",
-                success=True
-            )
+        if self.store.has_username(request.username):
+            return self._username_taken(request)
+        # Hashed before the store is touched: registrations only queue on
+        # each other for the moment it takes to add the account.
+        password_hash = self._hashing(context, self.hasher.hash, request.password)
+        stop_if_expired(context)
+        # Generate a unique account number
+        account_number = str(uuid.uuid4())
+        # Store account details; the store refuses a username taken since the check above.
+        added = self.store.add_account(account_number, {
+            'username': request.username,
+            'password_hash': password_hash,
+            'balance': request.initial_amount,
+            'key': new_key()  # Encryption key for future use
+        })
+        if not added:
+            return self._username_taken(request)
+        return auth_pb2.RegisterResponse(
+            account_number=account_number,
+            message="Account registered successfully",
+            success=True
+        )
+
+    def _username_taken(self, request):
+        return auth_pb2.RegisterResponse(
+            account_number="",
+            success=False,
+            message=f"Username '{request.username}' is already registered in {self.bank_name}"
+        )
+
+    def _hashing(self, context, operation, *args):
+        # The handler thread waits on the hashing pool without holding the GIL.
+        stop_if_expired(context)
+        try:
+            return operation(*args)
+        except HasherBusy as e:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
 
     def LoginAccount(self,request,context):
-        with self.lock:
-            if request.bank_name != self.bank_name:
-                return auth_pb2.LoginResponse(message="Invalid bank name")
-            for account_number, account in self.accounts.items():
-                if account['username'] == request.username and account['password'] == request.password:
-                    return auth_pb2.LoginResponse(
-                        account_number=account_number,
-                        key=account['key'],
-                        message="Login successful"
-                    )
+        # A lookup by username: the in-memory store's index, or the unique
+        # index on username in SQLite.
+        stop_if_expired(context)
+        if request.bank_name != self.bank_name:
+            return auth_pb2.LoginResponse(message="Invalid bank name")
+        account_number, account = self.store.find_username(request.username)
+        if account is None or not self._hashing(
+                context, self.hasher.verify, request.username, account['password_hash'], request.password):
             return auth_pb2.LoginResponse(message="Invalid credentials")
+        return auth_pb2.LoginResponse(
+            account_number=account_number,
+            key=account['key'],
+            message="Login successful"
+        )
+
+def new_key():
+    """A random Fernet key for a new account; it no longer depends on the password."""
+    return Fernet.generate_key().decode()
 
-def serve(port,bank_name):
-    server=grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def serve_metrics(port, bank_service):
+    """Serve this bank's metrics on 127.0.0.1:port/metrics, including how many transactions it holds prepared."""
+    Gauge("bank_prepared_transactions", "Transactions prepared and waiting for Commit or Abort", ["bank"],
+          read=lambda: {(bank_service.bank_name,): bank_service.store.prepared_count()})
+    return start_http_server(port)
+
+def tracing_interceptor(bank_name):
+    """Adds this bank's spans to traces started by the gateway; untraced calls cost a metadata lookup."""
+    tracer = tracing.Tracer(bank_name, tracing.JsonlExporter(os.path.join("data", f"{bank_name}.trace.jsonl")))
+    return tracing.TracingInterceptor(tracer)
+
+def serve(port,bank_name,metrics_port=0,store="memory"):
+    server=grpc.server(futures.ThreadPoolExecutor(max_workers=10),
+                       interceptors=[MetricsInterceptor(RPC_LATENCY, RPC_ERRORS), tracing_interceptor(bank_name)],
+                       options=SERVER_OPTIONS)
 
     cert_dir = os.path.join(os.getcwd(), "certs")
     with open(os.path.join(cert_dir, f"{bank_name}.key"), 'rb') as f:
@@ -194,13 +243,15 @@ def serve(port,bank_name):
         require_client_auth=True
     )
     
-    lock=Lock()
-    all_accounts = {
-        # "bank_a": {"acc-123": 1000.0, "acc-456": 500.0},
-        # "bank_b": {"acc-123": 2000.0, "acc-456": 1500.0}
-    }
-    bank_pb2_grpc.add_BankServiceServicer_to_server(BankService(bank_name,all_accounts,lock),server)
-    auth_pb2_grpc.add_AuthServiceServicer_to_server(AuthService(all_accounts,bank_name,all_accounts, lock), server)
+    # In memory: data/<bank_name>.json and the log written since. SQLite: data/<bank_name>.db.
+    store = open_store(store, bank_name)
+    bank_service = BankService(bank_name,store)
+    bank_pb2_grpc.add_BankServiceServicer_to_server(bank_service,server)
+    hasher = PasswordHasher()
+    hasher.start()
+    auth_pb2_grpc.add_AuthServiceServicer_to_server(AuthService(bank_name, store, hasher), server)
+    if metrics_port:
+        serve_metrics(metrics_port, bank_service)
     # server.add_secure_port(f'[::]:{port}',server_credentials)
     # print(f"Bank server {bank_name} working on port {port} with SSL/TLS")
     
@@ -210,12 +261,21 @@ def serve(port,bank_name):
     server.wait_for_termination()
 
 
+def parse_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("port")
+    parser.add_argument("bank_name")
+    parser.add_argument("metrics_port", type=int, nargs="?", default=0,
+                        help="serve Prometheus metrics on 127.0.0.1:METRICS_PORT")
+    parser.add_argument("--store", choices=STORES, default="memory",
+                        help="keep accounts in memory with a write-ahead log and snapshots (default), "
+                             "or in an SQLite database, data/<bank_name>.db")
+    return parser.parse_args()
+
 if __name__=="__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python bank_server.py <port> <bank_name>")
-        sys.exit(1)
-    port = sys.argv[1]
-    bank_name=sys.argv[2]
+    args = parse_args("Bank server")
+    port = args.port
+    bank_name = args.bank_name
 
     logging.basicConfig(
     level=logging.INFO,
@@ -225,4 +285,4 @@ if __name__=="__main__":
 
     logger = logging.getLogger('GatewayServer')
     
-    serve(port,bank_name)
\ No newline at end of file
+    serve(port,bank_name,args.metrics_port,args.store)
\ No newline at end of file
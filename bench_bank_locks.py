@@ -0,0 +1,104 @@
+"""BankService throughput with one lock for every account versus striped per-account locks.
+
+Calls the BankService handlers directly from a pool of threads: each
+operation is a cross-bank Prepare and Commit, or an in-bank Transfer,
+between random accounts. A single stripe behaves like the old global lock.
+--hold-ms adds time spent inside the lock, such as a durable write, where
+striping matters most since CPython runs one thread's bytecode at a time.
+
+    python bench_bank_locks.py --accounts 10000 --ops 20000 --workers 1 2 4 8 16 --hold-ms 0 0.5
+"""
+import argparse
+import random
+import time
+import uuid
+from concurrent import futures
+
+import bank_pb2
+from account_locks import AccountLocks, STRIPES
+from bank_server import BankService, new_key
+from credentials import hash_password
+from storage import MemoryStore
+
+BANK = "bank_a"
+OTHER_BANK = "bank_b"
+
+
+class _Context:
+    def time_remaining(self):
+        return None
+
+
+class HoldingBankService(BankService):
+    """BankService that spends `hold` seconds in each operation while holding its locks."""
+
+    hold = 0.0
+
+    def _prepare(self, request):
+        time.sleep(self.hold)
+        return super()._prepare(request)
+
+    def _commit(self, request):
+        time.sleep(self.hold)
+        return super()._commit(request)
+
+    def _transfer(self, request):
+        time.sleep(self.hold)
+        return super()._transfer(request)
+
+
+def make_bank(stripes, accounts, hold):
+    service = HoldingBankService(BANK, MemoryStore(BANK, AccountLocks(stripes)))
+    service.hold = hold
+    # One password hash for every account: scrypt per account would take minutes.
+    password_hash = hash_password("pw")
+    numbers = [str(uuid.uuid4()) for _ in range(accounts)]
+    for i, number in enumerate(numbers):
+        service.store.accounts[number] = {'username': f"user{i}", 'password_hash': password_hash,
+                                          'balance': 1e9, 'key': new_key()}
+    return service, numbers
+
+
+def payment(service, numbers, context):
+    from_, to = random.sample(numbers, 2)
+    if random.random() < 0.5:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=OTHER_BANK, amount=1.0)
+        service.Prepare(txn, context)
+        service.Commit(txn, context)
+    else:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=BANK, amount=1.0)
+        service.Transfer(txn, context)
+
+
+def run(stripes, accounts, ops, workers, hold):
+    service, numbers = make_bank(stripes, accounts, hold)
+    context = _Context()
+    with futures.ThreadPoolExecutor(workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: payment(service, numbers, context), range(ops)))
+        return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--hold-ms", type=float, nargs="+", default=[0.0, 0.5])
+    args = parser.parse_args()
+
+    for hold_ms in args.hold_ms:
+        # Fewer operations when each one sleeps, so a run stays short.
+        ops = args.ops if hold_ms == 0 else min(args.ops, int(2000 / hold_ms))
+        print(f"hold {hold_ms}ms, {ops} payments over {args.accounts} accounts")
+        for workers in args.workers:
+            single = run(1, args.accounts, ops, workers, hold_ms / 1000)
+            striped = run(STRIPES, args.accounts, ops, workers, hold_ms / 1000)
+            print(f"  {workers:3} workers  one lock {single:8.0f}/s   {STRIPES} stripes {striped:8.0f}/s"
+                  f"   x{striped / single:.2f}")
+
+
+if __name__ == "__main__":
+    main()
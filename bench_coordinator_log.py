@@ -0,0 +1,115 @@
+"""Payments per second through GatewayService with the coordinator log on and off.
+
+Starts bank_a and bank_b in-process on their usual ports, drives ProcessBank
+from a pool of threads and reports throughput and fsyncs per payment.
+
+    python bench_coordinator_log.py --payments 2000 --threads 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import auth_pb2
+import auth_pb2_grpc
+import bank_pb2
+import bank_pb2_grpc
+from bank_server import AuthService, BankService
+from coordinator_log import CoordinatorLog
+from gateway_server import BANK_TO_IP, GatewayService
+from storage import MemoryStore
+
+
+class _Context:
+    def peer(self):
+        return "bench"
+
+    def time_remaining(self):
+        return None
+
+
+def start_bank(bank_name):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    store = MemoryStore(bank_name)
+    bank_pb2_grpc.add_BankServiceServicer_to_server(BankService(bank_name, store), server)
+    auth_pb2_grpc.add_AuthServiceServicer_to_server(AuthService(bank_name, store), server)
+    server.add_insecure_port(BANK_TO_IP[bank_name])
+    server.start()
+    return server
+
+
+def bench_log_only(directory, threads, appends):
+    log = CoordinatorLog(os.path.join(directory, "raw.log"))
+    request = bank_pb2.Transaction(id="x", from_bank="bank_a", to_bank="bank_b", amount=1.0)
+
+    def writer(_):
+        for _ in range(appends // threads):
+            log.begin(request, ["bank_a", "bank_b"])
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(threads) as pool:
+        list(pool.map(writer, range(threads)))
+    elapsed = time.perf_counter() - start
+    print(f"log only:   {appends / elapsed:9.0f} forced appends/s, "
+          f"{log.flushes} fsyncs for {appends} appends")
+    log.close()
+
+
+def bench_payments(directory, use_log, threads, payments, banks):
+    gateway = GatewayService(
+        idempotency_log=os.path.join(directory, f"idem-{use_log}.log"),
+        coordinator_log=os.path.join(directory, "coordinator.log") if use_log else None,
+    )
+    context = _Context()
+    accounts = []
+    for i in range(50):
+        bank_name = banks[i % len(banks)]
+        username = f"bench_{use_log}_{i}"
+        registered = gateway.RegisterAccount(auth_pb2.RegisterRequest(
+            username=username, password="pw", initial_amount=1e9, bank_name=bank_name), context)
+        login = gateway.Login(auth_pb2.LoginRequest(
+            username=username, password="pw", bank_name=bank_name), context)
+        accounts.append((registered.account_number, bank_name, login.key))
+
+    def pay(_):
+        (from_, from_bank, key), (to, to_bank, _) = random.sample(accounts, 2)
+        return gateway.ProcessBank(bank_pb2.Transaction(
+            id=str(uuid.uuid4()), from_=from_, from_bank=from_bank,
+            to=to, to_bank=to_bank, amount=1.0, key=key), context).success
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(threads) as pool:
+        ok = sum(pool.map(pay, range(payments)))
+    elapsed = time.perf_counter() - start
+    label = "log on " if use_log else "log off"
+    detail = ""
+    if use_log:
+        detail = f", {gateway.coordinator_log.flushes / payments:.2f} fsyncs/payment"
+        gateway.coordinator_log.close()
+    gateway.channels.close()
+    return f"{label}:    {payments / elapsed:9.0f} payments/s ({ok}/{payments} committed{detail})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payments", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    servers = [start_bank("bank_a"), start_bank("bank_b")]
+    with tempfile.TemporaryDirectory() as directory:
+        bench_log_only(directory, args.threads, args.payments)
+        for use_log in (False, True):
+            result = bench_payments(directory, use_log, args.threads, args.payments, ["bank_a", "bank_b"])
+            print(result)
+    for server in servers:
+        server.stop(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""BankService throughput with the durable ledger on and off, and how long a restart takes.
+
+Payments are cross-bank Prepare and Commit pairs, or in-bank Transfers,
+between random accounts, called on the handlers from a pool of threads.
+With the ledger each one waits for its log record to be fsynced, shared
+with whatever else is being written at the time. The restart is timed
+from the snapshot alone, then from the snapshot plus the log written
+since.
+
+    python bench_ledger.py --accounts 100000 --ops 5000 --workers 1 4 16
+"""
+import argparse
+import random
+import tempfile
+import time
+import uuid
+from concurrent import futures
+
+import bank_pb2
+from bank_server import BankService, new_key
+from credentials import hash_password
+from ledger import Ledger
+from storage import MemoryStore
+
+BANK = "bank_a"
+OTHER_BANK = "bank_b"
+
+
+class _Context:
+    def time_remaining(self):
+        return None
+
+
+def make_bank(ledger, accounts):
+    service = BankService(BANK, MemoryStore(BANK, ledger=ledger))
+    password_hash = hash_password("pw")
+    numbers = [str(uuid.uuid4()) for _ in range(accounts)]
+    for i, number in enumerate(numbers):
+        service.store.accounts[number] = {'username': f"user{i}", 'password_hash': password_hash,
+                                          'balance': 1e9, 'key': new_key()}
+    return service, numbers
+
+
+def payment(service, numbers, context):
+    from_, to = random.sample(numbers, 2)
+    if random.random() < 0.5:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=OTHER_BANK, amount=1.0)
+        service.Prepare(txn, context)
+        service.Commit(txn, context)
+    else:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=BANK, amount=1.0)
+        service.Transfer(txn, context)
+
+
+def run(service, numbers, ops, workers):
+    context = _Context()
+    with futures.ThreadPoolExecutor(workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: payment(service, numbers, context), range(ops)))
+        return ops / (time.perf_counter() - start)
+
+
+def timed_load(directory):
+    start = time.perf_counter()
+    ledger = Ledger(BANK, directory)
+    elapsed = time.perf_counter() - start
+    ledger.close()
+    return elapsed, ledger.records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--dir", default=None, help="where to put the ledger (default a temporary directory)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        ledger = Ledger(BANK, directory)
+        durable, numbers = make_bank(ledger, args.accounts)
+        memory, _ = make_bank(None, args.accounts)
+        print(f"{args.ops} payments over {args.accounts} accounts")
+        for workers in args.workers:
+            flushes = ledger.flushes
+            plain = run(memory, list(memory.store.accounts), args.ops, workers)
+            logged = run(durable, numbers, args.ops, workers)
+            print(f"  {workers:3} workers  in memory {plain:8.0f}/s   ledger {logged:8.0f}/s"
+                  f"   {(ledger.flushes - flushes) / args.ops:.2f} fsyncs/payment")
+
+        start = time.perf_counter()
+        ledger.snapshot()
+        print(f"snapshot of {args.accounts} accounts written in {time.perf_counter() - start:.2f}s")
+        elapsed, _ = timed_load(directory)
+        print(f"restart from the snapshot: {elapsed:.2f}s")
+        run(durable, numbers, args.ops, max(args.workers))
+        ledger.close()
+        elapsed, replayed = timed_load(directory)
+        print(f"restart from the snapshot and {replayed} log records: {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
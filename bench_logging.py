@@ -0,0 +1,144 @@
+"""Gateway RPC latency with request logging off, written inline, and through the queued pipeline.
+
+Starts bank_a and bank_b in-process on their usual ports and a plaintext
+gateway on --port, then times GetBalance and ProcessBank calls made over
+gRPC from a pool of threads.
+
+    python bench_logging.py --calls 4000 --threads 8
+"""
+import argparse
+import contextlib
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import auth_pb2
+import auth_pb2_grpc
+import bank_pb2
+import bank_pb2_grpc
+import gateway_pb2_grpc
+from bank_server import AuthService, BankService
+from gateway_server import BANK_TO_IP, GATEWAY_WORKERS, GatewayService, LoggingInterceptor, logger
+from log_pipeline import DroppingQueueHandler, JsonFormatter, QUEUE_SIZE, rotating_handler
+from storage import MemoryStore
+
+
+def start_bank(bank_name):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    store = MemoryStore(bank_name)
+    bank_pb2_grpc.add_BankServiceServicer_to_server(BankService(bank_name, store), server)
+    auth_pb2_grpc.add_AuthServiceServicer_to_server(AuthService(bank_name, store), server)
+    server.add_insecure_port(BANK_TO_IP[bank_name])
+    server.start()
+    return server
+
+
+@contextlib.contextmanager
+def log_mode(mode, directory):
+    """Point the gateway logger at a file for the length of one run."""
+    path = os.path.join(directory, f"{mode}.log")
+    listener = None
+    if mode == "off":
+        handler = logging.NullHandler()
+        logger.setLevel(logging.WARNING)
+    elif mode == "inline":
+        # What every request paid before: format and write on its own thread.
+        handler = logging.FileHandler(path)
+        handler.setFormatter(JsonFormatter())
+        logger.setLevel(logging.INFO)
+    else:
+        records = queue.Queue(QUEUE_SIZE)
+        handler = DroppingQueueHandler(records)
+        writer = rotating_handler(path)
+        writer.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(records, writer)
+        listener.start()
+        logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        yield handler
+    finally:
+        logger.removeHandler(handler)
+        if listener is not None:
+            listener.stop()
+        handler.close()
+
+
+def bench(mode, directory, port, calls, threads):
+    interceptors = [] if mode == "off" else [LoggingInterceptor()]
+    gateway = GatewayService(idempotency_log=os.path.join(directory, f"idem-{mode}.log"), coordinator_log=None)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GATEWAY_WORKERS), interceptors=interceptors)
+    gateway_pb2_grpc.add_GatewayServiceServicer_to_server(gateway, server)
+    server.add_insecure_port(f"localhost:{port}")
+    server.start()
+    channel = grpc.insecure_channel(f"localhost:{port}")
+    stub = gateway_pb2_grpc.GatewayServiceStub(channel)
+
+    accounts = []
+    for bank_name in ("bank_a", "bank_b"):
+        username = f"bench_{mode}_{bank_name}"
+        registered = stub.RegisterAccount(auth_pb2.RegisterRequest(
+            username=username, password="pw", initial_amount=1e9, bank_name=bank_name))
+        login = stub.Login(auth_pb2.LoginRequest(username=username, password="pw", bank_name=bank_name))
+        accounts.append((registered.account_number, bank_name, login.key))
+    (from_, from_bank, key), (to, to_bank, _) = accounts
+
+    def balance(_):
+        start = time.perf_counter()
+        stub.GetBalance(bank_pb2.Account(number=from_, bank_name=from_bank, key=key))
+        return time.perf_counter() - start
+
+    def pay(_):
+        start = time.perf_counter()
+        stub.ProcessBank(bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=from_bank,
+                                              to=to, to_bank=to_bank, amount=0.01, key=key))
+        return time.perf_counter() - start
+
+    results = {}
+    with log_mode(mode, directory) as handler:
+        for name, call in (("GetBalance", balance), ("ProcessBank", pay)):
+            with futures.ThreadPoolExecutor(threads) as pool:
+                list(pool.map(call, range(threads * 10)))  # warm up
+                start = time.perf_counter()
+                latencies = sorted(pool.map(call, range(calls)))
+                elapsed = time.perf_counter() - start
+            results[name] = (latencies, calls / elapsed)
+        dropped = getattr(handler, "dropped", 0)
+    channel.close()
+    server.stop(None)
+    gateway.channels.close()
+    return results, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=50090)
+    args = parser.parse_args()
+
+    servers = [start_bank("bank_a"), start_bank("bank_b")]
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("off", "inline", "queued"):
+            results, dropped = bench(mode, directory, args.port, args.calls, args.threads)
+            for name, (latencies, rate) in results.items():
+                p50 = statistics.median(latencies) * 1000
+                p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+                print(f"{mode:7} {name:12} p50 {p50:6.2f}ms  p99 {p99:6.2f}ms  {rate:8.0f} calls/s")
+            if dropped:
+                print(f"{mode:7} {dropped} records dropped")
+    for server in servers:
+        server.stop(None)
+
+
+if __name__ == "__main__":
+    main()
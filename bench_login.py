@@ -0,0 +1,87 @@
+"""LoginAccount latency with the username index versus the scan over every account it replaced.
+
+Fills one bank with --accounts accounts (1M by default) and times logins
+for random users through AuthService.LoginAccount, plus a few logins done
+the old way, by scanning the account table. Passwords are hashed with a
+cheap scrypt cost here so the lookup, not the KDF, is what gets timed.
+
+    python bench_login.py --accounts 1000000 --logins 10000
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+import auth_pb2
+from bank_server import AuthService, new_key
+from credentials import PasswordHasher, check_password, hash_password
+from storage import MemoryStore, username_index
+
+BANK = "bank_a"
+COST = 2  # scrypt n for the benchmark's password hashes
+
+
+class _Context:
+    def time_remaining(self):
+        return None
+
+
+def fill(store, count):
+    password_hash = hash_password("pw", COST)
+    for i in range(count):
+        store.add_account(str(uuid.uuid4()), {
+            'username': f"user{i}",
+            'password_hash': password_hash,
+            'balance': 100.0,
+            'key': new_key(),
+        })
+
+
+def scan_login(accounts, username, password):
+    # What LoginAccount did before the index.
+    for account_number, account in accounts.items():
+        if account['username'] == username and check_password(account['password_hash'], password):
+            return account_number
+    return None
+
+
+def timed(call, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000000)
+    parser.add_argument("--logins", type=int, default=10000)
+    parser.add_argument("--scans", type=int, default=20, help="logins timed with the old scan")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = MemoryStore(BANK)
+    fill(store, args.accounts)
+    print(f"{args.accounts} accounts created in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    username_index(store.accounts)
+    print(f"username index rebuilt in {time.perf_counter() - start:.2f}s, as when a bank starts")
+    auth = AuthService(BANK, store, PasswordHasher(workers=0, cache_ttl=0, n=COST))
+
+    context = _Context()
+    login = lambda: auth.LoginAccount(auth_pb2.LoginRequest(
+        username=f"user{random.randrange(args.accounts)}", password="pw", bank_name=BANK), context)
+    assert login().message == "Login successful"
+    p50, p99 = timed(login, args.logins)
+    print(f"indexed  p50 {p50 * 1e6:10.1f}us  p99 {p99 * 1e6:10.1f}us")
+    scan = lambda: scan_login(store.accounts, f"user{random.randrange(args.accounts)}", "pw")
+    p50, p99 = timed(scan, args.scans)
+    print(f"scan     p50 {p50 * 1e6:10.1f}us  p99 {p99 * 1e6:10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
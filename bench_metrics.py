@@ -0,0 +1,54 @@
+"""Cost of recording one metric event, single-threaded and with several threads recording at once.
+
+    python bench_metrics.py --events 1000000 --threads 8
+"""
+import argparse
+import threading
+import time
+
+from metrics import Counter, Histogram, Registry
+
+
+def per_event(record, events, threads):
+    """Nanoseconds of wall time per event while `threads` threads each record `events` events."""
+    start_line = threading.Barrier(threads + 1)
+
+    def run():
+        start_line.wait()
+        for i in range(events):
+            record(i)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (events * threads) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = Counter("bench_total", "Counter under test", ["bank"], registry=registry)
+    histogram = Histogram("bench_seconds", "Histogram under test", ["bank", "method"], registry=registry)
+    cases = {
+        "loop only": lambda i: None,
+        "Counter.inc": lambda i: counter.inc("bank_a"),
+        "Histogram.observe": lambda i: histogram.observe(0.0042, "bank_a", "Prepare"),
+    }
+    for threads in sorted({1, args.threads}):
+        events = args.events // threads
+        for name, record in cases.items():
+            print(f"{threads:2} thread(s)  {name:18} {per_event(record, events, threads):7.1f} ns/event")
+    total = sum(histogram.collect()[("bank_a", "Prepare")][:len(histogram.bounds)])
+    print(f"histogram holds {total} observations")
+
+
+if __name__ == "__main__":
+    main()
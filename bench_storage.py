@@ -0,0 +1,105 @@
+"""BankService throughput on the in-memory store (with its ledger) versus the SQLite store.
+
+For each store: registers --accounts accounts through AuthService, noting
+the Python memory they take, then runs payments from a pool of threads,
+each a cross-bank Prepare and Commit or an in-bank Transfer between random
+accounts, and logins for random users. Both stores write every change
+durably before answering. Passwords use a cheap scrypt cost, so the
+store, not the KDF, is what gets timed.
+
+    python bench_storage.py --accounts 100000 --ops 5000 --workers 1 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent import futures
+
+import auth_pb2
+import bank_pb2
+from bank_server import AuthService, BankService
+from credentials import PasswordHasher
+from ledger import Ledger
+from storage import MemoryStore, SqliteStore
+
+BANK = "bank_a"
+OTHER_BANK = "bank_b"
+COST = 2  # scrypt n for the benchmark's password hashes
+
+
+class _Context:
+    def time_remaining(self):
+        return None
+
+
+def make_store(kind, directory):
+    if kind == "memory":
+        return MemoryStore(BANK, ledger=Ledger(BANK, directory))
+    return SqliteStore(BANK, os.path.join(directory, f"{BANK}.db"))
+
+
+def register(auth, count, context):
+    # Python heap taken by the accounts; SQLite's own cache is not counted,
+    # and stays the same size however many accounts there are.
+    tracemalloc.start()
+    start = time.perf_counter()
+    numbers = [auth.RegisterAccount(auth_pb2.RegisterRequest(
+        username=f"user{i}", password="pw", initial_amount=1e9, bank_name=BANK), context).account_number
+        for i in range(count)]
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return numbers, count / elapsed, memory
+
+
+def payment(service, numbers, context):
+    from_, to = random.sample(numbers, 2)
+    if random.random() < 0.5:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=OTHER_BANK, amount=1.0)
+        service.Prepare(txn, context)
+        service.Commit(txn, context)
+    else:
+        txn = bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=BANK,
+                                   to=to, to_bank=BANK, amount=1.0)
+        service.Transfer(txn, context)
+
+
+def rate(call, ops, workers):
+    with futures.ThreadPoolExecutor(workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: call(), range(ops)))
+        return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--dir", default=None, help="where to put the stores (default a temporary directory)")
+    args = parser.parse_args()
+
+    context = _Context()
+    for kind in ("memory", "sqlite"):
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            store = make_store(kind, directory)
+            service = BankService(BANK, store)
+            auth = AuthService(BANK, store, PasswordHasher(workers=0, cache_ttl=0, n=COST))
+            numbers, registrations, memory = register(auth, args.accounts, context)
+            print(f"{kind}: {args.accounts} accounts, {registrations:.0f} registrations/s, "
+                  f"{memory / args.accounts:.0f} bytes of Python heap per account")
+            login = lambda: auth.LoginAccount(auth_pb2.LoginRequest(
+                username=f"user{random.randrange(args.accounts)}", password="pw", bank_name=BANK), context)
+            for workers in args.workers:
+                payments = rate(lambda: payment(service, numbers, context), args.ops, workers)
+                logins = rate(login, args.ops, workers)
+                print(f"  {workers:3} workers  payments {payments:8.0f}/s   logins {logins:8.0f}/s")
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import collections
+import logging
+import threading
+import time
+
+import grpc
+
+logger = logging.getLogger('GatewayServer')
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+WINDOW = 20  # most recent calls the failure rate is taken over
+MIN_CALLS = 5  # calls in the window before the rate can open the circuit
+FAILURE_RATE = 0.5
+SLOW_CALL = 2.0  # seconds after which a successful call still counts as a failure
+OPEN_FOR = 5.0  # seconds an open circuit rejects calls before letting a probe through
+PROBES = 1  # calls let through while half-open
+
+# Status codes that say nothing about the bank's health.
+CALLER_ERRORS = (grpc.StatusCode.INVALID_ARGUMENT, grpc.StatusCode.NOT_FOUND,
+                 grpc.StatusCode.PERMISSION_DENIED, grpc.StatusCode.UNAUTHENTICATED,
+                 grpc.StatusCode.CANCELLED)
+
+
+class CircuitOpenError(grpc.RpcError):
+    """Raised instead of calling a bank whose circuit is open."""
+
+    def __init__(self, bank_name):
+        super().__init__(f"{bank_name} is unavailable (circuit open)")
+        self.bank_name = bank_name
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self):
+        return str(self)
+
+
+def is_failure(error, timeout=None, slow_call=SLOW_CALL):
+    """Whether `error`, from a call given `timeout` seconds, counts against the bank.
+
+    A call given less than slow_call that ran out of time was cut short by
+    its caller's budget: the bank was no slower than a call SLOW_CALL lets
+    pass, so the deadline says nothing about its health.
+    """
+    if error is None:
+        return False
+    if isinstance(error, grpc.RpcError) and hasattr(error, "code"):
+        if error.code() == grpc.StatusCode.DEADLINE_EXCEEDED and timeout is not None and timeout < slow_call:
+            return False
+        return error.code() not in CALLER_ERRORS
+    return True
+
+
+class CircuitBreaker:
+    """Closed, open and half-open states for calls to one bank.
+
+    Closed: calls go through, and each outcome is kept in a sliding window
+    of the last WINDOW calls. Errors and calls slower than SLOW_CALL count
+    as failures. Once FAILURE_RATE of the window has failed, the circuit
+    opens. Open: calls are rejected without touching the network until
+    OPEN_FOR has passed. Half-open: PROBES calls are let through. A
+    healthy probe closes the circuit; a failed or slow one opens it again.
+    """
+
+    def __init__(self, name, window=WINDOW, min_calls=MIN_CALLS, failure_rate=FAILURE_RATE,
+                 slow_call=SLOW_CALL, open_for=OPEN_FOR, probes=PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.probes = probes
+        self.lock = threading.Lock()
+        self.outcomes = collections.deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = 0
+
+    def allow(self):
+        """Whether a call may go out now; False means fail it straight away."""
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_for:
+                    return False
+                self._move_to(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probing >= self.probes:
+                    return False
+                self.probing += 1
+            return True
+
+    def available(self):
+        """Whether allow() could let a call through, without claiming a probe."""
+        with self.lock:
+            return self.state != OPEN or time.monotonic() - self.opened_at >= self.open_for
+
+    def record(self, error, seconds, timeout=None):
+        """Note how a call given `timeout` seconds ended after `seconds`."""
+        failed = is_failure(error, timeout, self.slow_call) or seconds > self.slow_call
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probing = max(0, self.probing - 1)
+                self._move_to(OPEN if failed else CLOSED)
+                return
+            self.outcomes.append(failed)
+            if self.state == CLOSED and len(self.outcomes) >= self.min_calls \
+                    and sum(self.outcomes) >= self.failure_rate * len(self.outcomes):
+                self._move_to(OPEN)
+
+    def _move_to(self, state):
+        # Caller holds self.lock.
+        if state == self.state:
+            if state == OPEN:
+                self.opened_at = time.monotonic()
+            return
+        logger.warning(f"Circuit for {self.name}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        else:
+            self.outcomes.clear()
+        self.probing = 0
+
+    def snapshot(self):
+        with self.lock:
+            failures = sum(self.outcomes)
+            return self.state, failures / len(self.outcomes) if self.outcomes else 0.0
@@ -16,6 +16,8 @@ import auth_pb2
 import os
 import auth_pb2_grpc
 
+from deadlines import DEFAULT_TIMEOUTS
+
 import time
 
 import threading
@@ -123,6 +125,7 @@ import queue
 class Client:
     def __init__(self, stub):
         self.stub = stub
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
         self.keys = {}
 
         self.offline_processing=queue.Queue()
@@ -136,7 +139,7 @@ class Client:
             initial_amount=initial_amount
         )
         try:
-            response = self.stub.RegisterAccount(request)
+            response = self.stub.RegisterAccount(request, timeout=self.timeouts["RegisterAccount"])
             if response.success==False:
                 print(response.message)
                 return ""
@@ -149,7 +152,7 @@ class Client:
     def login(self, username, password, bank_name):
         request = auth_pb2.LoginRequest(username=username, password=password, bank_name=bank_name)
         try:
-            response = self.stub.Login(request)
+            response = self.stub.Login(request, timeout=self.timeouts["Login"])
             if response.message == "Login successful":
                 self.keys[f"{bank_name}_{response.account_number}"] = response.key
                 print(f"Logged in to {bank_name} with account {response.account_number}")
@@ -170,7 +173,7 @@ class Client:
             return
         request = bank_pb2.Account(number=account_number, bank_name=bank_name, key=key)
         try:
-            response = self.stub.GetBalance(request)
+            response = self.stub.GetBalance(request, timeout=self.timeouts["GetBalance"])
             if response.error:
                 print(f"Error: {response.message}")
             else:
@@ -194,7 +197,7 @@ class Client:
             key=from_key
         )
         try:
-            response = self.stub.ProcessBank(request)
+            response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
             print(f"Payment result: {response.success} - {response.message}")
         except grpc.RpcError as err:
             print(f"Error processing payment: {err.details()}")
@@ -13,10 +13,13 @@ import gateway_pb2_grpc
 import auth_pb2
 import auth_pb2_grpc
 
+from deadlines import DEFAULT_TIMEOUTS
+
 # Client class to handle registration, login, transactions, and balance checks
 class Client:
     def __init__(self, stub, shared_keys=None, keys_lock=None):
         self.stub = stub
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
         self.keys = shared_keys if shared_keys is not None else {}
         self.keys_lock = keys_lock
         self.pending_transactions = queue.Queue()  # Queue for offline transactions
@@ -31,7 +34,7 @@ class Client:
             initial_amount=initial_amount
         )
         try:
-            response = self.stub.RegisterAccount(request)
+            response = self.stub.RegisterAccount(request, timeout=self.timeouts["RegisterAccount"])
             print(f"Registered {username} at {bank_name} with account {response.account_number} - {response.message}")
             return response.account_number if response.account_number else None
         except grpc.RpcError as e:
@@ -42,7 +45,7 @@ class Client:
     def login(self, username, password, bank_name):
         request = auth_pb2.LoginRequest(username=username, password=password, bank_name=bank_name)
         try:
-            response = self.stub.Login(request)
+            response = self.stub.Login(request, timeout=self.timeouts["Login"])
             if response.message == "Login successful":
                 with self.keys_lock:
                     self.keys[f"{bank_name}_{response.account_number}"] = response.key
@@ -63,7 +66,7 @@ class Client:
             return None
         request = bank_pb2.Account(number=account_number, bank_name=bank_name, key=key)
         try:
-            response = self.stub.GetBalance(request)
+            response = self.stub.GetBalance(request, timeout=self.timeouts["GetBalance"])
             if response.error:
                 print(f"Error getting balance for {bank_name} {account_number}: {response.message}")
                 return None
@@ -91,7 +94,7 @@ class Client:
             key=from_key
         )
         try:
-            response = self.stub.ProcessBank(request)
+            response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
             print(f"Transaction {txn_id}: {from_bank} {from_acc} -> {to_bank} {to_acc} ({amount:.2f}): {response.success} - {response.message}")
             self._process_queue_head()
             return
@@ -111,7 +114,7 @@ class Client:
         while not self.pending_transactions.empty():
             request = self.pending_transactions.queue[0]
             try:
-                response = self.stub.ProcessBank(request)
+                response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
                 print(f"Processed queued {request.id}: {request.from_bank} {request.from_} -> {request.to_bank} {request.to} ({request.amount:.2f}): {response.success} - {response.message}")
                 self.pending_transactions.get()
                 self.pending_transactions.task_done()
@@ -0,0 +1,100 @@
+import os
+import sys
+import uuid
+from concurrent import futures
+
+import grpc
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import auth_pb2_grpc  # noqa: E402
+import bank_pb2  # noqa: E402
+import bank_pb2_grpc  # noqa: E402
+from bank_pool import BankConfig  # noqa: E402
+from bank_server import AuthService, BankService, new_key  # noqa: E402
+from credentials import PasswordHasher, hash_password  # noqa: E402
+from storage import MemoryStore  # noqa: E402
+
+BANK_NAMES = ("bank_a", "bank_b")
+TEST_COST = 2  # scrypt n for test passwords, so hashing takes no time
+
+
+class Context:
+    """The parts of a grpc.ServicerContext the gateway and banks use."""
+
+    def __init__(self, time_remaining=None):
+        self.remaining = time_remaining
+        self.trailing_metadata = ()
+
+    def time_remaining(self):
+        return self.remaining
+
+    def peer(self):
+        return "ipv4:127.0.0.1:1"
+
+    def invocation_metadata(self):
+        return ()
+
+    def set_trailing_metadata(self, metadata):
+        self.trailing_metadata = metadata
+
+    def auth_context(self):
+        return {}
+
+    def is_active(self):
+        return True
+
+    def abort(self, code, details):
+        raise grpc.RpcError(f"{code}: {details}")
+
+
+def payment(from_, from_bank, to, to_bank, amount, key):
+    return bank_pb2.Transaction(id=str(uuid.uuid4()), from_=from_, from_bank=from_bank,
+                                to=to, to_bank=to_bank, amount=amount, key=key)
+
+
+class Bank:
+    """One in-process bank server on a free local port."""
+
+    def __init__(self, bank_name, hasher=None):
+        self.bank_name = bank_name
+        self.store = MemoryStore(bank_name)
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        bank_pb2_grpc.add_BankServiceServicer_to_server(BankService(bank_name, self.store), self.server)
+        auth_pb2_grpc.add_AuthServiceServicer_to_server(
+            AuthService(bank_name, self.store, hasher or PasswordHasher(workers=0, n=TEST_COST)), self.server)
+        self.port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+
+    @property
+    def config(self):
+        return BankConfig(self.bank_name, [f"localhost:{self.port}"], None, 1)
+
+    def open_account(self, balance, username=None):
+        """(account number, key) of a new account holding `balance`."""
+        account_number = str(uuid.uuid4())
+        key = new_key()
+        self.store.add_account(account_number, {
+            'username': username or account_number,
+            'password_hash': hash_password("pw", TEST_COST),
+            'balance': balance,
+            'key': key,
+        })
+        return account_number, key
+
+    def balance(self, account_number):
+        return self.store.account(account_number)['balance']
+
+
+@pytest.fixture
+def banks():
+    started = {bank_name: Bank(bank_name) for bank_name in BANK_NAMES}
+    yield started
+    for bank in started.values():
+        bank.server.stop(None)
+
+
+@pytest.fixture
+def bank_configs(banks):
+    return {bank_name: bank.config for bank_name, bank in banks.items()}
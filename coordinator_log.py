@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+
+from wal import GroupCommitLog, read_records
+
+DEFAULT_LOG_PATH = os.path.join("data", "coordinator.log")
+CHECKPOINT_EVERY = 10000  # finished transactions between log checkpoints
+
+COMMIT = "COMMIT"
+ABORT = "ABORT"
+
+TRANSACTION_FIELDS = ("id", "from_", "from_bank", "to", "to_bank", "key", "amount", "timestamp")
+
+
+def transaction_to_dict(request):
+    return {field: getattr(request, field) for field in TRANSACTION_FIELDS}
+
+
+class InDoubtTransaction:
+    __slots__ = ("txn", "participants", "decision")
+
+    def __init__(self, txn, participants, decision=None):
+        self.txn = txn
+        self.participants = participants
+        self.decision = decision
+
+    @property
+    def txn_id(self):
+        return self.txn["id"]
+
+
+class CoordinatorLog:
+    """Write-ahead log of the gateway's 2PC decisions.
+
+    Per transaction: a forced BEGIN before any Prepare is sent, so a crash
+    never leaves holds at a bank that the log does not know about; a forced
+    COMMIT before phase 2 starts (ABORT need not be forced because an
+    undecided transaction is presumed aborted); and a lazy END once every
+    participant has acknowledged.
+
+    Unfinished transactions are also kept in memory. Every CHECKPOINT_EVERY
+    ENDs the log is rewritten with only those, so replaying it at startup
+    costs time in proportion to what is in doubt, not to the whole history.
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, sync=True, checkpoint_every=CHECKPOINT_EVERY):
+        self.path = path
+        self.sync = sync
+        self.checkpoint_every = checkpoint_every
+        self.lock = threading.Lock()
+        self.active = {}
+        for entry in self._replay():
+            self.active[entry.txn_id] = entry
+        self.finished = 0
+        self.log = GroupCommitLog(path, sync=sync)
+
+    def _replay(self):
+        active = {}
+        for record in read_records(self.path):
+            kind = record["type"]
+            if kind == "BEGIN":
+                active[record["id"]] = InDoubtTransaction(record["txn"], record["participants"])
+            elif kind in (COMMIT, ABORT) and record["id"] in active:
+                active[record["id"]].decision = kind
+            elif kind == "END":
+                active.pop(record["id"], None)
+        return list(active.values())
+
+    def _write(self, records, force=True):
+        with self.lock:
+            for record, entry in records:
+                if record["type"] == "BEGIN":
+                    self.active[record["id"]] = entry
+                elif record["type"] in (COMMIT, ABORT) and record["id"] in self.active:
+                    self.active[record["id"]].decision = record["type"]
+                elif record["type"] == "END":
+                    self.active.pop(record["id"], None)
+                    self.finished += 1
+                self.log.append_nowait(record)
+            log = self.log
+            if self.finished >= self.checkpoint_every:
+                self._checkpoint_locked()
+        if force:
+            log.flush()
+
+    @staticmethod
+    def _begin_record(request, participants):
+        txn = transaction_to_dict(request)
+        record = {"type": "BEGIN", "id": request.id, "participants": list(participants), "txn": txn}
+        return record, InDoubtTransaction(txn, list(participants))
+
+    def begin(self, request, participants):
+        self._write([self._begin_record(request, participants)])
+
+    def begin_many(self, items):
+        """BEGIN for several (request, participants) pairs under one fsync."""
+        self._write([self._begin_record(request, participants) for request, participants in items])
+
+    def decide(self, txn_id, decision):
+        self.decide_many([txn_id], decision)
+
+    def decide_many(self, txn_ids, decision):
+        if txn_ids:
+            self._write([({"type": decision, "id": txn_id}, None) for txn_id in txn_ids],
+                        force=decision == COMMIT)
+
+    def end(self, txn_id):
+        self.end_many([txn_id])
+
+    def end_many(self, txn_ids):
+        if txn_ids:
+            self._write([({"type": "END", "id": txn_id}, None) for txn_id in txn_ids], force=False)
+
+    def in_doubt(self):
+        """Transactions that began but were never acknowledged by every participant."""
+        with self.lock:
+            return list(self.active.values())
+
+    def checkpoint(self):
+        with self.lock:
+            self._checkpoint_locked()
+
+    def _checkpoint_locked(self):
+        # Closing flushes whatever is queued; the new file then holds just
+        # the BEGIN (and decision) of each transaction still in flight.
+        self.log.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.active.values():
+                f.write(json.dumps({"type": "BEGIN", "id": entry.txn_id,
+                                    "participants": entry.participants, "txn": entry.txn},
+                                   separators=(",", ":")) + "\n")
+                if entry.decision is not None:
+                    f.write(json.dumps({"type": entry.decision, "id": entry.txn_id},
+                                       separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.log = GroupCommitLog(self.path, sync=self.sync)
+        self.finished = 0
+
+    @property
+    def flushes(self):
+        return self.log.flushes
+
+    def close(self):
+        self.log.close()
@@ -0,0 +1,128 @@
+import base64
+import collections
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent import futures
+
+SCRYPT_N = 2 ** 14  # scrypt cost; about 16MB and 50ms for each hash
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+MAX_PENDING = 64  # hashes queued or running before new ones are turned away
+CACHE_TTL = 300.0  # seconds a verified password is trusted without hashing it again
+CACHE_SIZE = 100000  # usernames kept in the verified-credential cache
+
+
+class HasherBusy(Exception):
+    """Raised when MAX_PENDING hashes are already waiting for the pool."""
+
+
+def hash_password(password, n=SCRYPT_N):
+    """A salted scrypt hash of `password`, stored as "scrypt$n$r$p$salt$hash"."""
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P)
+    return "$".join(["scrypt", str(n), str(SCRYPT_R), str(SCRYPT_P),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def check_password(stored, password):
+    """Whether `password` matches a hash made by hash_password."""
+    _, n, r, p, salt, digest = stored.split("$")
+    expected = base64.b64decode(digest)
+    actual = hashlib.scrypt(password.encode(), salt=base64.b64decode(salt),
+                            n=int(n), r=int(r), p=int(p), dklen=len(expected))
+    return hmac.compare_digest(actual, expected)
+
+
+class VerifiedCache:
+    """Passwords recently verified, so repeated logins skip the KDF.
+
+    Only a keyed hash of the password is kept, under a secret that lives
+    and dies with the process, together with the stored hash it matched:
+    an entry stops matching once it is older than `ttl` or the account's
+    password hash changes.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.secret = os.urandom(32)
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # username -> (fingerprint, stored hash, expiry)
+
+    def _fingerprint(self, password):
+        return hmac.new(self.secret, password.encode(), hashlib.sha256).digest()
+
+    def hit(self, username, stored, password, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(username)
+        if entry is None or entry[1] != stored or entry[2] <= now:
+            return False
+        return hmac.compare_digest(entry[0], self._fingerprint(password))
+
+    def add(self, username, stored, password, now=None):
+        now = time.monotonic() if now is None else now
+        entry = (self._fingerprint(password), stored, now + self.ttl)
+        with self.lock:
+            self.entries[username] = entry
+            self.entries.move_to_end(username)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class PasswordHasher:
+    """Hashes and checks passwords in a process pool, off the bank's gRPC threads.
+
+    scrypt would hold the GIL for its whole run if done in the handler; in
+    worker processes it runs on other cores, and the handler thread only
+    waits on a future, so payments on the same bank keep being served. At
+    most `max_pending` hashes wait for the pool at once; beyond that calls
+    raise HasherBusy instead of queueing without bound. With workers=0 the
+    hashing is done inline, which suits benchmarks and tests.
+    """
+
+    def __init__(self, workers=None, max_pending=MAX_PENDING, cache_ttl=CACHE_TTL, n=SCRYPT_N):
+        self.n = n
+        self.cache = VerifiedCache(cache_ttl)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.pool = None
+        if workers != 0:
+            # forkserver: workers are not forked from a process with gRPC threads running.
+            self.pool = futures.ProcessPoolExecutor(workers or os.cpu_count(),
+                                                    mp_context=multiprocessing.get_context("forkserver"))
+
+    def start(self):
+        """Start the worker processes now rather than on the first login."""
+        if self.pool is not None:
+            self.pool.submit(int).result()
+
+    def _run(self, function, *args):
+        if self.pool is None:
+            return function(*args)
+        if not self.pending.acquire(blocking=False):
+            raise HasherBusy("Too many password checks in progress")
+        try:
+            return self.pool.submit(function, *args).result()
+        finally:
+            self.pending.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.n)
+
+    def verify(self, username, stored, password):
+        """Whether `password` is right for `username`, whose stored hash is `stored`."""
+        if self.cache.hit(username, stored, password):
+            return True
+        if not self._run(check_password, stored, password):
+            return False
+        self.cache.add(username, stored, password)
+        return True
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
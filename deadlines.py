@@ -0,0 +1,62 @@
+import time
+
+# Seconds a gateway method may take when the client sets no tighter deadline.
+DEFAULT_TIMEOUTS = {
+    "ProcessBank": 10.0,
+    "ProcessBatch": 30.0,
+    "GetBalance": 5.0,
+    "RegisterAccount": 10.0,
+    "Login": 10.0,
+    "HealthCheck": 2.0,
+}
+
+PREPARE_SHARE = 0.5  # of what is left of a payment's budget that Prepare may use
+MIN_COMMIT_TIMEOUT = 1.0  # phase 2 always gets this long; the decision is already logged
+
+
+def load_timeouts(overrides=()):
+    """DEFAULT_TIMEOUTS updated with "Method=seconds" strings."""
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for item in overrides:
+        method, _, seconds = item.partition("=")
+        if method not in timeouts:
+            raise ValueError(f"Unknown method {method!r}; expected one of {', '.join(timeouts)}")
+        timeouts[method] = float(seconds)
+    return timeouts
+
+
+class Budget:
+    """The time left to answer one request, fixed when the gateway receives it."""
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    @classmethod
+    def from_context(cls, context, limit):
+        # The client's deadline wins when it is tighter than the method's
+        # own limit. Without one, gRPC reports None or an effectively
+        # infinite time remaining.
+        remaining = context.time_remaining()
+        if remaining is None or remaining > limit:
+            remaining = limit
+        return cls(remaining)
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def prepare_timeout(self):
+        return self.remaining() * PREPARE_SHARE
+
+    def commit_timeout(self):
+        # Abandoning Commit or Abort would only leave funds on hold until
+        # recovery, so phase 2 is not cut short by a client that gave up.
+        return max(self.remaining(), MIN_COMMIT_TIMEOUT)
+
+
+def deadline_passed(context):
+    """True once the caller's deadline has gone by, for servers to stop early."""
+    remaining = context.time_remaining()
+    return remaining is not None and remaining <= 0
@@ -0,0 +1,542 @@
+import asyncio
+import os
+import time
+
+import grpc
+from grpc_interceptor import AsyncServerInterceptor
+
+import auth_pb2
+import bank_pb2
+import gateway_pb2
+import gateway_pb2_grpc
+
+from recovery import recover_in_doubt
+from bank_pool import (AsyncBankChannelPool, BankChannelPool, DEFAULT_SUBCHANNELS, READ_METHODS, bank_configs,
+                       bank_tls_paths)
+from bank_registry import BankRegistry, DEFAULT_CONFIG as BANK_REGISTRY
+from coordinator_log import ABORT, COMMIT, CoordinatorLog
+from deadlines import Budget, load_timeouts
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from wal import LogWriteError
+from idempotency import ABORTED, COMMITTED, IdempotencyStore
+from rate_limit import AsyncRateLimitInterceptor, RateLimiter
+from log_pipeline import RpcLog, configure_logging
+from metrics import AsyncMetricsInterceptor, start_http_server
+import tracing
+from session_tokens import (AsyncAuthInterceptor, InvalidToken, SessionTokens, DEFAULT_SECRET_FILE, load_secret,
+                            DEFAULT_TTL as SESSION_TTL)
+from gateway_server import (
+    BANK_LATENCY,
+    BANK_TO_IP,
+    COORDINATOR_LOG,
+    DEFAULT_MAX_INFLIGHT,
+    IDEMPOTENCY_LOG,
+    INFLIGHT_2PC,
+    MAX_BANK_BATCH,
+    SETTLE_METHODS,
+    STREAM_WINDOW,
+    PHASE_LATENCY,
+    PREPARE_NO_VOTES,
+    AbortSettlement,
+    RPC_ERRORS,
+    RPC_LATENCY,
+    batch_outcomes,
+    batch_response,
+    chunked,
+    group_by_bank,
+    health_response,
+    invalidate_balances,
+    keep_draining,
+    load_banks,
+    load_server_credentials,
+    logger,
+    participants_of,
+    payer_error,
+    payment_result,
+    phase_two_work,
+    plan_batch,
+    record_outcome,
+    record_outcomes,
+    refresh_breakers,
+    replay_response,
+    session_login,
+    tally_votes,
+    transfer_outcome,
+)
+
+
+class AsyncLoggingInterceptor(AsyncServerInterceptor):
+    """LoggingInterceptor for the asyncio gateway."""
+
+    def __init__(self, sample_rates=None):
+        self.rpc_log = RpcLog(logger, sample_rates)
+
+    async def intercept(self, method, request, context, method_name):
+        method_name_str = str(method_name).split('/')[-1]
+        sampled = self.rpc_log.sampled(method_name_str)
+        start_time = time.perf_counter()
+        try:
+            response = method(request, context)
+            if hasattr(response, "__aiter__"):
+                # Streaming responses are logged per item by the handler.
+                return response
+            response = await response
+        except Exception as e:
+            self.rpc_log.failed(method_name_str, context.peer(), e, start_time)
+            raise
+        if sampled:
+            self.rpc_log.completed(method_name_str, context.peer(), request, response, start_time)
+        return response
+
+
+class AsyncGatewayService(gateway_pb2_grpc.GatewayServiceServicer):
+    """GatewayService on asyncio: a payment waiting on a bank holds no thread.
+
+    In-flight payments are capped by `max_inflight`; the rest wait for a slot.
+    """
+
+    def __init__(self, banks=None, max_inflight=DEFAULT_MAX_INFLIGHT, idempotency_log=IDEMPOTENCY_LOG,
+                 coordinator_log=COORDINATOR_LOG, timeouts=None, balance_cache=None, tokens=None):
+        banks = banks or bank_configs(BANK_TO_IP)
+        self.timeouts = timeouts or load_timeouts()
+        self.channels = AsyncBankChannelPool(banks)
+        self.breakers = {bank_name: CircuitBreaker(bank_name) for bank_name in banks}
+        # Logins queue behind the bank's password hashing; keep them off the payment circuit.
+        self.auth_breakers = {bank_name: CircuitBreaker(f"{bank_name} auth") for bank_name in banks}
+        self.balance_cache = balance_cache
+        self.tokens = tokens
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.transactions = IdempotencyStore(idempotency_log)
+        self.coordinator_log = CoordinatorLog(coordinator_log) if coordinator_log else None
+        self.background = set()  # END writes started from callbacks, kept until they finish
+
+    def _budget(self, context, method):
+        return Budget.from_context(context, self.timeouts[method])
+
+    async def apply_bank_config(self, configs):
+        breakers = refresh_breakers(self.breakers, self.channels, configs)
+        auth_breakers = refresh_breakers(self.auth_breakers, self.channels, configs, service="auth")
+        self.breakers = {**self.breakers, **breakers}
+        self.auth_breakers = {**self.auth_breakers, **auth_breakers}
+        await self.channels.reload(configs)
+        self.breakers = keep_draining(self.breakers, self.channels, breakers)
+        self.auth_breakers = keep_draining(self.auth_breakers, self.channels, auth_breakers)
+
+    async def _call(self, bank_name, method, request, timeout, service="bank"):
+        breaker = (self.breakers if service == "bank" else self.auth_breakers)[bank_name]
+        if method not in SETTLE_METHODS and not breaker.allow():
+            raise CircuitOpenError(bank_name)
+        sub = self.channels.acquire(bank_name, read=method in READ_METHODS)
+        stub = sub.bank if service == "bank" else sub.auth
+        span = tracing.child(method, bank=bank_name)
+        timeout = self.channels.timeout(bank_name, timeout)
+        start = time.perf_counter()
+        try:
+            response = await getattr(stub, method)(request, timeout=timeout, metadata=tracing.metadata(span))
+        except grpc.RpcError as e:
+            elapsed = time.perf_counter() - start
+            BANK_LATENCY.observe(elapsed, bank_name, method)
+            breaker.record(e, elapsed, timeout)
+            self.channels.release(bank_name, sub, e)
+            tracing.end(span, status=e.code().name)
+            raise
+        elapsed = time.perf_counter() - start
+        BANK_LATENCY.observe(elapsed, bank_name, method)
+        breaker.record(None, elapsed)
+        tracing.end(span, status="OK")
+        self.channels.release(bank_name, sub)
+        return response
+
+    async def RegisterAccount(self, request, context):
+        try:
+            return await self._call(request.bank_name, "RegisterAccount", request,
+                                    self._budget(context, "RegisterAccount").remaining(), service="auth")
+        except CircuitOpenError as e:
+            await context.abort(e.code(), e.details())
+
+    async def Login(self, request, context):
+        if request.bank_name not in self.channels:
+            return auth_pb2.LoginResponse(message="Bank not found")
+        try:
+            response = await self._call(request.bank_name, "LoginAccount", request,
+                                        self._budget(context, "Login").remaining(), service="auth")
+            return session_login(self.tokens, request.bank_name, response)
+        except CircuitOpenError as e:
+            await context.abort(e.code(), e.details())
+
+    async def HealthCheck(self, request, context):
+        return health_response(self.breakers, balance_cache=self.balance_cache)
+
+    async def GetBalance(self, request, context):
+        if request.bank_name not in self.channels:
+            return bank_pb2.BalanceResponse(balance=0, error=True, message="No bank found")
+        key = request.key
+        if self.tokens is not None:
+            try:
+                key = self.tokens.authorize(request.key, request.bank_name, request.number).bank_key
+            except InvalidToken as e:
+                return bank_pb2.BalanceResponse(balance=0, error=True, message=str(e))
+        bank_request = bank_pb2.Account(
+            number=request.number,
+            bank_name=request.bank_name,
+            key=key
+        )
+        if self.balance_cache is not None:
+            balance = self.balance_cache.get(request.bank_name, request.number, key)
+            if balance is not None:
+                return bank_pb2.BalanceResponse(balance=balance, error=False)
+        asked_at = time.monotonic()
+        try:
+            response = await self._call(request.bank_name, "GetBalance", bank_request,
+                                        self._budget(context, "GetBalance").remaining())
+        except grpc.RpcError as e:
+            return bank_pb2.BalanceResponse(balance=0, error=True, message=e.details())
+        if self.balance_cache is not None and not response.error:
+            self.balance_cache.put(request.bank_name, request.number, key, response.balance, asked_at)
+        return response
+
+    async def ProcessBank(self, request, context):
+        return await self._pay(request, self._budget(context, "ProcessBank"))
+
+    async def PaymentStream(self, request_iterator, context):
+        # Payments run as tasks and are yielded as they finish; at most
+        # STREAM_WINDOW are unsettled before the stream stops being read.
+        results = asyncio.Queue()
+        window = asyncio.Semaphore(STREAM_WINDOW)
+
+        async def settle(request, budget):
+            try:
+                response = await self._pay(request, budget)
+            except Exception as e:
+                logger.error(f"Stream payment {request.id} failed: {e}")
+                response = gateway_pb2.TransactionResponse(success=False, message="Some Issue")
+            finally:
+                window.release()
+            results.put_nowait(payment_result(request, response))
+
+        async def read():
+            pending = set()
+            try:
+                async for request in request_iterator:
+                    budget = self._budget(context, "ProcessBank")
+                    await window.acquire()
+                    task = asyncio.create_task(settle(request, budget))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            except grpc.RpcError:
+                pass  # the client went away; finish what was accepted
+            finally:
+                if pending:
+                    await asyncio.wait(pending)
+                results.put_nowait(None)
+
+        reader = asyncio.create_task(read())
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield result
+        await reader
+
+    async def _pay(self, request, budget):
+        with self.channels.pinned([request.from_bank, request.to_bank]):
+            return await self._settle_payment(request, budget)
+
+    async def _settle_payment(self, request, budget):
+        if request.from_bank not in self.channels or request.to_bank not in self.channels:
+            return gateway_pb2.TransactionResponse(success=False, message="Bank not found")
+        if request.amount <= 0:
+            return gateway_pb2.TransactionResponse(success=False, message="Cannot send negative values")
+        unauthorized = payer_error(self.tokens, request)
+        if unauthorized:
+            return gateway_pb2.TransactionResponse(success=False, message=unauthorized)
+        if request.from_bank == request.to_bank:
+            involved_banks = [request.from_bank]
+        else:
+            involved_banks = [request.from_bank, request.to_bank]
+        for bank_name in involved_banks:
+            if not self.breakers[bank_name].available():
+                return gateway_pb2.TransactionResponse(success=False, message=CircuitOpenError(bank_name).details())
+        if request.id:
+            record = self.transactions.begin(request.id)
+            if record is not None:
+                return replay_response(record)
+        waiting = time.perf_counter()
+        async with self.inflight:
+            tracing.record("admission", time.perf_counter() - waiting)
+            # Waiting for a slot uses up the budget too.
+            if budget.expired():
+                state, response = None, gateway_pb2.TransactionResponse(success=False, message="Deadline exceeded")
+            elif len(involved_banks) == 1:
+                state, response = await self._local_transfer(request, budget)
+            else:
+                INFLIGHT_2PC.inc()
+                try:
+                    state, response = await self._two_phase_commit(request, involved_banks, budget)
+                finally:
+                    INFLIGHT_2PC.dec()
+        invalidate_balances(self.balance_cache, [request])
+        await asyncio.to_thread(record_outcome, self.transactions, request, state, response)
+        return response
+
+    async def ProcessBatch(self, request, context):
+        with self.channels.pinned([bank_name for txn in request.transactions for bank_name in participants_of(txn)]):
+            return await self._process_batch(request, context)
+
+    async def _process_batch(self, request, context):
+        budget = self._budget(context, "ProcessBatch")
+        responses, local, cross = plan_batch(request.transactions, self.channels, self.transactions, self.tokens)
+        outcomes = []
+        async with self.inflight:
+            phase_start = time.perf_counter()
+            transfers = asyncio.ensure_future(self._batch_call({
+                (bank_name, "TransferBatch"): [txn for _, txn in items] for bank_name, items in local.items()
+            }, "success", budget.remaining()))
+            if cross:
+                INFLIGHT_2PC.inc(amount=len(cross))
+                try:
+                    decided = await self._batch_two_phase_commit([txn for _, txn in cross], budget)
+                finally:
+                    INFLIGHT_2PC.dec(amount=len(cross))
+                for index, txn in cross:
+                    state, responses[index] = decided[txn.id]
+                    outcomes.append((txn, state, responses[index]))
+            applied = await transfers
+            if local:
+                PHASE_LATENCY.observe(time.perf_counter() - phase_start, "transfer")
+        for bank_name, items in local.items():
+            for index, txn in items:
+                state, responses[index] = transfer_outcome(applied[(bank_name, txn.id)])
+                outcomes.append((txn, state, responses[index]))
+        invalidate_balances(self.balance_cache, [txn for txn, _, _ in outcomes])
+        await asyncio.to_thread(record_outcomes, self.transactions, outcomes)
+        return batch_response(request.transactions, responses)
+
+    async def _batch_two_phase_commit(self, txns, budget):
+        if not await self._log_durably(self.coordinator_log.begin_many if self.coordinator_log else None,
+                                       [(txn, participants_of(txn)) for txn in txns]):
+            return {
+                txn.id: (None, gateway_pb2.TransactionResponse(success=False, message="Gateway cannot record transactions"))
+                for txn in txns
+            }
+
+        phase_start = time.perf_counter()
+        votes = await self._batch_call(group_by_bank(txns, "PrepareBatch"), "can_commit",
+                                      budget.prepare_timeout())
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "prepare")
+        commit_ids, abort_ids, failed_ids = tally_votes(txns, votes)
+        if commit_ids and not await self._log_durably(
+                self.coordinator_log.decide_many if self.coordinator_log else None, commit_ids, COMMIT):
+            abort_ids += commit_ids
+            failed_ids.update(commit_ids)
+            commit_ids = []
+        if abort_ids:
+            await self._log_durably(self.coordinator_log.decide_many if self.coordinator_log else None,
+                                    abort_ids, ABORT)
+
+        phase_start = time.perf_counter()
+        commit_ids = set(commit_ids)
+        acks = await self._batch_call(phase_two_work(txns, commit_ids), "success",
+                                     budget.commit_timeout())
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "commit")
+        outcomes, ended = batch_outcomes(txns, commit_ids, failed_ids, acks)
+        if ended:
+            await self._log_durably(self.coordinator_log.end_many if self.coordinator_log else None, ended)
+        return outcomes
+
+    async def _batch_call(self, work, field, timeout):
+        jobs = []
+        for (bank_name, method), txns in work.items():
+            for chunk in chunked(txns, MAX_BANK_BATCH):
+                call = self._call(bank_name, method, bank_pb2.TransactionBatch(transactions=chunk), timeout)
+                jobs.append((bank_name, method, chunk, call))
+        replies = await asyncio.gather(*(call for _, _, _, call in jobs), return_exceptions=True)
+        results = {}
+        for (bank_name, method, chunk, _), reply in zip(jobs, replies):
+            if isinstance(reply, BaseException):
+                logger.error(f"{method} to {bank_name} failed: {reply}")
+                flags = [None] * len(chunk)
+            else:
+                flags = list(getattr(reply, field))
+            for txn, flag in zip(chunk, flags):
+                results[(bank_name, txn.id)] = flag
+        return results
+
+    async def _local_transfer(self, request, budget):
+        phase_start = time.perf_counter()
+        try:
+            response = await self._call(request.from_bank, "Transfer", request, budget.remaining())
+        except grpc.RpcError as e:
+            logger.error(f"Transfer failed at {request.from_bank}: {e.code().name}")
+            return None, gateway_pb2.TransactionResponse(success=False, message="Some Issue")
+        finally:
+            PHASE_LATENCY.observe(time.perf_counter() - phase_start, "transfer")
+        if not response.success:
+            return ABORTED, gateway_pb2.TransactionResponse(success=False, message="Invalid account, or insufficient funds, or both. ABORT!")
+        return COMMITTED, gateway_pb2.TransactionResponse(success=True, message="Payment Successful")
+
+    async def _two_phase_commit(self, request, involved_banks, budget):
+        if not await self._log_durably(self.coordinator_log.begin if self.coordinator_log else None,
+                                       request, involved_banks):
+            return None, gateway_pb2.TransactionResponse(success=False, message="Gateway cannot record transactions")
+
+        phase_start = time.perf_counter()
+        prepare_timeout = budget.prepare_timeout()
+        prepare_calls = {
+            asyncio.ensure_future(self._vote(bank_name, request, prepare_timeout)): bank_name
+            for bank_name in involved_banks
+        }
+        pending = set(prepare_calls)
+        declined = set()  # banks that voted NO and so hold nothing
+        prepared_ = True
+        failed = False
+        deadline = time.monotonic() + prepare_timeout
+        while pending and prepared_:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - time.monotonic()),
+                return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"Prepare timed out for transaction {request.id}")
+                prepared_ = False
+                failed = True
+                break
+            for call in done:
+                if call.exception() is not None:
+                    logger.error(f"Prepare failed at {prepare_calls[call]}: {call.exception()}")
+                    prepared_ = False
+                    failed = True
+                elif not call.result():
+                    declined.add(prepare_calls[call])
+                    prepared_ = False
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "prepare")
+
+        if prepared_:
+            with tracing.phase("decision", outcome="commit"):
+                logged = await self._log_durably(self.coordinator_log.decide if self.coordinator_log else None,
+                                                 request.id, COMMIT)
+            if not logged:
+                prepared_ = False
+                failed = True
+
+        phase_start = time.perf_counter()
+        commit_timeout = budget.commit_timeout()
+        if prepared_:
+            committed = await self._all_succeeded("Commit", involved_banks, request, commit_timeout)
+            PHASE_LATENCY.observe(time.perf_counter() - phase_start, "commit")
+            if committed:
+                await self._log_durably(self.coordinator_log.end if self.coordinator_log else None, request.id)
+            if not committed:
+                return COMMITTED, gateway_pb2.TransactionResponse(success=False, message="Commit Failed")
+            return COMMITTED, gateway_pb2.TransactionResponse(success=True, message="Payment Successful")
+
+        with tracing.phase("decision", outcome="abort"):
+            await self._log_durably(self.coordinator_log.decide if self.coordinator_log else None,
+                                    request.id, ABORT)
+        settlement = AbortSettlement(len(pending) + 1)
+        self.channels.pin([prepare_calls[call] for call in pending])
+        for call in pending:
+            call.add_done_callback(
+                lambda call, bank_name=prepare_calls[call]: self._abort_late_vote(bank_name, call, request, settlement))
+        # Banks that voted NO hold nothing; the others voted YES or failed to answer.
+        holders = [bank_name for call, bank_name in prepare_calls.items()
+                   if call not in pending and bank_name not in declined]
+        # An Abort that finds nothing prepared is fine; only a missing answer leaves it in doubt.
+        if settlement.done(await self._all_answered("Abort", holders, request, commit_timeout)):
+            await self._log_durably(self.coordinator_log.end if self.coordinator_log else None, request.id)
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "abort")
+        if failed:
+            return None, gateway_pb2.TransactionResponse(success=False, message="Some Issue")
+        return ABORTED, gateway_pb2.TransactionResponse(success=False, message="Invalid account, or insufficient funds, or both. ABORT!")
+
+    async def _log_durably(self, write, *args):
+        if write is None:
+            return True
+        try:
+            await asyncio.to_thread(write, *args)
+            return True
+        except LogWriteError as e:
+            logger.error(f"Coordinator log write failed: {e}")
+            return False
+
+    async def _vote(self, bank_name, request, timeout):
+        response = await self._call(bank_name, "Prepare", request, timeout)
+        if not response.can_commit:
+            PREPARE_NO_VOTES.inc(bank_name)
+        return response.can_commit
+
+    async def _all_succeeded(self, method, bank_names, request, timeout):
+        responses = await self._gather(method, bank_names, request, timeout)
+        return all(not isinstance(r, BaseException) and r.success for r in responses)
+
+    async def _all_answered(self, method, bank_names, request, timeout):
+        responses = await self._gather(method, bank_names, request, timeout)
+        return not any(isinstance(r, BaseException) for r in responses)
+
+    async def _gather(self, method, bank_names, request, timeout):
+        calls = [self._call(bank_name, method, request, timeout) for bank_name in bank_names]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    def _settle_abort(self, settlement, txn_id, settled):
+        # Called back from a late vote or Abort, so the END is written off the loop in a task.
+        if settlement.done(settled) and self.coordinator_log:
+            task = asyncio.ensure_future(self._log_durably(self.coordinator_log.end, txn_id))
+            self.background.add(task)
+            task.add_done_callback(self.background.discard)
+
+    def _abort_late_vote(self, bank_name, call, request, settlement):
+        try:
+            if call.cancelled() or call.exception() is not None:
+                # Unknown whether the bank holds anything; recovery aborts it.
+                self._settle_abort(settlement, request.id, False)
+            elif not call.result():
+                self._settle_abort(settlement, request.id, True)
+            else:
+                logger.info(f"{bank_name} voted YES after the decision, aborting")
+                abort = asyncio.ensure_future(self.channels.bank(bank_name).Abort(request, timeout=self.timeouts["ProcessBank"]))
+                abort.add_done_callback(lambda abort: self._settle_abort(
+                    settlement, request.id, not abort.cancelled() and abort.exception() is None))
+        finally:
+            self.channels.unpin([bank_name])
+
+
+async def serve(port, subchannels=DEFAULT_SUBCHANNELS, bank_tls=False, max_inflight=DEFAULT_MAX_INFLIGHT,
+                timeouts=None, banks_path=BANK_REGISTRY, balance_cache=None, session_ttl=SESSION_TTL,
+                sample_rates=None, metrics_port=0, trace_file=None, rate_limits=None):
+    configure_logging()
+    cert_dir = os.path.join(os.getcwd(), "certs")
+    tokens = SessionTokens(load_secret(os.path.join(cert_dir, DEFAULT_SECRET_FILE)), session_ttl)
+    interceptors = [AsyncMetricsInterceptor(RPC_LATENCY, RPC_ERRORS),
+                    AsyncRateLimitInterceptor(RateLimiter(rate_limits))]
+    if trace_file:
+        tracer = tracing.Tracer("gateway", tracing.JsonlExporter(trace_file))
+        interceptors.append(tracing.AsyncTracingInterceptor(tracer, tracing.TRACED_METHODS))
+    interceptors += [AsyncLoggingInterceptor(sample_rates), AsyncAuthInterceptor(tokens)]
+    server = grpc.aio.server(interceptors=interceptors)
+    server_credentials = load_server_credentials(cert_dir)
+    default_tls = bank_tls_paths(cert_dir) if bank_tls else None
+    registry = BankRegistry(banks_path, None, default_tls, subchannels)
+    banks = load_banks(registry, subchannels, default_tls)
+    gateway_service = AsyncGatewayService(banks, max_inflight, timeouts=timeouts, balance_cache=balance_cache,
+                                          tokens=tokens)
+    await gateway_service.channels.warm_up()
+    # The registry watches from its own thread; the switch itself runs on the loop.
+    loop = asyncio.get_running_loop()
+    registry.apply = lambda configs: asyncio.run_coroutine_threadsafe(
+        gateway_service.apply_bank_config(configs), loop).result()
+    registry.watch()
+    registry.reload_on_sighup()
+    if gateway_service.coordinator_log:
+        # Recovery uses blocking batch calls; give it its own short-lived pool.
+        recovery_channels = BankChannelPool(banks)
+        await asyncio.to_thread(recover_in_doubt, gateway_service.coordinator_log,
+                                recovery_channels, gateway_service.transactions)
+        recovery_channels.close()
+    gateway_pb2_grpc.add_GatewayServiceServicer_to_server(gateway_service, server)
+    server.add_secure_port(f'[::]:{port}', server_credentials)
+    if metrics_port:
+        start_http_server(metrics_port)
+        logger.info(f"Metrics served on http://127.0.0.1:{metrics_port}/metrics")
+    print(f"Gateway server (asyncio) started on port {port}")
+    logger.info(f"Gateway came online on port {port} (asyncio, max {max_inflight} payments in flight)")
+    await server.start()
+    await server.wait_for_termination()
@@ -26,7 +26,7 @@ import auth_pb2 as auth__pb2
 import bank_pb2 as bank__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rgateway.proto\x1a\nauth.proto\x1a\nbank.proto\"\x1d\n\rhealthRequest\x12\x0c\n\x04isUp\x18\x01 \x01(\x08\"\x1c\n\x0ehealthResponse\x12\n\n\x02up\x18\x01 \x01(\x08\"3\n\x0fPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"7\n\x13TransactionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t2\xf9\x01\n\x0eGatewayService\x12-\n\x0bProcessBank\x12\x0c.Transaction\x1a\x10.PaymentResponse\x12(\n\nGetBalance\x12\x08.Account\x1a\x10.BalanceResponse\x12\x36\n\x0fRegisterAccount\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12.\n\x0bHealthCheck\x12\x0e.healthRequest\x1a\x0f.healthResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rgateway.proto\x1a\nauth.proto\x1a\nbank.proto\"\x1d\n\rhealthRequest\x12\x0c\n\x04isUp\x18\x01 \x01(\x08\"\x9a\x01\n\x0ehealthResponse\x12\n\n\x02up\x18\x01 \x01(\x08\x12\x1a\n\x05\x62\x61nks\x18\x02 \x03(\x0b\x32\x0b.BankHealth\x12\x13\n\x0bqueue_depth\x18\x03 \x01(\x05\x12\x11\n\tshed_rate\x18\x04 \x01(\x01\x12\x1a\n\x12\x62\x61lance_cache_hits\x18\x05 \x01(\x03\x12\x1c\n\x14\x62\x61lance_cache_misses\x18\x06 \x01(\x03\"F\n\nBankHealth\x12\x11\n\tbank_name\x18\x01 \x01(\t\x12\x0f\n\x07\x63ircuit\x18\x02 \x01(\t\x12\x14\n\x0c\x66\x61ilure_rate\x18\x03 \x01(\x01\"3\n\x0fPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"=\n\rPaymentResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t\"7\n\x14\x42\x61tchPaymentResponse\x12\x1f\n\x07results\x18\x01 \x03(\x0b\x32\x0e.PaymentResult\"7\n\x13TransactionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t2\xe6\x02\n\x0eGatewayService\x12-\n\x0bProcessBank\x12\x0c.Transaction\x1a\x10.PaymentResponse\x12\x38\n\x0cProcessBatch\x12\x11.TransactionBatch\x1a\x15.BatchPaymentResponse\x12\x31\n\rPaymentStream\x12\x0c.Transaction\x1a\x0e.PaymentResult(\x01\x30\x01\x12(\n\nGetBalance\x12\x08.Account\x1a\x10.BalanceResponse\x12\x36\n\x0fRegisterAccount\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12.\n\x0bHealthCheck\x12\x0e.healthRequest\x1a\x0f.healthResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,12 +35,18 @@ if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_HEALTHREQUEST']._serialized_start=41
   _globals['_HEALTHREQUEST']._serialized_end=70
-  _globals['_HEALTHRESPONSE']._serialized_start=72
-  _globals['_HEALTHRESPONSE']._serialized_end=100
-  _globals['_PAYMENTRESPONSE']._serialized_start=102
-  _globals['_PAYMENTRESPONSE']._serialized_end=153
-  _globals['_TRANSACTIONRESPONSE']._serialized_start=155
-  _globals['_TRANSACTIONRESPONSE']._serialized_end=210
-  _globals['_GATEWAYSERVICE']._serialized_start=213
-  _globals['_GATEWAYSERVICE']._serialized_end=462
+  _globals['_HEALTHRESPONSE']._serialized_start=73
+  _globals['_HEALTHRESPONSE']._serialized_end=227
+  _globals['_BANKHEALTH']._serialized_start=229
+  _globals['_BANKHEALTH']._serialized_end=299
+  _globals['_PAYMENTRESPONSE']._serialized_start=301
+  _globals['_PAYMENTRESPONSE']._serialized_end=352
+  _globals['_PAYMENTRESULT']._serialized_start=354
+  _globals['_PAYMENTRESULT']._serialized_end=415
+  _globals['_BATCHPAYMENTRESPONSE']._serialized_start=417
+  _globals['_BATCHPAYMENTRESPONSE']._serialized_end=472
+  _globals['_TRANSACTIONRESPONSE']._serialized_start=474
+  _globals['_TRANSACTIONRESPONSE']._serialized_end=529
+  _globals['_GATEWAYSERVICE']._serialized_start=532
+  _globals['_GATEWAYSERVICE']._serialized_end=890
 # @@protoc_insertion_point(module_scope)
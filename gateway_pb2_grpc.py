@@ -41,6 +41,16 @@ class GatewayServiceStub(object):
                 request_serializer=bank__pb2.Transaction.SerializeToString,
                 response_deserializer=gateway__pb2.PaymentResponse.FromString,
                 _registered_method=True)
+        self.ProcessBatch = channel.unary_unary(
+                '/GatewayService/ProcessBatch',
+                request_serializer=bank__pb2.TransactionBatch.SerializeToString,
+                response_deserializer=gateway__pb2.BatchPaymentResponse.FromString,
+                _registered_method=True)
+        self.PaymentStream = channel.stream_stream(
+                '/GatewayService/PaymentStream',
+                request_serializer=bank__pb2.Transaction.SerializeToString,
+                response_deserializer=gateway__pb2.PaymentResult.FromString,
+                _registered_method=True)
         self.GetBalance = channel.unary_unary(
                 '/GatewayService/GetBalance',
                 request_serializer=bank__pb2.Account.SerializeToString,
@@ -72,6 +82,20 @@ class GatewayServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PaymentStream(self, request_iterator, context):
+        """One long-lived stream per client: results come back as each payment
+        finishes, not in submission order, and carry the transaction id.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetBalance(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -104,6 +128,16 @@ def add_GatewayServiceServicer_to_server(servicer, server):
                     request_deserializer=bank__pb2.Transaction.FromString,
                     response_serializer=gateway__pb2.PaymentResponse.SerializeToString,
             ),
+            'ProcessBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.ProcessBatch,
+                    request_deserializer=bank__pb2.TransactionBatch.FromString,
+                    response_serializer=gateway__pb2.BatchPaymentResponse.SerializeToString,
+            ),
+            'PaymentStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.PaymentStream,
+                    request_deserializer=bank__pb2.Transaction.FromString,
+                    response_serializer=gateway__pb2.PaymentResult.SerializeToString,
+            ),
             'GetBalance': grpc.unary_unary_rpc_method_handler(
                     servicer.GetBalance,
                     request_deserializer=bank__pb2.Account.FromString,
@@ -162,6 +196,60 @@ class GatewayService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ProcessBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/GatewayService/ProcessBatch',
+            bank__pb2.TransactionBatch.SerializeToString,
+            gateway__pb2.BatchPaymentResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PaymentStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/GatewayService/PaymentStream',
+            bank__pb2.Transaction.SerializeToString,
+            gateway__pb2.PaymentResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetBalance(request,
             target,
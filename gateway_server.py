@@ -2,7 +2,6 @@ import grpc
 from concurrent import futures
 
 import bank_pb2 
-import bank_pb2_grpc
 
 import gateway_pb2 
 import gateway_pb2_grpc 
@@ -10,90 +9,63 @@ import gateway_pb2_grpc
 import logging
 
 import time
+import queue
+import threading
 
 from grpc_interceptor import ServerInterceptor
 
-import auth_pb2_grpc
 import auth_pb2
 import os
-import sys
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='gateway.log'
-)
+import argparse
+
+from idempotency import IdempotencyStore, INITIATED, COMMITTED, ABORTED, DEFAULT_LOG_PATH as IDEMPOTENCY_LOG
+from coordinator_log import CoordinatorLog, COMMIT, ABORT, DEFAULT_LOG_PATH as COORDINATOR_LOG
+from wal import LogWriteError
+from recovery import recover_in_doubt
+from bank_pool import BankChannelPool, DEFAULT_SUBCHANNELS, READ_METHODS, bank_configs, bank_tls_paths
+from bank_registry import BankRegistry, DEFAULT_CONFIG as BANK_REGISTRY
+from deadlines import Budget, load_timeouts
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from admission import AdmissionControl, AdmissionExecutor, AdmissionInterceptor, DEFAULT_MAX_QUEUE, queue_wait, untimed
+from balance_cache import BalanceCache, DEFAULT_MAX_ENTRIES as BALANCE_CACHE_SIZE
+from rate_limit import RateLimiter, RateLimitInterceptor, load_limits
+from log_pipeline import RpcLog, configure_logging, parse_sample_rates, MAX_BYTES as LOG_MAX_BYTES
+from session_tokens import (AuthInterceptor, InvalidToken, SessionTokens, DEFAULT_SECRET_FILE, load_secret,
+                            DEFAULT_TTL as SESSION_TTL)
+from metrics import Counter, Gauge, Histogram, MetricsInterceptor, start_http_server
+import tracing
+
 logger = logging.getLogger('GatewayServer')
 
+RPC_LATENCY = Histogram("gateway_rpc_seconds", "Time to serve a gateway RPC", ["method"])
+RPC_ERRORS = Counter("gateway_rpc_errors_total", "Gateway RPCs that ended with an error status", ["method", "code"])
+BANK_LATENCY = Histogram("gateway_bank_call_seconds", "Time for one call from the gateway to a bank", ["bank", "method"])
+COMMITS = Counter("gateway_commits_total", "Payments committed")
+ABORTS = Counter("gateway_aborts_total", "Payments aborted")
+PREPARE_NO_VOTES = Counter("gateway_prepare_no_votes_total", "Prepare requests a bank answered NO", ["bank"])
+PHASE_LATENCY = Histogram("gateway_2pc_phase_seconds", "Time a payment spent in one 2PC phase", ["phase"])
+INFLIGHT_2PC = Gauge("gateway_inflight_2pc", "Cross-bank payments between Prepare and their decision being settled")
+
 class LoggingInterceptor(ServerInterceptor):
-    def __init__(self):
+    """One structured log record per RPC, sampled per method; failures are always logged."""
+
+    def __init__(self, sample_rates=None):
         self.retry_attempts = {}
+        self.rpc_log = RpcLog(logger, sample_rates)
 
     def intercept(self, method, request, context, method_name):
-        # Extract client info from context
-        client_info = context.peer()  # Gets client IP and port
         method_name_str = str(method_name).split('/')[-1]
-        
-        # Log request details
-        request_info = {
-            "method": method_name_str,
-            "client": client_info,
-            "timestamp": time.time()
-        }
-        
-        # Add transaction-specific info for ProcessBank method
-        if method_name_str == "ProcessBank":
-            request_info.update({
-                "amount": request.amount,
-                "from_bank": request.from_bank,
-                "to_bank": request.to_bank
-            })
-        
-        logger.info(f"Request received: {request_info}")
-        
+        sampled = self.rpc_log.sampled(method_name_str)
+        start_time = time.perf_counter()
         try:
-            # Execute the RPC method
-            start_time = time.time()
             response = method(request, context)
-            duration = time.time() - start_time
-            
-            # Log successful response
-            response_info = {
-                "method": method_name_str,
-                "client": client_info,
-                "duration": f"{duration:.3f}s",
-                "status": grpc.StatusCode.OK.name
-            }
-            
-            if method_name_str == "ProcessBank":
-                response_info["success"] = response.success
-                response_info["message"] = response.message
-                
-            logger.info(f"Response sent: {response_info}")
-            return response
-            
-        except grpc.RpcError as e:
-            # Log error details
-            error_info = {
-                "method": method_name_str,
-                "client": client_info,
-                "error_code": e.code().name,
-                "error_message": e.details()
-            }
-            logger.error(f"RPC failed: {error_info}")
-            raise
-            
         except Exception as e:
-            # Log unexpected errors
-            error_info = {
-                "method": method_name_str,
-                "client": client_info,
-                "error_message": str(e)
-            }
-            logger.error(f"Unexpected error: {error_info}")
+            self.rpc_log.failed(method_name_str, context.peer(), e, start_time)
             raise
-            
+        if sampled:
+            self.rpc_log.completed(method_name_str, context.peer(), request, response, start_time)
+        return response
+
     def handle_retry(self, request, context, method_name):
         # Simple retry tracking (could be expanded for idempotency)
         request_id = f"{context.peer()}-{method_name}"
@@ -102,118 +74,734 @@ class LoggingInterceptor(ServerInterceptor):
         if self.retry_attempts[request_id] > 1:
             logger.warning(f"Retry attempt {self.retry_attempts[request_id]} for {request_id}")
 
+# Used when there is no bank registry file (banks.json).
+BANK_TO_IP = {
+    "bank_a": "localhost:50055",  # BankA
+    "bank_b": "localhost:50056",  # BankA
+    "bank_c": "localhost:50057",  # BankB
+    "bank_d": "localhost:50058",   # BankB
+    "bank_e": "localhost:50059"   # BankB
+}
+
+MAX_BANK_BATCH = 500  # transactions per batched message to one bank
+GATEWAY_WORKERS = 10  # threads serving requests in the thread pool gateway
+DEFAULT_MAX_INFLIGHT = 256  # concurrent payments in the asyncio gateway
+STREAM_WINDOW = 64  # payments in flight per PaymentStream before reading pauses
+STREAM_WORKERS = 32  # threads settling PaymentStream payments, shared by all streams
+MAX_STREAMS = GATEWAY_WORKERS // 2  # PaymentStreams open at once; each holds a gateway worker while open
+# Phase 2 settles holds a bank already has, so an open circuit does not stop it.
+SETTLE_METHODS = ("Commit", "Abort", "CommitBatch", "AbortBatch")
+
+
+class AbortSettlement:
+    """Tells when an aborted payment can be ENDed in the coordinator log.
+
+    The gateway's own Abort round is one part, and every vote it stopped
+    waiting for is another, settled once that vote is answered (and, if
+    it was YES, aborted). Only the last part to finish, with every part
+    settled, gets True from done(); an unanswered part leaves the payment
+    in doubt for recovery.
+    """
+
+    def __init__(self, parts):
+        self.lock = threading.Lock()
+        self.remaining = parts
+        self.settled = True
+
+    def done(self, settled):
+        with self.lock:
+            self.remaining -= 1
+            self.settled = self.settled and settled
+            return self.remaining == 0 and self.settled
+
+def replay_response(record):
+    if record.state == INITIATED:
+        return gateway_pb2.TransactionResponse(
+            success=False, message=f"Transaction {record.txn_id} is already in progress")
+    return gateway_pb2.TransactionResponse(success=record.success, message=record.message)
+
+def record_outcome(transactions, request, state, response):
+    """Store the 2PC decision for request.id; a payment that failed before
+    a decision is forgotten so the client can retry it."""
+    record_outcomes(transactions, [(request, state, response)])
+
+def record_outcomes(transactions, outcomes):
+    finished = []
+    for request, state, response in outcomes:
+        if state == COMMITTED:
+            COMMITS.inc()
+        elif state == ABORTED:
+            ABORTS.inc()
+        if not request.id:
+            continue
+        if state is None:
+            transactions.discard(request.id)
+        else:
+            finished.append((request.id, state, response.success, response.message))
+    if not finished:
+        return
+    try:
+        transactions.finish_many(finished)
+    except LogWriteError as e:
+        logger.error(f"Could not persist outcome of {len(finished)} transaction(s): {e}")
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def payer_error(tokens, txn):
+    """Why the token on `txn` may not spend from its sending account, or None if it may."""
+    if tokens is None:
+        return None
+    try:
+        tokens.authorize(txn.key, txn.from_bank, txn.from_)
+    except InvalidToken as e:
+        return str(e)
+    return None
+
+def session_login(tokens, bank_name, response):
+    """Swap the bank's account key in a successful login for a signed session token."""
+    if tokens is None or not response.key:
+        return response
+    return auth_pb2.LoginResponse(account_number=response.account_number, message=response.message,
+                                  key=tokens.issue(bank_name, response.account_number, response.key))
+
+def plan_batch(transactions, banks, store, tokens=None):
+    """Check and deduplicate a ProcessBatch request.
+
+    Returns the responses known up front (rejected or retried entries, None
+    elsewhere), the same-bank payments by bank and the cross-bank ones, each
+    as (index, transaction) pairs.
+    """
+    responses = [None] * len(transactions)
+    local = {}
+    cross = []
+    for index, txn in enumerate(transactions):
+        if not txn.id:
+            responses[index] = gateway_pb2.TransactionResponse(success=False, message="Transaction id required")
+        elif txn.from_bank not in banks or txn.to_bank not in banks:
+            responses[index] = gateway_pb2.TransactionResponse(success=False, message="Bank not found")
+        elif txn.amount <= 0:
+            responses[index] = gateway_pb2.TransactionResponse(success=False, message="Cannot send negative values")
+        elif payer_error(tokens, txn):
+            responses[index] = gateway_pb2.TransactionResponse(success=False, message=payer_error(tokens, txn))
+        else:
+            record = store.begin(txn.id)
+            if record is not None:
+                responses[index] = replay_response(record)
+            elif txn.from_bank == txn.to_bank:
+                local.setdefault(txn.from_bank, []).append((index, txn))
+            else:
+                cross.append((index, txn))
+    return responses, local, cross
+
+def transfer_outcome(applied):
+    if applied is None:
+        return None, gateway_pb2.TransactionResponse(success=False, message="Some Issue")
+    if not applied:
+        return ABORTED, gateway_pb2.TransactionResponse(success=False, message="Invalid account, or insufficient funds, or both. ABORT!")
+    return COMMITTED, gateway_pb2.TransactionResponse(success=True, message="Payment Successful")
+
+def participants_of(txn):
+    return [txn.from_bank, txn.to_bank]
+
+def group_by_bank(txns, method):
+    work = {}
+    for txn in txns:
+        for bank_name in participants_of(txn):
+            work.setdefault((bank_name, method), []).append(txn)
+    return work
+
+def tally_votes(txns, votes):
+    """Split batched Prepare votes into transactions to commit and to abort.
+
+    `votes` maps (bank_name, txn_id) to True, False or None (no answer).
+    """
+    commit_ids, abort_ids, failed_ids = [], [], set()
+    for txn in txns:
+        flags = [votes[(bank_name, txn.id)] for bank_name in participants_of(txn)]
+        for bank_name, flag in zip(participants_of(txn), flags):
+            if flag is False:
+                PREPARE_NO_VOTES.inc(bank_name)
+        if all(flags):
+            commit_ids.append(txn.id)
+        else:
+            abort_ids.append(txn.id)
+            if None in flags:
+                failed_ids.add(txn.id)
+    return commit_ids, abort_ids, failed_ids
+
+def phase_two_work(txns, commit_ids):
+    work = {}
+    for txn in txns:
+        method = "CommitBatch" if txn.id in commit_ids else "AbortBatch"
+        for bank_name in participants_of(txn):
+            work.setdefault((bank_name, method), []).append(txn)
+    return work
+
+def batch_outcomes(txns, commit_ids, failed_ids, acks):
+    """Per-transaction (state, response) after phase 2, plus the IDs every participant acknowledged."""
+    outcomes = {}
+    ended = []
+    for txn in txns:
+        flags = [acks[(bank_name, txn.id)] for bank_name in participants_of(txn)]
+        if txn.id in commit_ids:
+            if all(flags):
+                ended.append(txn.id)
+                outcomes[txn.id] = (COMMITTED, gateway_pb2.TransactionResponse(success=True, message="Payment Successful"))
+            else:
+                outcomes[txn.id] = (COMMITTED, gateway_pb2.TransactionResponse(success=False, message="Commit Failed"))
+            continue
+        # An Abort that finds nothing prepared is fine; only a missing
+        # answer leaves the transaction in doubt.
+        if None not in flags:
+            ended.append(txn.id)
+        if txn.id in failed_ids:
+            outcomes[txn.id] = (None, gateway_pb2.TransactionResponse(success=False, message="Some Issue"))
+        else:
+            outcomes[txn.id] = (ABORTED, gateway_pb2.TransactionResponse(success=False, message="Invalid account, or insufficient funds, or both. ABORT!"))
+    return outcomes, ended
+
+def load_banks(registry, subchannels, default_tls):
+    if os.path.exists(registry.path):
+        return registry.load()
+    logger.info(f"{registry.path} not found, using the built-in bank addresses")
+    return bank_configs(BANK_TO_IP, subchannels, default_tls)
+
+def refresh_breakers(breakers, channels, configs, service="bank"):
+    """Breakers for `configs`: kept for unchanged banks, new for added or moved ones."""
+    return {
+        bank_name: breakers[bank_name]
+        if bank_name in breakers and bank_name in channels.banks and channels.banks[bank_name].config == config
+        else CircuitBreaker(bank_name if service == "bank" else f"{bank_name} {service}")
+        for bank_name, config in configs.items()
+    }
+
+def keep_draining(breakers, channels, refreshed):
+    """`refreshed` plus the breakers of removed banks whose payments are still finishing."""
+    return {**{bank_name: breakers[bank_name] for bank_name in channels.draining.banks if bank_name in breakers},
+            **refreshed}
+
+def health_response(breakers, admission=None, balance_cache=None):
+    banks = []
+    for bank_name, breaker in breakers.items():
+        state, failure_rate = breaker.snapshot()
+        banks.append(gateway_pb2.BankHealth(bank_name=bank_name, circuit=state, failure_rate=failure_rate))
+    queue_depth, shed_rate = admission.snapshot() if admission else (0, 0.0)
+    hits, misses = balance_cache.snapshot() if balance_cache else (0, 0)
+    return gateway_pb2.healthResponse(up=True, banks=banks, queue_depth=queue_depth, shed_rate=shed_rate,
+                                      balance_cache_hits=hits, balance_cache_misses=misses)
+
+def invalidate_balances(balance_cache, txns):
+    """Drop cached balances of the accounts on both sides of each payment.
+
+    Called whatever the outcome: a Prepare moves the sender's balance even
+    when the payment is later aborted, and a timed-out call may have
+    applied.
+    """
+    if balance_cache is not None:
+        balance_cache.invalidate(
+            [(txn.from_bank, txn.from_) for txn in txns] + [(txn.to_bank, txn.to) for txn in txns])
+
+def payment_result(request, response):
+    return gateway_pb2.PaymentResult(id=request.id, success=response.success, message=response.message)
+
+
+def batch_response(transactions, responses):
+    return gateway_pb2.BatchPaymentResponse(results=[
+        gateway_pb2.PaymentResult(id=txn.id, success=response.success, message=response.message)
+        for txn, response in zip(transactions, responses)
+    ])
+
 class GatewayService(gateway_pb2_grpc.GatewayServiceServicer):
-    def __init__(self):
-        self.bank_to_ip = {
-            "bank_a": "localhost:50055",  # BankA
-            "bank_b": "localhost:50056",  # BankA
-            "bank_c": "localhost:50057",  # BankB
-            "bank_d": "localhost:50058",   # BankB
-            "bank_e": "localhost:50059"   # BankB
-        }
+    def __init__(self, banks=None, idempotency_log=IDEMPOTENCY_LOG, coordinator_log=COORDINATOR_LOG,
+                 timeouts=None, balance_cache=None, tokens=None):
+        banks = banks or bank_configs(BANK_TO_IP)
+        self.timeouts = timeouts or load_timeouts()
+        self.channels = BankChannelPool(banks)
+        self.breakers = {bank_name: CircuitBreaker(bank_name) for bank_name in banks}
+        # Logins queue behind the bank's password hashing; keep them off the payment circuit.
+        self.auth_breakers = {bank_name: CircuitBreaker(f"{bank_name} auth") for bank_name in banks}
+        self.admission = None
+        self.balance_cache = balance_cache
+        self.tokens = tokens
+        self.transactions = IdempotencyStore(idempotency_log)
+        self.coordinator_log = CoordinatorLog(coordinator_log) if coordinator_log else None
+        self.stream_workers = futures.ThreadPoolExecutor(max_workers=STREAM_WORKERS)
+        self.streams = threading.BoundedSemaphore(MAX_STREAMS)
+
+    def apply_bank_config(self, configs):
+        """Switch to a new set of banks without disturbing payments in flight.
+
+        Breakers for every bank in `configs` are in place before the
+        channels switch, and those of removed banks go after, except for
+        banks that payments in flight still have to settle with.
+        """
+        breakers = refresh_breakers(self.breakers, self.channels, configs)
+        auth_breakers = refresh_breakers(self.auth_breakers, self.channels, configs, service="auth")
+        self.breakers = {**self.breakers, **breakers}
+        self.auth_breakers = {**self.auth_breakers, **auth_breakers}
+        self.channels.reload(configs)
+        self.breakers = keep_draining(self.breakers, self.channels, breakers)
+        self.auth_breakers = keep_draining(self.auth_breakers, self.channels, auth_breakers)
+
+    def _call(self, bank_name, method, request, service="bank", timeout=None):
+        timeout = self.channels.timeout(bank_name, timeout)
+        breaker = (self.breakers if service == "bank" else self.auth_breakers)[bank_name]
+        if method not in SETTLE_METHODS and not breaker.allow():
+            raise CircuitOpenError(bank_name)
+        sub = self.channels.acquire(bank_name, read=method in READ_METHODS)
+        stub = sub.bank if service == "bank" else sub.auth
+        span = tracing.child(method, bank=bank_name)
+        start = time.perf_counter()
+        try:
+            response = getattr(stub, method)(request, timeout=timeout, metadata=tracing.metadata(span))
+        except grpc.RpcError as e:
+            elapsed = time.perf_counter() - start
+            BANK_LATENCY.observe(elapsed, bank_name, method)
+            breaker.record(e, elapsed, timeout)
+            self.channels.release(bank_name, sub, e)
+            tracing.end(span, status=e.code().name)
+            raise
+        elapsed = time.perf_counter() - start
+        BANK_LATENCY.observe(elapsed, bank_name, method)
+        breaker.record(None, elapsed)
+        tracing.end(span, status="OK")
+        self.channels.release(bank_name, sub)
+        return response
+
+    def _start(self, bank_name, method, request, timeout):
+        """Start `method` at a bank without blocking; returns the call's future.
+
+        The breaker and the endpoint record how the call ends. If the
+        circuit is open the future has already failed with CircuitOpenError.
+        """
+        breaker = self.breakers[bank_name]
+        if method not in SETTLE_METHODS and not breaker.allow():
+            call = futures.Future()
+            call.set_exception(CircuitOpenError(bank_name))
+            return call
+        sub = self.channels.acquire(bank_name)
+        span = tracing.child(method, bank=bank_name)
+        start = time.perf_counter()
+        timeout = self.channels.timeout(bank_name, timeout)
+        call = getattr(sub.bank, method).future(request, timeout=timeout, metadata=tracing.metadata(span))
+
+        def finished(call):
+            elapsed = time.perf_counter() - start
+            BANK_LATENCY.observe(elapsed, bank_name, method)
+            breaker.record(call.exception(), elapsed, timeout)
+            self.channels.release(bank_name, sub, call.exception())
+            tracing.end(span, status=call.code().name)
+
+        call.add_done_callback(finished)
+        return call
+
+    def _budget(self, context, method):
+        return Budget.from_context(context, self.timeouts[method])
 
     def RegisterAccount(self,request,context):
-        bank_address = self.bank_to_ip[request.bank_name]  # Hardcoded for simplicity
-        with grpc.insecure_channel(bank_address) as channel:
-            auth_stub = auth_pb2_grpc.AuthServiceStub(channel)
-            response = auth_stub.RegisterAccount(request)
-            return response
+        try:
+            return self._call(request.bank_name, "RegisterAccount", request, service="auth",
+                              timeout=self._budget(context, "RegisterAccount").remaining())
+        except CircuitOpenError as e:
+            context.abort(e.code(), e.details())
     def Login(self,request,context):
-        if request.bank_name not in self.bank_to_ip:
+        if request.bank_name not in self.channels:
           return auth_pb2.LoginResponse(message="Bank not found")
-        bank_address = self.bank_to_ip[request.bank_name]  # Hardcoded for simplicity
-        with grpc.insecure_channel(bank_address) as channel:
-            auth_stub = auth_pb2_grpc.AuthServiceStub(channel)
-            response = auth_stub.LoginAccount(request)
-            return response
+        try:
+            response = self._call(request.bank_name, "LoginAccount", request, service="auth",
+                                  timeout=self._budget(context, "Login").remaining())
+            return session_login(self.tokens, request.bank_name, response)
+        except CircuitOpenError as e:
+            context.abort(e.code(), e.details())
 
     def HealthCheck(self,request,context):
-        return gateway_pb2.HealthCheck(up=True)
+        return health_response(self.breakers, self.admission, self.balance_cache)
     def GetBalance(self,request,context):
-        if request.bank_name in self.bank_to_ip:
-            bank_address=self.bank_to_ip[request.bank_name]
-        else:
+        if request.bank_name not in self.channels:
             return bank_pb2.BalanceResponse(balance=0,error=True,message="No bank found")
-        # bank_address="localhost:50055"
-        # print("Called")
-
-        with grpc.insecure_channel(bank_address) as channel:
-            bank_stub=bank_pb2_grpc.BankServiceStub(channel)
-            # bank_request=bank_pb2.Account(number=request.number)
-            
-            bank_request = bank_pb2.Account(
-              number=request.number,
-              bank_name=request.bank_name,
-              key=request.key
-            )
-            print("Sending message 0") 
+        key = request.key
+        if self.tokens is not None:
+            # The bank still checks its own key, which the token carries.
             try:
-              print("Sending message 1")
-              bank_response = bank_stub.GetBalance(bank_request)
-              return bank_response
-            except grpc.RpcError as e:
-              return bank_pb2.BalanceResponse(balance=0, error=True, message=e.details())
-            # bank_response=bank_stub.GetBalance(request)
-            # return bank_pb2.BalanceResponse(balance=bank_response.balance,error=False)
+                key = self.tokens.authorize(request.key, request.bank_name, request.number).bank_key
+            except InvalidToken as e:
+                return bank_pb2.BalanceResponse(balance=0, error=True, message=str(e))
+
+        bank_request = bank_pb2.Account(
+          number=request.number,
+          bank_name=request.bank_name,
+          key=key
+        )
+        if self.balance_cache is not None:
+            balance = self.balance_cache.get(request.bank_name, request.number, key)
+            if balance is not None:
+                return bank_pb2.BalanceResponse(balance=balance, error=False)
+        asked_at = time.monotonic()
+        try:
+          response = self._call(request.bank_name, "GetBalance", bank_request,
+                                timeout=self._budget(context, "GetBalance").remaining())
+        except grpc.RpcError as e:
+          return bank_pb2.BalanceResponse(balance=0, error=True, message=e.details())
+        if self.balance_cache is not None and not response.error:
+            self.balance_cache.put(request.bank_name, request.number, key, response.balance, asked_at)
+        return response
 
     def ProcessBank(self,request,context):
-        print("Processing payment")
-        if request.from_bank not in self.bank_to_ip or request.to_bank not in self.bank_to_ip:
+        return self._pay(request, self._budget(context, "ProcessBank"))
+
+    def PaymentStream(self, request_iterator, context):
+        # A reader thread pulls transactions off the stream and hands them to
+        # the worker pool; this generator sends results as they complete.
+        # Once STREAM_WINDOW payments are unsettled the reader stops pulling,
+        # so HTTP/2 flow control pushes back on the client.
+        # The stream keeps its gateway worker until it closes, so only
+        # MAX_STREAMS may be open, leaving the rest for unary calls, and its
+        # lifetime is kept out of the service time behind retry-after hints.
+        untimed()
+        if not self.streams.acquire(blocking=False):
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many payment streams open, retry later")
+        try:
+            yield from self._stream(request_iterator, context)
+        finally:
+            self.streams.release()
+
+    def _stream(self, request_iterator, context):
+        results = queue.Queue()
+        window = threading.Semaphore(STREAM_WINDOW)
+
+        def settle(request, budget):
+            try:
+                response = self._pay(request, budget)
+            except Exception as e:
+                logger.error(f"Stream payment {request.id} failed: {e}")
+                response = gateway_pb2.TransactionResponse(success=False,message="Some Issue")
+            finally:
+                window.release()
+            results.put(payment_result(request, response))
+
+        def read():
+            try:
+                for request in request_iterator:
+                    # Each payment's budget starts when it is read, not
+                    # when the (long-lived) stream was opened.
+                    budget = self._budget(context, "ProcessBank")
+                    window.acquire()
+                    self.stream_workers.submit(settle, request, budget)
+            except grpc.RpcError:
+                pass  # the client went away; finish what was accepted
+            finally:
+                for _ in range(STREAM_WINDOW):
+                    window.acquire()
+                results.put(None)
+
+        threading.Thread(target=read, daemon=True).start()
+        while True:
+            result = results.get()
+            if result is None:
+                return
+            yield result
+
+    def _pay(self, request, budget):
+        # Pinned, a bank removed by a reload mid-payment stays reachable for
+        # its Commit or Abort.
+        with self.channels.pinned([request.from_bank, request.to_bank]):
+            return self._settle_payment(request, budget)
+
+    def _settle_payment(self, request, budget):
+        if request.from_bank not in self.channels or request.to_bank not in self.channels:
             return gateway_pb2.TransactionResponse(success=False,message="Bank not found")
-            # bank_address=self.bank_to_ip[request.bank_name]
-        # else:
-        #     return gateway_pb2.PaymentResponse(success=False,message="Gateway Down")
-        # bank_stub = bank_pb2_grpc.BankServiceStub(grpc.insecure_channel(bank_address))
-        # with grpc.insecure_channel(bank_address) as channel:
-        # bank_stub=bank_pb2_grpc.BankServiceStub(channel)
-        print("Check 1 passed")
         if request.amount<=0:
             return gateway_pb2.TransactionResponse(success=False,message="Cannot send negative values")
-        print("Check 2 passed")
-        print(request)
+        unauthorized = payer_error(self.tokens, request)
+        if unauthorized:
+            return gateway_pb2.TransactionResponse(success=False,message=unauthorized)
         if request.from_bank==request.to_bank:
-            involved_banks=[self.bank_to_ip[request.from_bank]]
-            print("Check 3 passed, same bank")
+            involved_banks=[request.from_bank]
+        else:
+            involved_banks=[request.from_bank,request.to_bank]
+        # Arguments rather than an f-string: nothing is formatted unless DEBUG is on.
+        logger.debug("Processing payment %s of %s from %s to %s", request.id, request.amount,
+                     request.from_bank, request.to_bank)
+        if budget.expired():
+            return gateway_pb2.TransactionResponse(success=False,message="Deadline exceeded")
+        # A bank known to be down fails the payment here, before anything
+        # is logged or held at the other bank.
+        for bank_name in involved_banks:
+            if not self.breakers[bank_name].available():
+                return gateway_pb2.TransactionResponse(success=False,message=CircuitOpenError(bank_name).details())
+
+        # A retried transaction ID gets the stored outcome without any bank
+        # being contacted.
+        if request.id:
+            record = self.transactions.begin(request.id)
+            if record is not None:
+                return replay_response(record)
+        if len(involved_banks) == 1:
+            state, response = self._local_transfer(request, budget)
         else:
-            involved_banks=[self.bank_to_ip[request.from_bank],self.bank_to_ip[request.to_bank]]
-            print("Check 3 passed, diff bank")
-        prepared_=True
-        print(involved_banks)
+            INFLIGHT_2PC.inc()
+            try:
+                state, response = self._two_phase_commit(request, involved_banks, budget)
+            finally:
+                INFLIGHT_2PC.dec()
+        invalidate_balances(self.balance_cache, [request])
+        record_outcome(self.transactions, request, state, response)
+        return response
+
+    def _local_transfer(self, request, budget):
+        # Both accounts live at one bank, which can apply the payment
+        # atomically on its own: one round trip and no coordinator log.
+        phase_start = time.perf_counter()
         try:
-            for bank_ip_address in involved_banks:
-                with grpc.insecure_channel(bank_ip_address) as channel:
-                    print("Channel Created")
-                    bank_stub=bank_pb2_grpc.BankServiceStub(channel)
-                    prepare_response=bank_stub.Prepare(request)
-                    if not prepare_response.can_commit:
-                        prepared_=False
-                        break
-                    else:
-                        print(f"{bank_ip_address} prepared")
-        except Exception as e:
-            print("ERROR:",e)
-            return gateway_pb2.TransactionResponse(success=False,message="Some Issue")
+            response = self._call(request.from_bank, "Transfer", request, timeout=budget.remaining())
+        except grpc.RpcError as e:
+            logger.warning("Transfer %s failed: %s", request.id, e.code().name)
+            return None, gateway_pb2.TransactionResponse(success=False,message="Some Issue")
+        finally:
+            PHASE_LATENCY.observe(time.perf_counter() - phase_start, "transfer")
+        if not response.success:
+            return ABORTED, gateway_pb2.TransactionResponse(success=False,message="Invalid account, or insufficient funds, or both. ABORT!")
+        return COMMITTED, gateway_pb2.TransactionResponse(success=True,message="Payment Successful")
+
+    def _two_phase_commit(self, request, involved_banks, budget):
+        if not self._log_durably(self.coordinator_log.begin if self.coordinator_log else None,
+                                 request, involved_banks):
+            return None, gateway_pb2.TransactionResponse(success=False,message="Gateway cannot record transactions")
+
+        # Phase 1: ask every participant at once and stop at the first NO,
+        # error or timeout instead of waiting for the remaining votes.
+        # Prepare gets a share of the budget so Commit is left the rest.
+        phase_start = time.perf_counter()
+        prepare_timeout = budget.prepare_timeout()
+        prepare_calls, votes = self._fan_out(involved_banks, "Prepare", request, prepare_timeout)
+        deadline = time.monotonic() + prepare_timeout
+        prepared_ = True
+        failed = False
+        pending = set(involved_banks)
+        declined = set()  # banks that voted NO and so hold nothing
+        while pending:
+            try:
+                bank_name, call = votes.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                logger.warning("Prepare of %s timed out waiting for %s", request.id, sorted(pending))
+                prepared_ = False
+                failed = True
+                break
+            pending.discard(bank_name)
+            if call.exception() is not None:
+                logger.warning("Prepare of %s at %s failed: %s", request.id, bank_name, call.exception())
+                prepared_ = False
+                failed = True
+                break
+            if not call.result().can_commit:
+                PREPARE_NO_VOTES.inc(bank_name)
+                declined.add(bank_name)
+                prepared_ = False
+                break
+            logger.debug("%s prepared %s", bank_name, request.id)
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "prepare")
+
+        # The commit decision must be on disk before any bank hears it, so a
+        # restarted gateway can finish the job.
         if prepared_:
-            for bank_ip_address in involved_banks:
-                with grpc.insecure_channel(bank_ip_address) as channel:
-                    bank_stub=bank_pb2_grpc.BankServiceStub(channel)
-                    commit_response=bank_stub.Commit(request)
-                    if not commit_response.success:
-                        return gateway_pb2.TransactionResponse(success=False,message="Commit Failed")
-                        # break
-            return gateway_pb2.TransactionResponse(success=True,message="Payment Successful")
-        else:
-            for bank_ip_address in involved_banks:
-                with grpc.insecure_channel(bank_ip_address) as channel:
-                    bank_stub=bank_pb2_grpc.BankServiceStub(channel)
-                    bank_stub.Abort(request)
-            return gateway_pb2.TransactionResponse(success=False,message="Invalid account, or insufficient funds, or both. ABORT!")
+            with tracing.phase("decision", outcome="commit"):
+                logged = self._log_durably(self.coordinator_log.decide if self.coordinator_log else None,
+                                           request.id, COMMIT)
+            if not logged:
+                prepared_ = False
+                failed = True
+
+        # Phase 2: Commit or Abort goes to all participants in parallel.
+        phase_start = time.perf_counter()
+        commit_timeout = budget.commit_timeout()
+        if prepared_:
+            _, acks = self._fan_out(involved_banks, "Commit", request, commit_timeout)
+            committed = self._all_succeeded(acks, len(involved_banks), commit_timeout)
+            PHASE_LATENCY.observe(time.perf_counter() - phase_start, "commit")
+            if committed and self.coordinator_log:
+                self.coordinator_log.end(request.id)
+            if not committed:
+                return COMMITTED, gateway_pb2.TransactionResponse(success=False,message="Commit Failed")
+            return COMMITTED, gateway_pb2.TransactionResponse(success=True,message="Payment Successful")
+
+        if self.coordinator_log:
+            with tracing.phase("decision", outcome="abort"):
+                self.coordinator_log.decide(request.id, ABORT)
+        # A vote we stopped waiting for may still come back YES; abort that
+        # bank as soon as it does so its funds are not left on hold.
+        settlement = AbortSettlement(len(pending) + 1)
+        self.channels.pin(pending)
+        for bank_name in pending:
+            prepare_calls[bank_name].add_done_callback(
+                lambda call, bank_name=bank_name: self._abort_late_vote(bank_name, call, request, settlement))
+        # Banks that voted NO hold nothing; the others voted YES or failed to answer.
+        holders = [bank_name for bank_name in involved_banks if bank_name not in pending and bank_name not in declined]
+        _, acks = self._fan_out(holders, "Abort", request, commit_timeout)
+        # An Abort that finds nothing prepared is fine; only a missing answer leaves it in doubt.
+        self._settle_abort(settlement, request.id, self._all_answered(acks, len(holders), commit_timeout))
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "abort")
+        if failed:
+            return None, gateway_pb2.TransactionResponse(success=False,message="Some Issue")
+        return ABORTED, gateway_pb2.TransactionResponse(success=False,message="Invalid account, or insufficient funds, or both. ABORT!")
+
+    def ProcessBatch(self, request, context):
+        with self.channels.pinned([bank_name for txn in request.transactions for bank_name in participants_of(txn)]):
+            return self._process_batch(request, context)
+
+    def _process_batch(self, request, context):
+        budget = self._budget(context, "ProcessBatch")
+        responses, local, cross = plan_batch(request.transactions, self.channels, self.transactions, self.tokens)
+        outcomes = []
+
+        # Same-bank payments go out as one TransferBatch per bank while the
+        # cross-bank ones run through batched 2PC.
+        phase_start = time.perf_counter()
+        transfers = self._start_batch({
+            (bank_name, "TransferBatch"): [txn for _, txn in items] for bank_name, items in local.items()
+        }, budget.remaining())
+        if cross:
+            INFLIGHT_2PC.inc(amount=len(cross))
+            try:
+                decided = self._batch_two_phase_commit([txn for _, txn in cross], budget)
+            finally:
+                INFLIGHT_2PC.dec(amount=len(cross))
+            for index, txn in cross:
+                state, responses[index] = decided[txn.id]
+                outcomes.append((txn, state, responses[index]))
+        if local:
+            applied = self._collect_batch(transfers, "success")
+            PHASE_LATENCY.observe(time.perf_counter() - phase_start, "transfer")
+            for bank_name, items in local.items():
+                for index, txn in items:
+                    state, responses[index] = transfer_outcome(applied[(bank_name, txn.id)])
+                    outcomes.append((txn, state, responses[index]))
+
+        invalidate_balances(self.balance_cache, [txn for txn, _, _ in outcomes])
+        record_outcomes(self.transactions, outcomes)
+        return batch_response(request.transactions, responses)
+
+    def _batch_two_phase_commit(self, txns, budget):
+        """2PC for many cross-bank payments: one batched message per bank and phase."""
+        if not self._log_durably(self.coordinator_log.begin_many if self.coordinator_log else None,
+                                 [(txn, participants_of(txn)) for txn in txns]):
+            return {
+                txn.id: (None, gateway_pb2.TransactionResponse(success=False, message="Gateway cannot record transactions"))
+                for txn in txns
+            }
+
+        phase_start = time.perf_counter()
+        votes = self._collect_batch(self._start_batch(group_by_bank(txns, "PrepareBatch"),
+                                                    budget.prepare_timeout()), "can_commit")
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "prepare")
+        commit_ids, abort_ids, failed_ids = tally_votes(txns, votes)
+        if commit_ids and not self._log_durably(
+                self.coordinator_log.decide_many if self.coordinator_log else None, commit_ids, COMMIT):
+            abort_ids += commit_ids
+            failed_ids.update(commit_ids)
+            commit_ids = []
+        if self.coordinator_log:
+            self.coordinator_log.decide_many(abort_ids, ABORT)
+
+        phase_start = time.perf_counter()
+        commit_ids = set(commit_ids)
+        acks = self._collect_batch(self._start_batch(phase_two_work(txns, commit_ids),
+                                                   budget.commit_timeout()), "success")
+        PHASE_LATENCY.observe(time.perf_counter() - phase_start, "commit")
+        outcomes, ended = batch_outcomes(txns, commit_ids, failed_ids, acks)
+        if self.coordinator_log:
+            self.coordinator_log.end_many(ended)
+        return outcomes
+
+    def _start_batch(self, work, timeout):
+        """Send each (bank, method) its transactions as TransactionBatch messages, without waiting."""
+        calls = []
+        for (bank_name, method), txns in work.items():
+            for chunk in chunked(txns, MAX_BANK_BATCH):
+                call = self._start(bank_name, method,
+                                   bank_pb2.TransactionBatch(transactions=chunk), timeout)
+                calls.append((bank_name, method, chunk, call))
+        return calls
+
+    def _collect_batch(self, calls, field):
+        """Wait for batched calls; map (bank_name, txn_id) to the bank's flag, or None if it did not answer."""
+        results = {}
+        for bank_name, method, chunk, call in calls:
+            try:
+                flags = list(getattr(call.result(), field))
+            except grpc.RpcError as e:
+                logger.warning("%s to %s failed: %s", method, bank_name, e.code().name)
+                flags = [None] * len(chunk)
+            for txn, flag in zip(chunk, flags):
+                results[(bank_name, txn.id)] = flag
+        return results
+
+    def _log_durably(self, write, *args):
+        if write is None:
+            return True
+        try:
+            write(*args)
+            return True
+        except LogWriteError as e:
+            logger.error(f"Coordinator log write failed: {e}")
+            return False
+
+    def _fan_out(self, bank_names, method, request, timeout):
+        """Start `method` on every bank without blocking.
+
+        Returns the in-flight calls by bank and a queue that receives
+        (bank_name, call) as each one completes.
+        """
+        done = queue.Queue()
+        calls = {}
+        for bank_name in bank_names:
+            call = self._start(bank_name, method, request, timeout)
+            calls[bank_name] = call
+            call.add_done_callback(lambda call, bank_name=bank_name: done.put((bank_name, call)))
+        return calls, done
+
+    def _all_succeeded(self, acks, count, timeout):
+        return self._all_acknowledged(acks, count, timeout, lambda response: response.success)
+
+    def _all_answered(self, acks, count, timeout):
+        return self._all_acknowledged(acks, count, timeout, lambda response: True)
+
+    def _all_acknowledged(self, acks, count, timeout, accepted):
+        ok = True
+        deadline = time.monotonic() + timeout
+        for _ in range(count):
+            try:
+                bank_name, call = acks.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return False
+            if call.exception() is not None or not accepted(call.result()):
+                logger.warning("%s did not acknowledge", bank_name)
+                ok = False
+        return ok
+
+    def _settle_abort(self, settlement, txn_id, settled):
+        if settlement.done(settled) and self.coordinator_log:
+            self.coordinator_log.end(txn_id)
+
+    def _abort_late_vote(self, bank_name, call, request, settlement):
+        try:
+            if call.exception() is not None:
+                # Unknown whether the bank holds anything; recovery aborts it.
+                self._settle_abort(settlement, request.id, False)
+            elif not call.result().can_commit:
+                self._settle_abort(settlement, request.id, True)
+            else:
+                logger.warning("%s voted YES after the decision, aborting", bank_name)
+                abort = self.channels.get(bank_name).bank.Abort.future(request, timeout=self.timeouts["ProcessBank"])
+                abort.add_done_callback(
+                    lambda abort: self._settle_abort(settlement, request.id, abort.exception() is None))
+        finally:
+            self.channels.unpin([bank_name])
         
             
         
-def serve(port):
-    server=grpc.server(futures.ThreadPoolExecutor(max_workers=10),interceptors=[LoggingInterceptor()])
-    cert_dir = os.path.join(os.getcwd(), "certs")
+def load_server_credentials(cert_dir):
     with open(os.path.join(cert_dir, "gateway.key"), 'rb') as f:
         private_key = f.read()
     with open(os.path.join(cert_dir, "gateway.crt"), 'rb') as f:
@@ -221,13 +809,56 @@ def serve(port):
     with open(os.path.join(cert_dir, "ca.crt"), 'rb') as f:
         root_certificates = f.read()
 
-    server_credentials = grpc.ssl_server_credentials(
+    return grpc.ssl_server_credentials(
         private_key_certificate_chain_pairs=[(private_key, certificate_chain)],
         root_certificates=root_certificates,
         require_client_auth=True
     )
-    gateway_pb2_grpc.add_GatewayServiceServicer_to_server(GatewayService(),server)
+
+def serve(port, subchannels=DEFAULT_SUBCHANNELS, bank_tls=False, timeouts=None, max_queue=DEFAULT_MAX_QUEUE,
+          banks_path=BANK_REGISTRY, balance_cache=None, session_ttl=SESSION_TTL, sample_rates=None, metrics_port=0,
+          trace_file=None, rate_limits=None):
+    # Log records go through a queue to a writer thread (a no-op if the
+    # command line already set this up).
+    configure_logging()
+    # Requests beyond the admission queue are rejected up front with a
+    # retry-after hint instead of waiting behind the ones already queued.
+    admission = AdmissionControl(GATEWAY_WORKERS, max_queue)
+    cert_dir = os.path.join(os.getcwd(), "certs")
+    # Session tokens are checked here, so a bad one never costs a bank call.
+    tokens = SessionTokens(load_secret(os.path.join(cert_dir, DEFAULT_SECRET_FILE)), session_ttl)
+    # One client cannot use up the workers: each gets its own token bucket per method.
+    interceptors = [MetricsInterceptor(RPC_LATENCY, RPC_ERRORS), AdmissionInterceptor(admission),
+                    RateLimitInterceptor(RateLimiter(rate_limits))]
+    if trace_file:
+        # Every payment becomes a trace; the banks add their spans to it.
+        tracer = tracing.Tracer("gateway", tracing.JsonlExporter(trace_file))
+        interceptors.append(tracing.TracingInterceptor(tracer, tracing.TRACED_METHODS, queued=queue_wait))
+    interceptors += [LoggingInterceptor(sample_rates), AuthInterceptor(tokens)]
+    server=grpc.server(AdmissionExecutor(admission, GATEWAY_WORKERS), interceptors=interceptors)
+    server_credentials = load_server_credentials(cert_dir)
+    default_tls = bank_tls_paths(cert_dir) if bank_tls else None
+    registry = BankRegistry(banks_path, None, default_tls, subchannels)
+    gateway_service = GatewayService(load_banks(registry, subchannels, default_tls), timeouts=timeouts,
+                                     balance_cache=balance_cache, tokens=tokens)
+    gateway_service.admission = admission
+    # Bank changes in the registry file (or a SIGHUP) apply while serving.
+    registry.apply = gateway_service.apply_bank_config
+    registry.watch()
+    registry.reload_on_sighup()
+    # Connect to every bank before taking traffic so the first payment
+    # does not pay for the handshakes.
+    gateway_service.channels.warm_up()
+    # Settle whatever a previous run left prepared at the banks before new
+    # payments can touch the same accounts.
+    if gateway_service.coordinator_log:
+        recover_in_doubt(gateway_service.coordinator_log, gateway_service.channels,
+                         gateway_service.transactions)
+    gateway_pb2_grpc.add_GatewayServiceServicer_to_server(gateway_service,server)
     server.add_secure_port(f'[::]:{port}',server_credentials)
+    if metrics_port:
+        start_http_server(metrics_port)
+        logger.info(f"Metrics served on http://127.0.0.1:{metrics_port}/metrics")
     # server.add_insecure_port(f'[::]:{port}')
     print(f"Gateway server started on port {port}")
     logger.info(f"Gateway came online on port {port}")
@@ -235,9 +866,60 @@ def serve(port):
     server.wait_for_termination()
 
 if __name__=="__main__":
-    if len(sys.argv)!=2:
-        print("Usage issue")
-        sys.exit(1)
-    port=sys.argv[1]
-    serve(port)
+    parser = argparse.ArgumentParser(description="Payment gateway server")
+    parser.add_argument("port")
+    parser.add_argument("--banks", default=BANK_REGISTRY,
+                        help="bank registry file, reloaded on change or SIGHUP (default banks.json)")
+    parser.add_argument("--bank-channels", type=int, default=DEFAULT_SUBCHANNELS,
+                        help="number of pooled channels kept open to each bank")
+    parser.add_argument("--bank-tls", action="store_true",
+                        help="use mTLS to reach banks (bank_server_with_logger)")
+    parser.add_argument("--aio", action="store_true",
+                        help="run the asyncio (grpc.aio) gateway instead of the thread pool one")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                        help="payments processed concurrently by the asyncio gateway")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="requests the thread pool gateway queues before shedding new ones")
+    parser.add_argument("--timeout", action="append", default=[], metavar="METHOD=SECONDS",
+                        help="time limit for one gateway method, e.g. ProcessBank=5 (repeatable)")
+    parser.add_argument("--balance-cache-ttl", type=float, default=0,
+                        help="seconds GetBalance answers are cached at the gateway (default 0, no cache)")
+    parser.add_argument("--balance-cache-size", type=int, default=BALANCE_CACHE_SIZE,
+                        help="accounts the balance cache holds before evicting the least recently used")
+    parser.add_argument("--session-ttl", type=float, default=SESSION_TTL,
+                        help="seconds a session token from Login stays valid (default 3600)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--log-format", default="json", choices=["json", "text"],
+                        help="gateway.log as JSON lines (default) or plain text")
+    parser.add_argument("--log-sample", action="append", default=[], metavar="METHOD=RATE",
+                        help="fraction of successful calls to METHOD that are logged, e.g. GetBalance=0.1 (repeatable)")
+    parser.add_argument("--log-max-bytes", type=int, default=LOG_MAX_BYTES,
+                        help="size at which gateway.log is rotated into a compressed segment")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="METHOD=RATE[/BURST]",
+                        help="calls per second (and burst) one client may make to ProcessBank, GetBalance or Login, "
+                             "e.g. Login=2/5; payments in a ProcessBatch or on a PaymentStream count against "
+                             "ProcessBank; 0 turns the limit off (repeatable)")
+    parser.add_argument("--trace", nargs="?", const=tracing.DEFAULT_TRACE_FILE, metavar="FILE",
+                        help="write a trace of every ProcessBank call to FILE (default data/gateway.trace.jsonl); "
+                             "view with trace_view.py")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (default 0, off)")
+    args = parser.parse_args()
+    try:
+        timeouts = load_timeouts(args.timeout)
+        sample_rates = parse_sample_rates(args.log_sample)
+        rate_limits = load_limits(args.rate_limit)
+    except ValueError as e:
+        parser.error(str(e))
+    configure_logging(level=args.log_level, json_lines=args.log_format == "json", max_bytes=args.log_max_bytes)
+    balance_cache = BalanceCache(args.balance_cache_ttl, args.balance_cache_size) if args.balance_cache_ttl > 0 else None
+    if args.aio:
+        import asyncio
+        import gateway_aio
+        asyncio.run(gateway_aio.serve(args.port, args.bank_channels, args.bank_tls, args.max_inflight, timeouts,
+                                      args.banks, balance_cache, args.session_ttl, sample_rates,
+                                      args.metrics_port, args.trace, rate_limits))
+    else:
+        serve(args.port, args.bank_channels, args.bank_tls, timeouts, args.max_queue, args.banks, balance_cache,
+              args.session_ttl, sample_rates, args.metrics_port, args.trace, rate_limits)
         
\ No newline at end of file
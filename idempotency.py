@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from wal import GroupCommitLog, read_records
+
+logger = logging.getLogger('GatewayServer')
+
+INITIATED = "INITIATED"
+COMMITTED = "COMMITTED"
+ABORTED = "ABORTED"
+
+DEFAULT_LOG_PATH = os.path.join("data", "gateway_transactions.log")
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_TTL = 24 * 3600  # seconds a finished transaction ID is remembered
+
+
+class TransactionRecord:
+    __slots__ = ("txn_id", "state", "success", "message", "finished_at")
+
+    def __init__(self, txn_id, state, success=False, message="", finished_at=None):
+        self.txn_id = txn_id
+        self.state = state
+        self.success = success
+        self.message = message
+        self.finished_at = finished_at
+
+    def to_dict(self):
+        return {
+            "id": self.txn_id,
+            "state": self.state,
+            "success": self.success,
+            "message": self.message,
+            "ts": self.finished_at,
+        }
+
+
+class IdempotencyStore:
+    """Outcome of every payment by Transaction.id, so retries are answered locally.
+
+    Entries live in an LRU table bounded by `max_entries` and expire after
+    `ttl` seconds. Finished outcomes are appended to a log on disk and
+    replayed on startup; INITIATED entries are kept in memory only.
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.log_records = 0
+        self.log = None
+        if path:
+            self._replay()
+            self.log = GroupCommitLog(path)
+
+    def _replay(self):
+        now = time.time()
+        for item in read_records(self.path):
+            self.log_records += 1
+            if item["ts"] + self.ttl < now:
+                continue
+            self.entries[item["id"]] = TransactionRecord(
+                item["id"], item["state"], item["success"], item["message"], item["ts"])
+            self.entries.move_to_end(item["id"])
+        self._evict(now)
+        if self.entries:
+            logger.info(f"Idempotency store loaded {len(self.entries)} transactions from {self.path}")
+
+    def begin(self, txn_id):
+        """Claim `txn_id` for a new payment.
+
+        Returns None when the caller should run the payment, or the existing
+        record when the ID has been seen before.
+        """
+        now = time.time()
+        with self.lock:
+            record = self.entries.get(txn_id)
+            if record is not None:
+                if record.finished_at is None or record.finished_at + self.ttl >= now:
+                    self.entries.move_to_end(txn_id)
+                    return record
+                del self.entries[txn_id]
+            self.entries[txn_id] = TransactionRecord(txn_id, INITIATED)
+            self._evict(now)
+            return None
+
+    def finish(self, txn_id, state, success, message):
+        self.finish_many([(txn_id, state, success, message)])
+
+    def finish_many(self, outcomes):
+        """Record several (txn_id, state, success, message) outcomes under one fsync."""
+        now = time.time()
+        with self.lock:
+            log = self.log
+            for txn_id, state, success, message in outcomes:
+                record = TransactionRecord(txn_id, state, success, message, now)
+                self.entries[txn_id] = record
+                self.entries.move_to_end(txn_id)
+                if log is not None:
+                    log.append_nowait(record.to_dict())
+                    self.log_records += 1
+            if log is None:
+                return
+            if self.log_records > 2 * self.max_entries:
+                self._compact()
+        # Outside the lock, so concurrent payments share the fsync.
+        log.flush()
+
+    def discard(self, txn_id):
+        """Forget an unfinished payment so a retry runs it again."""
+        with self.lock:
+            record = self.entries.get(txn_id)
+            if record is not None and record.state == INITIATED:
+                del self.entries[txn_id]
+
+    def _evict(self, now):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        # Entries are in least-recently-used order, which is close enough to
+        # age order that stopping at the first live one bounds the scan.
+        while self.entries:
+            record = next(iter(self.entries.values()))
+            if record.finished_at is None or record.finished_at + self.ttl >= now:
+                break
+            self.entries.popitem(last=False)
+
+    def _compact(self):
+        # Rewrite the log with only the outcomes still in memory.
+        self.log.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self.entries.values():
+                if record.finished_at is not None:
+                    f.write(json.dumps(record.to_dict(), separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.log = GroupCommitLog(self.path)
+        self.log_records = sum(1 for r in self.entries.values() if r.finished_at is not None)
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
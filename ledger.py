@@ -0,0 +1,188 @@
+import glob
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from wal import GroupCommitLog, read_records
+
+logger = logging.getLogger('BankServer')
+
+DEFAULT_DIR = "data"
+SNAPSHOT_EVERY = 100000  # log records between snapshots
+SNAPSHOT_CHECK = 1.0  # seconds between the snapshotter's looks at the log
+
+ACCOUNT = "account"
+PREPARE = "prepare"
+COMMIT = "commit"
+ABORT = "abort"
+TRANSFER = "transfer"
+
+
+class Ledger:
+    """A bank's accounts and prepared transactions, kept durable with a write-ahead log.
+
+    Every change is written as a log record holding the new balances of
+    the accounts it touched, not the amount moved, so a record can be
+    applied to state that already includes it. The caller writes the
+    record while still holding the locks of those accounts, which keeps
+    the log in the order the changes were made, and GroupCommitLog shares
+    one fsync among everyone writing at the same time.
+
+    The snapshotter starts a new log file, copies the state without
+    stopping payments and writes it to data/<bank>.json. The copy may
+    already include changes from the new file, which replaying them again
+    does not disturb. Once the snapshot is in place, the older log files
+    are deleted, so a restart reads one snapshot and the records written
+    since it was taken.
+    """
+
+    def __init__(self, bank_name, directory=DEFAULT_DIR, sync=True, snapshot_every=SNAPSHOT_EVERY):
+        self.bank_name = bank_name
+        self.directory = directory
+        self.sync = sync
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = os.path.join(directory, f"{bank_name}.json")
+        self.accounts = {}
+        self.prepared = {}
+        self.recent_transfers = OrderedDict()
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.records = 0
+        self.generation = self._load()
+        os.makedirs(directory, exist_ok=True)
+        self.log = GroupCommitLog(self._log_path(self.generation), sync=sync)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f"{self.bank_name}.ledger.{generation}.log")
+
+    def _log_files(self):
+        """(generation, path) of every log file on disk, oldest first."""
+        files = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(self.bank_name)}.ledger.*.log")):
+            generation = path[:-len(".log")].rsplit(".", 1)[-1]
+            if generation.isdigit():
+                files.append((int(generation), path))
+        return sorted(files)
+
+    def _load(self):
+        """Read the snapshot and replay the log after it; returns the generation for new records."""
+        first = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.accounts.update(state.get("accounts", {}))
+            self.prepared.update(state.get("transactions") or {})
+            self.recent_transfers.update((txn_id, True) for txn_id in state.get("recent_transfers", []))
+            first = state.get("log", 0)
+        last = first - 1
+        replayed = 0
+        for generation, path in self._log_files():
+            if generation < first:
+                # The snapshot already covers it; the crash came before it was deleted.
+                os.remove(path)
+                continue
+            for record in read_records(path):
+                self._apply(record)
+                replayed += 1
+            last = generation
+        self.records = replayed
+        if self.accounts or replayed:
+            logger.info(f"{self.bank_name}: loaded {len(self.accounts)} accounts "
+                        f"and {len(self.prepared)} prepared transactions, replayed {replayed} log records")
+        return last + 1
+
+    def _apply(self, record):
+        kind, txn_id = record["type"], record["id"]
+        if kind == ACCOUNT:
+            self.accounts[txn_id] = record["account"]
+            return
+        for number, balance in record["balances"].items():
+            self.accounts[number]["balance"] = balance
+        if kind == PREPARE:
+            self.prepared[txn_id] = record["prepared"]
+        elif kind in (COMMIT, ABORT):
+            self.prepared.pop(txn_id, None)
+        elif kind == TRANSFER:
+            self.recent_transfers[txn_id] = True
+
+    def _write(self, record):
+        with self.lock:
+            self.log.append_nowait(record)
+            self.records += 1
+            log = self.log
+        log.flush()
+
+    def add_account(self, account_number, account):
+        self._write({"type": ACCOUNT, "id": account_number, "account": account})
+
+    def record(self, kind, txn_id, accounts, prepared=None):
+        """Log a change made by transaction `txn_id`: the current balances of `accounts`, and its prepared state."""
+        record = {"type": kind, "id": txn_id,
+                  "balances": {number: self.accounts[number]["balance"] for number in accounts}}
+        if prepared is not None:
+            record["prepared"] = prepared
+        self._write(record)
+
+    def snapshot(self):
+        with self.snapshot_lock:
+            with self.lock:
+                # Records from here on go to the new file, and the copy below
+                # is taken after every record in the old one was applied.
+                old = self.log
+                self.generation += 1
+                self.log = GroupCommitLog(self._log_path(self.generation), sync=self.sync)
+                self.records = 0
+                old.close()
+            # Copies of the tables, then of each account, so that payments
+            # and registrations can go on while the snapshot is written.
+            accounts = {number: dict(account) for number, account in dict(self.accounts).items()}
+            state = {
+                "log": self.generation,
+                "accounts": accounts,
+                "usernames": {account["username"]: number for number, account in accounts.items()},
+                "transactions": dict(self.prepared),
+                "recent_transfers": list(self.recent_transfers.copy()),
+            }
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self.sync:
+                directory = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+            for generation, path in self._log_files():
+                if generation < self.generation:
+                    os.remove(path)
+            return len(accounts)
+
+    def start_snapshots(self, check=SNAPSHOT_CHECK):
+        """Snapshot in a background thread whenever snapshot_every records have been logged since the last one."""
+        def run():
+            while not self.stopped.wait(check):
+                if self.records >= self.snapshot_every:
+                    try:
+                        self.snapshot()
+                    except OSError as e:
+                        logger.error(f"{self.bank_name}: snapshot failed: {e}")
+        self.thread = threading.Thread(target=run, name=f"{self.bank_name}-snapshots", daemon=True)
+        self.thread.start()
+
+    @property
+    def flushes(self):
+        return self.log.flushes
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            self.log.close()
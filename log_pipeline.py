@@ -0,0 +1,166 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import time
+
+DEFAULT_LOG_FILE = "gateway.log"
+QUEUE_SIZE = 10000  # records waiting for the writer thread before new ones are dropped
+MAX_BYTES = 50 * 1024 * 1024  # size at which the log is rotated
+BACKUPS = 5  # compressed segments kept
+# Fraction of successful calls logged per method; failures are always logged.
+DEFAULT_SAMPLE_RATES = {"HealthCheck": 0.0}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `fields` passed through `extra` merged in."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The original "time - level - message" layout, with fields appended."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        return f"{line} {fields}" if fields else line
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def rotating_handler(path, max_bytes=MAX_BYTES, backups=BACKUPS):
+    """A file handler that rolls over at `max_bytes` and gzips the old segments."""
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: when the queue is full the record is counted and dropped."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Format the message now, but leave the JSON work to the writer thread.
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(path=DEFAULT_LOG_FILE, level=logging.INFO, json_lines=True,
+                      max_bytes=MAX_BYTES, backups=BACKUPS, queue_size=QUEUE_SIZE):
+    """Send the root logger through a bounded queue to a background writer thread.
+
+    Request threads only format the message and enqueue it; the writer does
+    the JSON encoding, file writes and rotation. Calling this again does
+    nothing while the first pipeline is running.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    file_handler = rotating_handler(path, max_bytes, backups)
+    file_handler.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    records = queue.Queue(queue_size)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DroppingQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def parse_sample_rates(items=()):
+    """DEFAULT_SAMPLE_RATES updated with "Method=rate" strings, rate between 0 and 1."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in items:
+        method, _, rate = item.partition("=")
+        rate = float(rate)
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Sample rate for {method} must be between 0 and 1")
+        rates[method] = rate
+    return rates
+
+
+class RpcLog:
+    """Decides which RPCs to log and writes one structured record for each.
+
+    The level check and sampling happen before any fields are collected,
+    so a call that is not logged costs a dict lookup and a random number.
+    """
+
+    def __init__(self, logger, sample_rates=None):
+        self.logger = logger
+        self.sample_rates = DEFAULT_SAMPLE_RATES if sample_rates is None else sample_rates
+
+    def sampled(self, method_name):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return False
+        rate = self.sample_rates.get(method_name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def completed(self, method_name, client, request, response, started):
+        fields = {
+            "method": method_name,
+            "client": client,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "status": "OK",
+        }
+        if method_name == "ProcessBank":
+            fields.update(amount=request.amount, from_bank=request.from_bank, to_bank=request.to_bank,
+                          success=response.success, message=response.message)
+        self.logger.info("rpc", extra={"fields": fields})
+
+    def failed(self, method_name, client, error, started):
+        fields = {
+            "method": method_name,
+            "client": client,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        if hasattr(error, "code") and callable(error.code):
+            fields.update(status=error.code().name, error_message=error.details())
+        else:
+            fields.update(status="UNKNOWN", error_message=str(error))
+        self.logger.error("rpc failed", extra={"fields": fields})
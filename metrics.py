@@ -0,0 +1,241 @@
+"""In-process counters, gauges and latency histograms with a Prometheus text endpoint.
+
+Recording touches only the calling thread's own shard, so it takes no lock
+and does not contend with other request threads. A scrape adds the shards
+together.
+"""
+from bisect import bisect_left
+import http.server
+import threading
+import time
+
+import grpc
+from grpc_interceptor import AsyncServerInterceptor, ServerInterceptor
+
+
+def _latency_bounds():
+    # HDR-style: four linear steps inside every power of two, from about
+    # 61 microseconds to 32 seconds, so each bucket is within 25% of its value.
+    return tuple(2.0 ** exponent * step for exponent in range(-14, 5) for step in (1.0, 1.25, 1.5, 1.75)) + (32.0,)
+
+
+LATENCY_BOUNDS = _latency_bounds()
+
+
+class _Shard(threading.local):
+    """One metric's values on one thread; first use on a thread adds its dict to `shards`."""
+
+    def __init__(self, shards, lock):
+        self.values = {}  # label values -> [number], or bucket counts for histograms
+        with lock:
+            shards.append(self.values)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Threads that have exited keep their dict here, so nothing they counted is lost.
+        self.lock = threading.Lock()
+        self.shards = []
+        self.local = _Shard(self.shards, self.lock)
+        registry.register(self)
+
+    def inc(self, *labels, amount=1):
+        values = self.local.values
+        # A one-item list, so a repeat hashes the labels once rather than twice.
+        cell = values.get(labels)
+        if cell is None:
+            cell = values[labels] = [0]
+        cell[0] += amount
+
+    def collect(self):
+        """Every thread's values added up, by label values."""
+        with self.lock:
+            shards = list(self.shards)
+        totals = {}
+        for values in shards:
+            for labels, (value,) in list(values.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}"
+                for labels, value in sorted(self.collect().items())]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, or is read from `read` (returning {label values: value}) at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, read=None):
+        super().__init__(name, help, labelnames, registry)
+        self.read = read
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        if self.read is not None:
+            return [f"{self.name}{_labels(self.labelnames, labels)} {value}"
+                    for labels, value in sorted(self.read().items())]
+        return super().render()
+
+
+class Histogram(Counter):
+    """Latency histogram over LATENCY_BOUNDS, in seconds."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, bounds=LATENCY_BOUNDS):
+        super().__init__(name, help, labelnames, registry)
+        self.bounds = tuple(bounds)
+        # One slot per bucket, one for values above the last, then the sum.
+        self.slots = len(self.bounds) + 2
+
+    def observe(self, seconds, *labels):
+        values = self.local.values
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * self.slots
+        counts[bisect_left(self.bounds, seconds)] += 1
+        counts[-1] += seconds
+
+    def collect(self):
+        with self.lock:
+            shards = list(self.shards)
+        totals = {}
+        for values in shards:
+            for labels, counts in list(values.items()):
+                total = totals.setdefault(labels, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+        return totals
+
+    def render(self):
+        lines = []
+        for labels, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', repr(bound))])} {cumulative}")
+            cumulative += counts[-2]
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve GET /metrics from a daemon thread; returns the server."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def rpc_status(error, context):
+    """Name of the status code a failed RPC ends with."""
+    if isinstance(error, grpc.RpcError) and callable(getattr(error, "code", None)):
+        return error.code().name
+    # context.abort() raises a plain exception; the code is on the context.
+    try:
+        code = context.code()
+    except Exception:
+        code = None
+    return code.name if isinstance(code, grpc.StatusCode) else "UNKNOWN"
+
+
+class MetricsInterceptor(ServerInterceptor):
+    """Times every RPC into `latency` and counts failed ones in `errors`, both labelled by method."""
+
+    def __init__(self, latency, errors):
+        self.latency = latency
+        self.errors = errors
+
+    def intercept(self, method, request, context, method_name):
+        method_name = str(method_name).split('/')[-1]
+        start = time.perf_counter()
+        try:
+            return method(request, context)
+        except Exception as e:
+            self.errors.inc(method_name, rpc_status(e, context))
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start, method_name)
+
+
+class AsyncMetricsInterceptor(AsyncServerInterceptor):
+    """MetricsInterceptor for grpc.aio servers."""
+
+    def __init__(self, latency, errors):
+        self.latency = latency
+        self.errors = errors
+
+    async def intercept(self, method, request, context, method_name):
+        method_name = str(method_name).split('/')[-1]
+        start = time.perf_counter()
+        try:
+            response = method(request, context)
+            if hasattr(response, "__aiter__"):
+                return response
+            return await response
+        except Exception as e:
+            self.errors.inc(method_name, rpc_status(e, context))
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start, method_name)
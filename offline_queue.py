@@ -12,9 +12,12 @@ import gateway_pb2_grpc
 import auth_pb2
 import auth_pb2_grpc
 
+from deadlines import DEFAULT_TIMEOUTS
+
 class Client:
     def __init__(self, stub):
         self.stub = stub
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
         self.keys = {}
         self.offline_processing = queue.Queue()
         self.last_success_time = 0
@@ -27,7 +30,7 @@ class Client:
             initial_amount=initial_amount
         )
         try:
-            response = self.stub.RegisterAccount(request)
+            response = self.stub.RegisterAccount(request, timeout=self.timeouts["RegisterAccount"])
             if not response.success:
                 print(response.message)
                 return ""
@@ -40,7 +43,7 @@ class Client:
     def login(self, username, password, bank_name):
         request = auth_pb2.LoginRequest(username=username, password=password, bank_name=bank_name)
         try:
-            response = self.stub.Login(request)
+            response = self.stub.Login(request, timeout=self.timeouts["Login"])
             if response.message == "Login successful":
                 self.keys[f"{bank_name}_{response.account_number}"] = response.key
                 print(f"Logged in to {bank_name} with account {response.account_number}")
@@ -59,7 +62,7 @@ class Client:
             return
         request = bank_pb2.Account(number=account_number, bank_name=bank_name, key=key)
         try:
-            response = self.stub.GetBalance(request)
+            response = self.stub.GetBalance(request, timeout=self.timeouts["GetBalance"])
             if response.error:
                 print(f"Error: {response.message}")
             else:
@@ -85,7 +88,7 @@ class Client:
         if self.offline_processing.empty():
             # Try immediate processing if queue is empty
             try:
-                response = self.stub.ProcessBank(request)
+                response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
                 if response.success:
                     print(f"Payment result: {response.success} - {response.message}")
                     self.last_success_time = time.time()
@@ -108,7 +111,7 @@ class Client:
                 head_request = self.offline_processing.queue[0]  # Peek at head
                 print(f"Retrying queued transaction {head_request.id}")
                 try:
-                    response = self.stub.ProcessBank(head_request)
+                    response = self.stub.ProcessBank(head_request, timeout=self.timeouts["ProcessBank"])
                     if response.success:
                         self.offline_processing.get()  # Remove head on success
                         self.last_success_time = time.time()
@@ -117,7 +120,7 @@ class Client:
                         while not self.offline_processing.empty():
                             next_request = self.offline_processing.queue[0]
                             print(f"Processing queued transaction {next_request.id}")
-                            response = self.stub.ProcessBank(next_request)
+                            response = self.stub.ProcessBank(next_request, timeout=self.timeouts["ProcessBank"])
                             if response.success:
                                 self.offline_processing.get()
                                 self.last_success_time = time.time()
@@ -142,7 +145,7 @@ class Client:
             request = self.offline_processing.queue[0]  # Peek at head
             print(f"Retrying queued transaction {request.id}")
             try:
-                response = self.stub.ProcessBank(request)
+                response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
                 if response.success:
                     self.offline_processing.get()  # Remove head on success
                     self.last_success_time = time.time()
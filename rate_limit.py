@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import threading
+import time
+
+import grpc
+from grpc_interceptor import AsyncServerInterceptor, ServerInterceptor
+
+# Requests per second and burst size allowed to one client, per method.
+DEFAULT_LIMITS = {
+    "ProcessBank": (50.0, 100),
+    "GetBalance": (100.0, 200),
+    "Login": (5.0, 20),
+}
+# Payments sent in a batch or on a stream draw on ProcessBank's buckets, one token each.
+SHARED_LIMITS = {"ProcessBatch": "ProcessBank", "PaymentStream": "ProcessBank"}
+STRIPES = 64  # independently locked parts of each method's bucket table
+MAX_CLIENTS = 500000  # buckets kept per method; beyond this the least recently used go first
+
+
+def load_limits(overrides=()):
+    """DEFAULT_LIMITS updated with "Method=RATE" or "Method=RATE/BURST" strings; a rate of 0 turns the limit off."""
+    limits = dict(DEFAULT_LIMITS)
+    for item in overrides:
+        method, _, value = item.partition("=")
+        if method not in limits:
+            raise ValueError(f"Unknown method {method!r}; expected one of {', '.join(limits)}")
+        rate, _, burst = value.partition("/")
+        rate = float(rate)
+        burst = int(burst) if burst else max(1, int(rate * 2))
+        if rate < 0 or burst < 1:
+            raise ValueError(f"Rate limit for {method} must be a rate >= 0 and a burst >= 1")
+        limits[method] = (rate, burst)
+    return {method: limit for method, limit in limits.items() if limit[0] > 0}
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled at `rate` tokens a second up to `burst`.
+
+    Keys are spread over STRIPES tables with a lock each, so clients rarely
+    wait on one another. A bucket left alone long enough to refill is the
+    same as a new one, so it is dropped the next time its table is used;
+    each table is kept in least-recently-used order, which makes that an
+    O(1) check on the oldest entry.
+    """
+
+    def __init__(self, rate, burst, max_keys=MAX_CLIENTS, stripes=STRIPES):
+        self.rate = rate
+        self.burst = burst
+        self.max_per_stripe = max(1, max_keys // stripes)
+        self.stripes = [(threading.Lock(), collections.OrderedDict()) for _ in range(stripes)]
+
+    def take(self, key, now=None, tokens=1):
+        """Take `tokens` for `key`: 0.0 if it had one, otherwise seconds until it will.
+
+        A batch larger than the burst still goes through once a token is
+        there; the bucket goes into debt and refills from below zero.
+        """
+        if now is None:
+            now = time.monotonic()
+        lock, buckets = self.stripes[hash(key) % len(self.stripes)]
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [float(self.burst), now]
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            # Each call adds at most one bucket and drops at most one: the
+            # oldest, once it has refilled (debt included) or the table is full.
+            oldest = next(iter(buckets))
+            left, last = buckets[oldest]
+            if oldest != key and (now - last >= (self.burst - left) / self.rate
+                                  or len(buckets) > self.max_per_stripe):
+                del buckets[oldest]
+            if bucket[0] >= 1.0:
+                bucket[0] -= tokens
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return sum(len(buckets) for _, buckets in self.stripes)
+
+
+class RateLimiter:
+    """Token buckets per (client, method) for the methods in `limits`."""
+
+    def __init__(self, limits=None, max_clients=MAX_CLIENTS):
+        limits = DEFAULT_LIMITS if limits is None else limits
+        self.buckets = {method: TokenBuckets(rate, burst, max_clients) for method, (rate, burst) in limits.items()}
+
+    def limits(self, method_name):
+        """The buckets calls to `method_name` draw on, or None if it is not limited."""
+        return self.buckets.get(SHARED_LIMITS.get(method_name, method_name))
+
+    def check(self, method_name, client, tokens=1):
+        """0.0 if the call may go ahead, otherwise seconds the client should wait."""
+        buckets = self.limits(method_name)
+        if buckets is None:
+            return 0.0
+        return buckets.take(client, tokens=tokens)
+
+
+def client_identity(context):
+    """Who is calling: the mTLS certificate subject together with the peer's address.
+
+    Clients may share one certificate (as the ones generated by
+    generate_certs.sh do), so the subject alone would put them all in one
+    bucket; the address without its port keeps reconnecting from getting
+    a fresh bucket.
+    """
+    auth = context.auth_context() or {}
+    subject = auth.get("x509_subject") or auth.get("x509_common_name") or [b""]
+    host = context.peer().rsplit(":", 1)[0]
+    return f"{subject[0].decode(errors='replace')}@{host}"
+
+
+def _retry_after_ms(wait):
+    return str(max(1, int(wait * 1000)))
+
+
+def _tokens(method_name, request):
+    # A batch costs a token per payment.
+    return len(request.transactions) if method_name == "ProcessBatch" else 1
+
+
+def _paced(requests, buckets, client):
+    # Each payment on a stream waits for a token before it is handed on,
+    # so an over-limit client is slowed down by flow control, not cut off.
+    for request in requests:
+        while wait := buckets.take(client):
+            time.sleep(wait)
+        yield request
+
+
+async def _paced_async(requests, buckets, client):
+    async for request in requests:
+        while wait := buckets.take(client):
+            await asyncio.sleep(wait)
+        yield request
+
+
+class RateLimitInterceptor(ServerInterceptor):
+    """Answers RESOURCE_EXHAUSTED, with a retry-after-ms trailer, to clients over their limit."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def intercept(self, method, request, context, method_name):
+        method_name_str = str(method_name).split('/')[-1]
+        buckets = self.limiter.limits(method_name_str)
+        if buckets is None:
+            return method(request, context)
+        if method_name_str == "PaymentStream":
+            return method(_paced(request, buckets, client_identity(context)), context)
+        wait = buckets.take(client_identity(context), tokens=_tokens(method_name_str, request))
+        if wait:
+            context.set_trailing_metadata((("retry-after-ms", _retry_after_ms(wait)),))
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"Rate limit exceeded for {method_name_str}")
+        return method(request, context)
+
+
+class AsyncRateLimitInterceptor(AsyncServerInterceptor):
+    """RateLimitInterceptor for the asyncio gateway."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    async def intercept(self, method, request, context, method_name):
+        method_name_str = str(method_name).split('/')[-1]
+        buckets = self.limiter.limits(method_name_str)
+        if buckets is not None and method_name_str == "PaymentStream":
+            request = _paced_async(request, buckets, client_identity(context))
+        elif buckets is not None:
+            wait = buckets.take(client_identity(context), tokens=_tokens(method_name_str, request))
+            if wait:
+                context.set_trailing_metadata((("retry-after-ms", _retry_after_ms(wait)),))
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"Rate limit exceeded for {method_name_str}")
+        response = method(request, context)
+        if hasattr(response, "__aiter__"):
+            return response
+        return await response
@@ -0,0 +1,86 @@
+import logging
+import time
+from concurrent import futures
+
+import grpc
+
+import bank_pb2
+from coordinator_log import ABORT, COMMIT
+from idempotency import COMMITTED
+
+logger = logging.getLogger('GatewayServer')
+
+RECOVERY_BATCH = 500  # transactions per CommitBatch/AbortBatch message
+RECOVERY_TIMEOUT = 30.0
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _resolve_at_bank(channels, bank_name, method, entries):
+    """Send `method` for `entries` to one bank in batches; return the IDs it settled."""
+    settled = []
+    for chunk in _chunks(entries, RECOVERY_BATCH):
+        batch = bank_pb2.TransactionBatch(
+            transactions=[bank_pb2.Transaction(**entry.txn) for entry in chunk])
+        try:
+            response = getattr(channels.get(bank_name).bank, method)(batch, timeout=RECOVERY_TIMEOUT)
+        except grpc.RpcError as e:
+            logger.error(f"Recovery {method} to {bank_name} failed: {e.code().name}")
+            continue
+        for entry, applied in zip(chunk, response.success):
+            if not applied:
+                # The bank holds nothing for this ID: it was never prepared
+                # there, or the outcome was applied before the crash.
+                logger.info(f"{bank_name} had no prepared state for {entry.txn_id}")
+            settled.append(entry.txn_id)
+    return settled
+
+
+def recover_in_doubt(coordinator_log, channels, transactions=None):
+    """Push the outcome of every unfinished transaction in the coordinator log to its banks.
+
+    Transactions with a logged COMMIT are committed; anything else is
+    presumed aborted. Each bank gets one CommitBatch and one AbortBatch
+    stream of messages, and all banks are contacted in parallel. Returns
+    the number of transactions that remain unresolved.
+    """
+    in_doubt = coordinator_log.in_doubt()
+    if not in_doubt:
+        return 0
+    start = time.perf_counter()
+    logger.info(f"Recovering {len(in_doubt)} in-doubt transactions")
+
+    work = {}
+    for entry in in_doubt:
+        method = "CommitBatch" if entry.decision == COMMIT else "AbortBatch"
+        for bank_name in entry.participants:
+            if bank_name not in channels:
+                logger.error(f"Cannot recover {entry.txn_id}: unknown bank {bank_name}")
+                continue
+            work.setdefault((bank_name, method), []).append(entry)
+
+    acked = {}
+    with futures.ThreadPoolExecutor(max_workers=max(1, len(work))) as pool:
+        jobs = [
+            pool.submit(_resolve_at_bank, channels, bank_name, method, entries)
+            for (bank_name, method), entries in work.items()
+        ]
+        for job in jobs:
+            for txn_id in job.result():
+                acked[txn_id] = acked.get(txn_id, 0) + 1
+
+    resolved = [entry for entry in in_doubt if acked.get(entry.txn_id, 0) >= len(entry.participants)]
+    unresolved = len(in_doubt) - len(resolved)
+    coordinator_log.decide_many([e.txn_id for e in resolved if e.decision != COMMIT], ABORT)
+    coordinator_log.end_many([e.txn_id for e in resolved])
+    if transactions is not None:
+        transactions.finish_many([
+            (e.txn_id, COMMITTED, True, "Payment Successful") for e in resolved if e.decision == COMMIT
+        ])
+    coordinator_log.checkpoint()
+    logger.info(f"Recovery finished in {time.perf_counter() - start:.3f}s, "
+                f"{len(in_doubt) - unresolved} resolved, {unresolved} still in doubt")
+    return unresolved
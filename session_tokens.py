@@ -0,0 +1,166 @@
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+import grpc
+from grpc_interceptor import AsyncServerInterceptor, ServerInterceptor
+
+DEFAULT_TTL = 3600.0  # seconds a session token stays valid after Login
+DEFAULT_SECRET_FILE = "session_token.key"  # in the gateway's certs directory
+VERIFIED_CACHE_SIZE = 10000  # tokens whose signature has already been checked
+TOKEN_VERSION = "v1"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class Session:
+    """What a valid token says: whose account it is and the bank's own key for it."""
+
+    __slots__ = ("bank_name", "account_number", "bank_key", "expires")
+
+    def __init__(self, bank_name, account_number, bank_key, expires):
+        self.bank_name = bank_name
+        self.account_number = account_number
+        self.bank_key = bank_key
+        self.expires = expires
+
+    def owns(self, bank_name, account_number):
+        return self.bank_name == bank_name and self.account_number == account_number
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def load_secret(path):
+    """The HMAC key tokens are signed with; created on first use so tokens survive a restart."""
+    try:
+        with open(path, "rb") as f:
+            secret = f.read()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    secret = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+class SessionTokens:
+    """Issues and checks the HMAC-signed session tokens handed out at Login.
+
+    A token is "v1.<payload>.<signature>", the payload being the account,
+    its bank, the key that bank gave it and an expiry time. The gateway
+    checks tokens without asking the bank; tokens that passed are kept in
+    a small LRU so repeat requests skip the HMAC and JSON work.
+    """
+
+    def __init__(self, secret, ttl=DEFAULT_TTL, cache_size=VERIFIED_CACHE_SIZE):
+        self.secret = secret
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.verified = collections.OrderedDict()  # token -> Session
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, f"{TOKEN_VERSION}.{payload}".encode(), hashlib.sha256).digest()
+
+    def issue(self, bank_name, account_number, bank_key):
+        claims = {"b": bank_name, "a": account_number, "k": bank_key, "e": int(time.time() + self.ttl)}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{TOKEN_VERSION}.{payload}.{_b64encode(self._sign(payload))}"
+
+    def verify(self, token):
+        """The Session a token stands for; raises InvalidToken if it is forged, malformed or expired."""
+        now = time.time()
+        with self.lock:
+            session = self.verified.get(token)
+            if session is not None:
+                if session.expires > now:
+                    self.verified.move_to_end(token)
+                    return session
+                del self.verified[token]
+                raise InvalidToken("Session expired")
+        try:
+            version, payload, signature = token.split(".")
+            if version != TOKEN_VERSION or not hmac.compare_digest(_b64decode(signature), self._sign(payload)):
+                raise InvalidToken("Invalid session token")
+            claims = json.loads(_b64decode(payload))
+            session = Session(claims["b"], claims["a"], claims["k"], claims["e"])
+        except (ValueError, KeyError, TypeError):
+            raise InvalidToken("Invalid session token")
+        if session.expires <= now:
+            raise InvalidToken("Session expired")
+        with self.lock:
+            self.verified[token] = session
+            while len(self.verified) > self.cache_size:
+                self.verified.popitem(last=False)
+        return session
+
+    def authorize(self, token, bank_name, account_number):
+        """The Session for `token` if it belongs to that account; raises InvalidToken otherwise."""
+        session = self.verify(token)
+        if not session.owns(bank_name, account_number):
+            raise InvalidToken("Session token is for another account")
+        return session
+
+
+def _owner(method_name, request):
+    """(bank_name, account_number) a unary request acts on, or None if it needs no session."""
+    if method_name == "GetBalance":
+        return request.bank_name, request.number
+    if method_name == "ProcessBank":
+        return request.from_bank, request.from_
+    return None
+
+
+class AuthInterceptor(ServerInterceptor):
+    """Rejects GetBalance and ProcessBank calls whose token does not belong to the account they act on.
+
+    ProcessBatch and PaymentStream carry one token per payment and are
+    checked payment by payment by the gateway itself.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def intercept(self, method, request, context, method_name):
+        owner = _owner(str(method_name).split('/')[-1], request)
+        if owner is not None:
+            try:
+                self.tokens.authorize(request.key, *owner)
+            except InvalidToken as e:
+                context.abort(grpc.StatusCode.UNAUTHENTICATED, str(e))
+        return method(request, context)
+
+
+class AsyncAuthInterceptor(AsyncServerInterceptor):
+    """AuthInterceptor for the asyncio gateway."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    async def intercept(self, method, request, context, method_name):
+        owner = _owner(str(method_name).split('/')[-1], request)
+        if owner is not None:
+            try:
+                self.tokens.authorize(request.key, *owner)
+            except InvalidToken as e:
+                await context.abort(grpc.StatusCode.UNAUTHENTICATED, str(e))
+        response = method(request, context)
+        if hasattr(response, "__aiter__"):
+            return response
+        return await response
@@ -12,12 +12,15 @@ import gateway_pb2_grpc
 import auth_pb2
 import auth_pb2_grpc
 
+from deadlines import DEFAULT_TIMEOUTS
+
 class Client:
     def __init__(self, gateway_host, gateway_port):
         self.gateway_host = gateway_host
         self.gateway_port = gateway_port
         self.channel = self.create_channel()
         self.stub = gateway_pb2_grpc.GatewayServiceStub(self.channel)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
         self.keys = {}  # Store keys for authenticated accounts
         self.offline_queue = queue.Queue()  # Queue for offline payment transactions
         self.retry_counts = {}  # Track retry attempts
@@ -59,7 +62,7 @@ class Client:
                         # Check channel state (Note: gRPC Python doesn’t have a direct `ready()` method; this is illustrative)
                         try:
                             grpc.channel_ready_future(self.channel).result(timeout=5)  # Wait up to 5 seconds
-                            response = self.stub.ProcessBank(request)
+                            response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
                             print(f"Offline payment {txn_id} processed: {response.success} - {response.message}")
                             self.offline_queue.get()  # Remove from queue
                             del self.retry_counts[txn_id]
@@ -83,7 +86,7 @@ class Client:
             username=username, password=password, bank_name=bank_name, initial_amount=initial_amount
         )
         try:
-            response = self.stub.RegisterAccount(request)
+            response = self.stub.RegisterAccount(request, timeout=self.timeouts["RegisterAccount"])
             if response.success:
                 print(f"Registered {username} at {bank_name} with account {response.account_number}")
                 return response.account_number
@@ -97,7 +100,7 @@ class Client:
     def login(self, username, password, bank_name):
         request = auth_pb2.LoginRequest(username=username, password=password, bank_name=bank_name)
         try:
-            response = self.stub.Login(request)
+            response = self.stub.Login(request, timeout=self.timeouts["Login"])
             if response.message == "Login successful":
                 self.keys[f"{bank_name}_{response.account_number}"] = response.key
                 print(f"Logged in to {bank_name} with account {response.account_number}")
@@ -116,7 +119,7 @@ class Client:
             return
         request = bank_pb2.Account(number=account_number, bank_name=bank_name, key=key)
         try:
-            response = self.stub.GetBalance(request)
+            response = self.stub.GetBalance(request, timeout=self.timeouts["GetBalance"])
             if response.error:
                 print(f"Error: {response.message}")
             else:
@@ -134,7 +137,7 @@ class Client:
             amount=amount, timestamp=5000, key=from_key
         )
         try:
-            response = self.stub.ProcessBank(request)
+            response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
             print(f"Payment {txn_id} processed: {response.success} - {response.message}")
         except grpc.RpcError as err:
             print(f"Error processing payment {txn_id}: {err.details()}. Queuing for retry.")
@@ -0,0 +1,313 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from account_locks import AccountLocks
+from ledger import ABORT, COMMIT, PREPARE, TRANSFER, Ledger
+
+STORES = ("memory", "sqlite")
+DEFAULT_DIR = "data"
+RECENT_TRANSFERS = 100000  # transfer IDs remembered to reject replays
+BUSY_TIMEOUT_MS = 10000  # how long a connection waits for another's write transaction
+STATEMENT_CACHE = 64  # prepared statements kept per SQLite connection
+
+
+def username_index(accounts):
+    """Username -> account number for every account, built once when a bank starts."""
+    return {account['username']: account_number for account_number, account in accounts.items()}
+
+
+class MemoryStore:
+    """A bank's accounts, usernames and prepared transactions in dicts.
+
+    With a Ledger every change is logged before it is answered and the
+    tables are the ledger's own, so they survive restarts. Payment methods
+    are called with the locks of the request's accounts held (see
+    bank_server.txn_locks).
+    """
+
+    def __init__(self, bank_name, locks=None, ledger=None):
+        self.bank_name = bank_name
+        self.locks = locks or AccountLocks()
+        self.ledger = ledger
+        self.accounts = ledger.accounts if ledger is not None else {}
+        self.prepared = ledger.prepared if ledger is not None else {}
+        self.recent_transfers = ledger.recent_transfers if ledger is not None else OrderedDict()
+        self.usernames = username_index(self.accounts)  # username -> account number
+
+    def account(self, number):
+        return self.accounts.get(number)
+
+    def has_username(self, username):
+        return username in self.usernames
+
+    def find_username(self, username):
+        """(account number, account) for `username`, or (None, None)."""
+        # An account is in the table before its username is indexed, so no lock is needed.
+        account_number = self.usernames.get(username)
+        account = self.accounts.get(account_number) if account_number else None
+        return (account_number, account) if account is not None else (None, None)
+
+    def add_account(self, account_number, account):
+        """Add an account; False if its username is taken."""
+        # Only adding accounts takes the table lock; payments lock just the
+        # accounts they touch.
+        with self.locks.table:
+            if account['username'] in self.usernames:
+                return False
+            self.accounts[account_number] = account
+            # Durable before the username is indexed, so nobody logs in to
+            # an account a crash could lose.
+            if self.ledger is not None:
+                self.ledger.add_account(account_number, account)
+            self.usernames[account['username']] = account_number
+            return True
+
+    def prepare(self, request):
+        #sender
+        if request.id in self.prepared:
+            return False  # Reject duplicate
+        is_sender = request.from_bank == self.bank_name and request.from_ in self.accounts
+        is_recipient = request.to_bank == self.bank_name and request.to in self.accounts
+        if not is_sender and not is_recipient:
+            return False
+
+        if is_sender:
+            if self.accounts[request.from_]["balance"]<request.amount:
+                return False
+            else:
+                self.accounts[request.from_]["balance"]-=request.amount
+                self.prepared[request.id] = {'role': 'sender', 'amount': request.amount}
+        #receiver
+        if is_recipient:
+            self.prepared[request.id] = {'role': 'recipient', 'amount': request.amount}
+        self._log(PREPARE, request, request.from_ if is_sender else None)
+        return True
+
+    def transfer(self, request):
+        if request.id in self.recent_transfers or request.id in self.prepared:
+            return False
+        sender = self.accounts.get(request.from_) if request.from_bank == self.bank_name else None
+        recipient = self.accounts.get(request.to) if request.to_bank == self.bank_name else None
+        if sender is None or recipient is None:
+            return False
+        if request.amount <= 0 or sender["balance"] < request.amount:
+            return False
+        sender["balance"] -= request.amount
+        recipient["balance"] += request.amount
+        self.recent_transfers[request.id] = True
+        if len(self.recent_transfers) > RECENT_TRANSFERS:
+            self.recent_transfers.popitem(last=False)
+        self._log(TRANSFER, request, request.from_, request.to)
+        return True
+
+    def commit(self, request):
+        if request.id in self.prepared:
+            role = self.prepared[request.id]['role']
+            if role == 'recipient':
+                self.accounts[request.to]["balance"] += self.prepared[request.id]['amount']
+            # Sender already deducted funds in Prepare, so no action needed
+            del self.prepared[request.id]
+            self._log(COMMIT, request, request.to if role == 'recipient' else None)
+            return True
+        return False
+
+    def abort(self, request):
+        if request.id in self.prepared:
+            role = self.prepared[request.id]['role']
+            if role == 'sender':
+                self.accounts[request.from_]["balance"] += self.prepared[request.id]['amount']
+            # Recipient didn’t add funds yet, so no action needed
+            del self.prepared[request.id]
+            self._log(ABORT, request, request.from_ if role == 'sender' else None)
+            return True
+        return False
+
+    def _log(self, kind, request, *accounts):
+        # The caller holds the locks of these accounts, so records of one
+        # account reach the log in the order its balance changed.
+        if self.ledger is not None:
+            self.ledger.record(kind, request.id, [number for number in accounts if number],
+                               self.prepared.get(request.id) if kind == PREPARE else None)
+
+    def prepared_count(self):
+        return len(self.prepared)
+
+    def close(self):
+        if self.ledger is not None:
+            self.ledger.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    number TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    balance REAL NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS accounts_username ON accounts (username);
+CREATE TABLE IF NOT EXISTS prepared (
+    id TEXT PRIMARY KEY,
+    role TEXT NOT NULL,
+    amount REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE
+);
+"""
+
+ACCOUNT_FIELDS = "number, username, password_hash, balance, key"
+
+
+class SqliteStore:
+    """MemoryStore's interface over an SQLite database, for banks too big to keep in a dict.
+
+    The database runs in WAL journal mode, so balance reads never wait on a
+    writer, with synchronous=FULL, so a change is on disk before it is
+    answered. Every gRPC worker thread has its own connection, whose
+    statement cache keeps the fixed SQL below prepared. Each payment
+    method is one BEGIN IMMEDIATE transaction, and the unique index on
+    username settles racing registrations. Memory use is SQLite's page
+    cache, whatever the number of accounts.
+    """
+
+    def __init__(self, bank_name, path=None, locks=None, sync=True):
+        self.bank_name = bank_name
+        self.path = path or os.path.join(DEFAULT_DIR, f"{bank_name}.db")
+        self.locks = locks or AccountLocks()
+        self.sync = sync
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            # Autocommit mode: transactions are begun explicitly in _write.
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000,
+                                 cached_statements=STATEMENT_CACHE, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute(f"PRAGMA synchronous={'FULL' if self.sync else 'OFF'}")
+            self.local.db = db
+            with self.connections_lock:
+                self.connections.append(db)
+        return db
+
+    def _write(self, operation, *args):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = operation(db, *args)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return result
+
+    def account(self, number):
+        row = self._db().execute(f"SELECT {ACCOUNT_FIELDS} FROM accounts WHERE number = ?", (number,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def has_username(self, username):
+        return self._db().execute("SELECT 1 FROM accounts WHERE username = ?", (username,)).fetchone() is not None
+
+    def find_username(self, username):
+        row = self._db().execute(f"SELECT {ACCOUNT_FIELDS} FROM accounts WHERE username = ?", (username,)).fetchone()
+        return (row["number"], dict(row)) if row is not None else (None, None)
+
+    def add_account(self, account_number, account):
+        try:
+            self._write(lambda db: db.execute(
+                f"INSERT INTO accounts ({ACCOUNT_FIELDS}) VALUES (?, ?, ?, ?, ?)",
+                (account_number, account['username'], account['password_hash'], account['balance'], account['key'])))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def prepare(self, request):
+        return self._write(self._prepare, request)
+
+    def _prepare(self, db, request):
+        if db.execute("SELECT 1 FROM prepared WHERE id = ?", (request.id,)).fetchone():
+            return False
+        is_sender = request.from_bank == self.bank_name and self._exists(db, request.from_)
+        is_recipient = request.to_bank == self.bank_name and self._exists(db, request.to)
+        if not is_sender and not is_recipient:
+            return False
+        if is_sender:
+            debited = db.execute("UPDATE accounts SET balance = balance - ? WHERE number = ? AND balance >= ?",
+                                 (request.amount, request.from_, request.amount))
+            if debited.rowcount == 0:
+                return False
+        # As in MemoryStore, a payment between two accounts of this bank is held as the recipient's.
+        db.execute("INSERT OR REPLACE INTO prepared (id, role, amount) VALUES (?, ?, ?)",
+                   (request.id, 'recipient' if is_recipient else 'sender', request.amount))
+        return True
+
+    def transfer(self, request):
+        return self._write(self._transfer, request)
+
+    def _transfer(self, db, request):
+        if (db.execute("SELECT 1 FROM transfers WHERE id = ?", (request.id,)).fetchone()
+                or db.execute("SELECT 1 FROM prepared WHERE id = ?", (request.id,)).fetchone()):
+            return False
+        if request.from_bank != self.bank_name or request.to_bank != self.bank_name:
+            return False
+        if request.amount <= 0 or not self._exists(db, request.to):
+            return False
+        debited = db.execute("UPDATE accounts SET balance = balance - ? WHERE number = ? AND balance >= ?",
+                             (request.amount, request.from_, request.amount))
+        if debited.rowcount == 0:
+            return False
+        db.execute("UPDATE accounts SET balance = balance + ? WHERE number = ?", (request.amount, request.to))
+        seq = db.execute("INSERT INTO transfers (id) VALUES (?)", (request.id,)).lastrowid
+        if seq % 1000 == 0:
+            db.execute("DELETE FROM transfers WHERE seq <= ?", (seq - RECENT_TRANSFERS,))
+        return True
+
+    def commit(self, request):
+        return self._write(self._settle, request, 'recipient', request.to)
+
+    def abort(self, request):
+        return self._write(self._settle, request, 'sender', request.from_)
+
+    def _settle(self, db, request, paid_role, account):
+        # Commit pays a recipient, Abort refunds a sender; either drops the hold.
+        row = db.execute("SELECT role, amount FROM prepared WHERE id = ?", (request.id,)).fetchone()
+        if row is None:
+            return False
+        if row["role"] == paid_role:
+            db.execute("UPDATE accounts SET balance = balance + ? WHERE number = ?", (row["amount"], account))
+        db.execute("DELETE FROM prepared WHERE id = ?", (request.id,))
+        return True
+
+    @staticmethod
+    def _exists(db, number):
+        return db.execute("SELECT 1 FROM accounts WHERE number = ?", (number,)).fetchone() is not None
+
+    def prepared_count(self):
+        return self._db().execute("SELECT count(*) FROM prepared").fetchone()[0]
+
+    def close(self):
+        with self.connections_lock:
+            for db in self.connections:
+                db.close()
+            self.connections = []
+
+
+def open_store(kind, bank_name, locks=None, directory=DEFAULT_DIR):
+    """The store a bank server runs on: "memory" (dicts kept by a Ledger) or "sqlite"."""
+    if kind == "memory":
+        ledger = Ledger(bank_name, directory)
+        ledger.start_snapshots()
+        return MemoryStore(bank_name, locks, ledger)
+    if kind == "sqlite":
+        return SqliteStore(bank_name, os.path.join(directory, f"{bank_name}.db"), locks)
+    raise ValueError(f"Unknown store {kind!r}; expected one of {', '.join(STORES)}")
@@ -11,9 +11,12 @@ import gateway_pb2_grpc
 import auth_pb2
 import auth_pb2_grpc
 
+from deadlines import DEFAULT_TIMEOUTS
+
 class Client:
     def __init__(self, stub, shared_keys=None, keys_lock=None):
         self.stub = stub
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
         self.keys = shared_keys if shared_keys is not None else {}  # Use shared keys if provided
         self.keys_lock = keys_lock  # Lock for thread-safe key updates
 
@@ -25,7 +28,7 @@ class Client:
             initial_amount=initial_amount
         )
         try:
-            response = self.stub.RegisterAccount(request)
+            response = self.stub.RegisterAccount(request, timeout=self.timeouts["RegisterAccount"])
             print(f"Registered {username} at {bank_name} with account {response.account_number} - {response.message}")
             return response.account_number if response.account_number else None
         except grpc.RpcError as e:
@@ -35,7 +38,7 @@ class Client:
     def login(self, username, password, bank_name):
         request = auth_pb2.LoginRequest(username=username, password=password, bank_name=bank_name)
         try:
-            response = self.stub.Login(request)
+            response = self.stub.Login(request, timeout=self.timeouts["Login"])
             if response.message == "Login successful":
                 with self.keys_lock:
                     self.keys[f"{bank_name}_{response.account_number}"] = response.key
@@ -55,7 +58,7 @@ class Client:
             return None
         request = bank_pb2.Account(number=account_number, bank_name=bank_name, key=key)
         try:
-            response = self.stub.GetBalance(request)
+            response = self.stub.GetBalance(request, timeout=self.timeouts["GetBalance"])
             if response.error:
                 print(f"Error getting balance for {bank_name} {account_number}: {response.message}")
                 return None
@@ -82,7 +85,7 @@ class Client:
             key=from_key
         )
         try:
-            response = self.stub.ProcessBank(request)
+            response = self.stub.ProcessBank(request, timeout=self.timeouts["ProcessBank"])
             print(f"Transaction {txn_id}: {from_bank} {from_acc} -> {to_bank} {to_acc} ({amount:.2f}): {response.success} - {response.message}")
         except grpc.RpcError as err:
             print(f"Error processing transaction {txn_id}: {err.details()}")
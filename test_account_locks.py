@@ -0,0 +1,57 @@
+import random
+import threading
+import uuid
+
+from account_locks import AccountLocks
+from bank_server import BankService
+from conftest import Context, payment
+from storage import MemoryStore
+
+BANK = "bank_a"
+
+
+def test_stripes_are_taken_once_and_in_order():
+    locks = AccountLocks(stripes=8)
+    stripes = locks.stripes_for(["a", "b", "a", "", None, "c"])
+    assert stripes == sorted(set(stripes))
+    assert len(stripes) <= 3
+
+
+def test_concurrent_payments_keep_money_and_do_not_deadlock(capsys):
+    # Transfers in both directions and cross-bank prepares over a few
+    # shared accounts, from many threads at once.
+    store = MemoryStore(BANK)
+    service = BankService(BANK, store)
+    numbers = [str(i) for i in range(4)]
+    for number in numbers:
+        store.add_account(number, {'username': number, 'password_hash': "x", 'balance': 1000.0, 'key': ""})
+    sent = []  # amounts committed to the other bank
+
+    def pay(seed):
+        rng = random.Random(seed)
+        for _ in range(200):
+            from_, to = rng.sample(numbers, 2)
+            if rng.random() < 0.5:
+                service.Transfer(payment(from_, BANK, to, BANK, rng.randint(1, 50), ""), Context())
+            else:
+                txn = payment(from_, BANK, str(uuid.uuid4()), "bank_b", rng.randint(1, 50), "")
+                if not service.Prepare(txn, Context()).can_commit:
+                    continue
+                if rng.random() < 0.5:
+                    assert service.Commit(txn, Context()).success
+                    sent.append(txn.amount)
+                else:
+                    assert service.Abort(txn, Context()).success
+
+    threads = [threading.Thread(target=pay, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+
+    assert sum(store.account(number)['balance'] for number in numbers) == 4000.0 - sum(sent)
+    assert all(store.account(number)['balance'] >= 0 for number in numbers)
+    assert store.prepared_count() == 0
+    # Nothing writes to the terminal while account locks are held.
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import grpc
+import pytest
+
+from admission import RETRY_AFTER_MIN, AdmissionControl, AdmissionExecutor, AdmissionInterceptor
+from conftest import Context
+
+
+def serve(request, context):
+    return "served"
+
+
+def call(executor, interceptor, context, method="/GatewayService/ProcessBank"):
+    return executor.submit(interceptor.intercept, serve, None, context, method)
+
+
+def outcome(future):
+    try:
+        return future.result(timeout=5)
+    except grpc.RpcError as e:
+        return str(e).split(":")[0]
+
+
+def retry_after_ms(context):
+    return int(dict(context.trailing_metadata)["retry-after-ms"])
+
+
+@pytest.fixture
+def gateway():
+    # One worker, a 10ms target and no grace interval, so a standing queue
+    # is acted on at the second request taken off it.
+    admission = AdmissionControl(workers=1, max_queue=10, target=0.01, interval=0.0)
+    executor = AdmissionExecutor(admission, 1)
+    yield admission, executor, AdmissionInterceptor(admission)
+    executor.shutdown()
+
+
+def test_requests_are_served_while_queue_delay_is_below_target(gateway):
+    admission, executor, interceptor = gateway
+    for _ in range(5):
+        assert outcome(call(executor, interceptor, Context())) == "served"
+    assert admission.snapshot() == (0, 0.0)
+
+
+def test_shedding_starts_once_queue_delay_exceeds_target(gateway):
+    admission, executor, interceptor = gateway
+    release = threading.Event()
+    executor.submit(release.wait)  # holds the only worker
+    contexts = [Context() for _ in range(4)]
+    futures = [call(executor, interceptor, context) for context in contexts]
+    time.sleep(0.05)  # every queued request has now waited past the target
+    release.set()
+
+    outcomes = [outcome(future) for future in futures]
+    # The first one off the queue starts the clock; the last leaves it empty.
+    assert outcomes == ["served", "StatusCode.RESOURCE_EXHAUSTED", "StatusCode.RESOURCE_EXHAUSTED", "served"]
+    for context in contexts[1:3]:
+        assert retry_after_ms(context) >= RETRY_AFTER_MIN * 1000
+    assert admission.snapshot()[1] == 0.5
+
+    # Once the queue has drained, requests are served again.
+    assert outcome(call(executor, interceptor, Context())) == "served"
+
+
+def test_full_queue_sheds_with_retry_after(gateway):
+    admission, executor, interceptor = gateway
+    admission.max_queue = 1
+    release = threading.Event()
+    executor.submit(release.wait)
+    queued = call(executor, interceptor, Context())
+    context = Context()
+    assert outcome(call(executor, interceptor, context)) == "StatusCode.RESOURCE_EXHAUSTED"
+    assert retry_after_ms(context) >= RETRY_AFTER_MIN * 1000
+    release.set()
+    assert outcome(queued) == "served"
+
+
+def test_health_checks_are_never_shed(gateway):
+    admission, executor, interceptor = gateway
+    admission.max_queue = 0
+    assert outcome(call(executor, interceptor, Context(), "/GatewayService/HealthCheck")) == "served"
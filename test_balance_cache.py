@@ -0,0 +1,75 @@
+import time
+
+import bank_pb2
+import pytest
+
+from balance_cache import BalanceCache
+from conftest import Context, payment
+from gateway_server import GatewayService
+
+
+@pytest.fixture
+def cache():
+    return BalanceCache(ttl=60)
+
+
+@pytest.fixture
+def gateway(bank_configs, cache):
+    service = GatewayService(bank_configs, idempotency_log=None, coordinator_log=None, balance_cache=cache)
+    yield service
+    service.channels.close()
+
+
+def balance(gateway, bank_name, number, key):
+    return gateway.GetBalance(bank_pb2.Account(number=number, bank_name=bank_name, key=key), Context()).balance
+
+
+def test_hit_needs_the_key_the_bank_accepted(cache):
+    cache.put("bank_a", "1", "key", 10.0, time.monotonic())
+    assert cache.get("bank_a", "1", "key") == 10.0
+    assert cache.get("bank_a", "1", "other") is None
+    assert cache.snapshot() == (1, 1)
+
+
+def test_answer_asked_for_before_an_invalidation_is_not_cached(cache):
+    asked_at = time.monotonic()
+    cache.invalidate([("bank_a", "1")])
+    cache.put("bank_a", "1", "key", 10.0, asked_at)
+    assert cache.get("bank_a", "1", "key") is None
+    cache.put("bank_a", "1", "key", 7.0, time.monotonic())
+    assert cache.get("bank_a", "1", "key") == 7.0
+
+
+@pytest.mark.parametrize("to_bank", ["bank_b", "bank_a"])
+def test_payment_invalidates_both_accounts(gateway, banks, cache, to_bank):
+    # A commit across banks, then a transfer within one.
+    payer, payer_key = banks["bank_a"].open_account(100.0)
+    payee, payee_key = banks[to_bank].open_account(0.0)
+    assert balance(gateway, "bank_a", payer, payer_key) == 100.0
+    assert balance(gateway, to_bank, payee, payee_key) == 0.0
+    assert cache.get("bank_a", payer, payer_key) == 100.0
+
+    assert gateway.ProcessBank(payment(payer, "bank_a", payee, to_bank, 30.0, payer_key), Context()).success
+
+    assert cache.get("bank_a", payer, payer_key) is None
+    assert cache.get(to_bank, payee, payee_key) is None
+    assert balance(gateway, "bank_a", payer, payer_key) == 70.0
+    assert balance(gateway, to_bank, payee, payee_key) == 30.0
+
+
+def test_batch_invalidates_every_account_it_touches(gateway, banks):
+    payer, payer_key = banks["bank_a"].open_account(100.0)
+    neighbour, neighbour_key = banks["bank_a"].open_account(0.0)
+    payee, payee_key = banks["bank_b"].open_account(0.0)
+    for bank_name, number, key in (("bank_a", payer, payer_key), ("bank_a", neighbour, neighbour_key),
+                                   ("bank_b", payee, payee_key)):
+        balance(gateway, bank_name, number, key)
+
+    gateway.ProcessBatch(bank_pb2.TransactionBatch(transactions=[
+        payment(payer, "bank_a", payee, "bank_b", 30.0, payer_key),
+        payment(payer, "bank_a", neighbour, "bank_a", 20.0, payer_key),
+    ]), Context())
+
+    assert balance(gateway, "bank_a", payer, payer_key) == 50.0
+    assert balance(gateway, "bank_a", neighbour, neighbour_key) == 20.0
+    assert balance(gateway, "bank_b", payee, payee_key) == 30.0
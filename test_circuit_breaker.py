@@ -0,0 +1,53 @@
+import grpc
+import pytest
+
+import auth_pb2
+from circuit_breaker import CLOSED, MIN_CALLS, OPEN, SLOW_CALL, CircuitBreaker
+from conftest import TEST_COST, Bank, Context
+from credentials import HasherBusy, PasswordHasher
+from gateway_server import GatewayService
+
+
+class BusyHasher(PasswordHasher):
+    """A hasher whose pool is always full."""
+
+    def _run(self, function, *args):
+        raise HasherBusy("Too many password checks in progress")
+
+
+@pytest.fixture
+def busy_bank():
+    bank = Bank("bank_a", BusyHasher(workers=0, n=TEST_COST))
+    yield bank
+    bank.server.stop(None)
+
+
+def test_login_burst_leaves_payment_circuit_closed(busy_bank):
+    gateway = GatewayService({"bank_a": busy_bank.config}, idempotency_log=None, coordinator_log=None)
+    busy_bank.open_account(100.0, username="alice")
+    login = auth_pb2.LoginRequest(username="alice", password="pw", bank_name="bank_a")
+    for _ in range(2 * MIN_CALLS):
+        with pytest.raises(grpc.RpcError):
+            gateway.Login(login, Context())
+    assert gateway.auth_breakers["bank_a"].snapshot()[0] == OPEN
+    assert gateway.breakers["bank_a"].snapshot()[0] == CLOSED
+    gateway.channels.close()
+
+
+class Deadline(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+
+def test_deadline_from_short_budget_is_not_a_failure():
+    breaker = CircuitBreaker("bank_a")
+    for _ in range(2 * MIN_CALLS):
+        breaker.record(Deadline(), SLOW_CALL / 4, timeout=SLOW_CALL / 4)
+    assert breaker.snapshot() == (CLOSED, 0.0)
+
+
+def test_deadline_at_full_limit_is_a_failure():
+    breaker = CircuitBreaker("bank_a")
+    for _ in range(MIN_CALLS):
+        breaker.record(Deadline(), SLOW_CALL / 4, timeout=2 * SLOW_CALL)
+    assert breaker.snapshot()[0] == OPEN
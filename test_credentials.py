@@ -0,0 +1,83 @@
+import grpc
+import pytest
+
+import auth_pb2
+from bank_server import AuthService
+from conftest import TEST_COST, Context
+from credentials import HasherBusy, PasswordHasher, VerifiedCache, check_password, hash_password
+from storage import MemoryStore
+
+
+def test_hash_checks_only_its_password():
+    stored = hash_password("pw", TEST_COST)
+    assert check_password(stored, "pw")
+    assert not check_password(stored, "pW")
+    assert hash_password("pw", TEST_COST) != stored  # salted
+
+
+def test_verified_cache_expires_and_follows_the_stored_hash():
+    cache = VerifiedCache(ttl=10.0)
+    cache.add("alice", "hash-1", "pw", now=0.0)
+    assert cache.hit("alice", "hash-1", "pw", now=5.0)
+    assert not cache.hit("alice", "hash-1", "other", now=5.0)
+    assert not cache.hit("alice", "hash-2", "pw", now=5.0)  # password changed since
+    assert not cache.hit("alice", "hash-1", "pw", now=10.0)
+    assert "pw" not in repr(cache.entries)
+
+
+def test_pool_hashes_and_verifies():
+    hasher = PasswordHasher(workers=1, n=TEST_COST)
+    try:
+        stored = hasher.hash("pw")
+        assert hasher.verify("alice", stored, "pw")
+        assert not hasher.verify("alice", stored, "wrong")
+    finally:
+        hasher.close()
+
+
+def test_full_pool_turns_checks_away():
+    hasher = PasswordHasher(workers=1, max_pending=2, n=TEST_COST)
+    try:
+        for _ in range(2):
+            hasher.pending.acquire()  # two checks already waiting on the pool
+        with pytest.raises(HasherBusy):
+            hasher.hash("pw")
+    finally:
+        hasher.close()
+
+
+@pytest.fixture
+def auth():
+    return AuthService("bank_a", MemoryStore("bank_a"), PasswordHasher(workers=0, n=TEST_COST))
+
+
+def register(auth, username, password="pw"):
+    return auth.RegisterAccount(auth_pb2.RegisterRequest(
+        username=username, password=password, initial_amount=10.0, bank_name="bank_a"), Context())
+
+
+def login(auth, username, password="pw"):
+    return auth.LoginAccount(auth_pb2.LoginRequest(username=username, password=password, bank_name="bank_a"),
+                             Context())
+
+
+def test_login_finds_the_account_by_username(auth):
+    alice = register(auth, "alice")
+    register(auth, "bob")
+    assert not register(auth, "alice").success
+    response = login(auth, "alice")
+    assert response.account_number == alice.account_number
+    assert response.key == auth.store.account(alice.account_number)['key']
+    assert not login(auth, "alice", "wrong").account_number
+    assert not login(auth, "carol").account_number
+
+
+def test_busy_hasher_answers_resource_exhausted(auth):
+    register(auth, "alice")
+    auth.hasher = PasswordHasher(workers=1, max_pending=1, n=TEST_COST)
+    auth.hasher.pending.acquire()  # a check already waiting on the pool
+    try:
+        with pytest.raises(grpc.RpcError, match="RESOURCE_EXHAUSTED"):
+            login(auth, "alice")
+    finally:
+        auth.hasher.close()
@@ -0,0 +1,73 @@
+import types
+
+import pytest
+
+import idempotency
+from conftest import Context, payment
+from gateway_server import GatewayService
+from idempotency import ABORTED, COMMITTED, INITIATED, IdempotencyStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(idempotency, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_repeated_payment_gets_the_stored_outcome(bank_configs, banks, tmp_path):
+    gateway = GatewayService(bank_configs, idempotency_log=str(tmp_path / "idem.log"), coordinator_log=None)
+    payer, key = banks["bank_a"].open_account(100.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    request = payment(payer, "bank_a", payee, "bank_b", 30.0, key)
+
+    first = gateway.ProcessBank(request, Context())
+    again = gateway.ProcessBank(request, Context())
+    gateway.transactions.close()
+    gateway.channels.close()
+
+    assert first.success and again.success
+    assert again.message == first.message
+    # Paid once, however often it was sent.
+    assert banks["bank_a"].balance(payer) == 70.0
+    assert banks["bank_b"].balance(payee) == 30.0
+
+
+def test_outcome_survives_a_restart(tmp_path):
+    path = str(tmp_path / "idem.log")
+    store = IdempotencyStore(path)
+    assert store.begin("t1") is None
+    store.finish("t1", ABORTED, False, "Insufficient funds")
+    store.close()
+
+    record = IdempotencyStore(path).begin("t1")
+    assert (record.state, record.success, record.message) == (ABORTED, False, "Insufficient funds")
+
+
+def test_payment_in_progress_is_not_run_twice():
+    store = IdempotencyStore(None)
+    assert store.begin("t1") is None
+    assert store.begin("t1").state == INITIATED
+    store.discard("t1")
+    assert store.begin("t1") is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    store = IdempotencyStore(None, max_entries=2)
+    for txn_id in ("t1", "t2"):
+        store.begin(txn_id)
+        store.finish(txn_id, COMMITTED, True, "ok")
+    store.begin("t1")  # t2 is now the least recently used
+    assert store.begin("t3") is None
+    assert list(store.entries) == ["t1", "t3"]
+    assert store.begin("t2") is None
+
+
+def test_finished_entry_expires_after_ttl(clock):
+    store = IdempotencyStore(None, ttl=60)
+    store.begin("t1")
+    store.finish("t1", COMMITTED, True, "ok")
+    clock.now += 59
+    assert store.begin("t1").state == COMMITTED
+    clock.now += 2
+    assert store.begin("t1") is None
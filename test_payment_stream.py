@@ -0,0 +1,59 @@
+import queue
+import time
+
+import grpc
+import pytest
+
+from admission import AdmissionControl, AdmissionExecutor, untimed
+from conftest import Context, payment
+from gateway_server import MAX_STREAMS, GatewayService
+
+
+@pytest.fixture
+def gateway(bank_configs):
+    service = GatewayService(bank_configs, idempotency_log=None, coordinator_log=None)
+    yield service
+    service.channels.close()
+
+
+def test_stream_answers_each_payment_in_turn(gateway, banks):
+    payer, key = banks["bank_a"].open_account(100.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    # The last payment finds the payer short of funds.
+    payments = [payment(payer, "bank_a", payee, "bank_b", amount, key) for amount in (30.0, 20.0, 10.0, 50.0)]
+    answered = queue.Queue()
+
+    def requests():
+        # Send the next payment once the previous one is answered.
+        for request in payments:
+            yield request
+            answered.get(timeout=10)
+
+    replies = []
+    for result in gateway.PaymentStream(requests(), Context()):
+        replies.append(result)
+        answered.put(result)
+
+    assert [reply.id for reply in replies] == [request.id for request in payments]
+    assert [reply.success for reply in replies] == [True, True, True, False]
+    assert banks["bank_a"].balance(payer) == 40.0
+    assert banks["bank_b"].balance(payee) == 60.0
+
+
+def test_streams_beyond_the_limit_are_refused(gateway):
+    for _ in range(MAX_STREAMS):
+        gateway.streams.acquire()
+    with pytest.raises(grpc.RpcError, match="RESOURCE_EXHAUSTED"):
+        next(gateway.PaymentStream(iter(()), Context()))
+    gateway.streams.release()
+    assert list(gateway.PaymentStream(iter(()), Context())) == []
+
+
+def test_open_streams_are_left_out_of_the_service_time():
+    admission = AdmissionControl(workers=1)
+    executor = AdmissionExecutor(admission, 1)
+    executor.submit(untimed).result()
+    assert admission.service_time == 0.0
+    executor.submit(time.sleep, 0.01).result()
+    assert admission.service_time > 0.0
+    executor.shutdown()
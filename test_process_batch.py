@@ -0,0 +1,39 @@
+import bank_pb2
+import pytest
+
+from conftest import Context, payment
+from gateway_server import GatewayService
+
+
+@pytest.fixture
+def gateway(bank_configs, tmp_path):
+    service = GatewayService(bank_configs, idempotency_log=None,
+                             coordinator_log=str(tmp_path / "coordinator.log"))
+    yield service
+    service.coordinator_log.close()
+    service.channels.close()
+
+
+def test_batch_answers_every_payment_in_order(gateway, banks):
+    payer, key = banks["bank_a"].open_account(100.0)
+    neighbour, _ = banks["bank_a"].open_account(0.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    txns = [
+        payment(payer, "bank_a", payee, "bank_b", 30.0, key),
+        payment(payer, "bank_a", payee, "bank_b", 500.0, key),  # more than the payer has
+        payment(payer, "bank_a", neighbour, "bank_a", 20.0, key),  # same bank
+        payment(payer, "bank_a", payee, "bank_z", 5.0, key),  # unknown bank
+        payment(payer, "bank_a", "no-such-account", "bank_b", 5.0, key),
+        payment(payer, "bank_a", payee, "bank_b", 10.0, key),
+    ]
+
+    response = gateway.ProcessBatch(bank_pb2.TransactionBatch(transactions=txns), Context())
+
+    assert [result.id for result in response.results] == [txn.id for txn in txns]
+    assert [result.success for result in response.results] == [True, False, True, False, False, True]
+    # The failures moved no money and left nothing prepared.
+    assert banks["bank_a"].balance(payer) == 100.0 - 30.0 - 20.0 - 10.0
+    assert banks["bank_a"].balance(neighbour) == 20.0
+    assert banks["bank_b"].balance(payee) == 40.0
+    assert banks["bank_a"].store.prepared_count() == 0
+    assert banks["bank_b"].store.prepared_count() == 0
@@ -0,0 +1,74 @@
+import asyncio
+
+import bank_pb2
+import grpc
+import pytest
+
+from conftest import Context
+from rate_limit import AsyncRateLimitInterceptor, RateLimiter, RateLimitInterceptor, TokenBuckets, client_identity
+
+LIMITS = {"ProcessBank": (10.0, 4)}
+
+
+def serve(request, context):
+    return request
+
+
+def batch(size):
+    return bank_pb2.TransactionBatch(transactions=[bank_pb2.Transaction(id=str(i)) for i in range(size)])
+
+
+def test_bucket_refills_at_its_rate():
+    buckets = TokenBuckets(rate=10.0, burst=2)
+    assert buckets.take("c", now=0.0) == 0.0
+    assert buckets.take("c", now=0.0) == 0.0
+    assert buckets.take("c", now=0.0) == pytest.approx(0.1)
+    assert buckets.take("c", now=0.1) == 0.0
+
+
+def test_batch_larger_than_the_burst_goes_into_debt():
+    buckets = TokenBuckets(rate=10.0, burst=4, stripes=1)
+    assert buckets.take("c", now=0.0, tokens=10) == 0.0
+    # Six tokens short: 0.7s until one is back.
+    assert buckets.take("c", now=0.0) == pytest.approx(0.7)
+    # A bucket in debt is not dropped as idle.
+    assert buckets.take("d", now=0.5) == 0.0
+    assert buckets.take("c", now=0.5) == pytest.approx(0.2)
+
+
+def test_batch_items_count_against_process_bank():
+    interceptor = RateLimitInterceptor(RateLimiter(LIMITS))
+    assert interceptor.intercept(serve, batch(3), Context(), "/GatewayService/ProcessBatch")
+    assert interceptor.intercept(serve, bank_pb2.Transaction(), Context(), "/GatewayService/ProcessBank")
+    context = Context()
+    with pytest.raises(grpc.RpcError, match="RESOURCE_EXHAUSTED"):
+        interceptor.intercept(serve, batch(1), context, "/GatewayService/ProcessBatch")
+    assert "retry-after-ms" in dict(context.trailing_metadata)
+
+
+def test_stream_messages_are_paced_by_the_bucket():
+    limiter = RateLimiter(LIMITS)
+    interceptor = RateLimitInterceptor(limiter)
+    requests = [bank_pb2.Transaction(id=str(i)) for i in range(6)]
+    paced = interceptor.intercept(serve, iter(requests), Context(), "/GatewayService/PaymentStream")
+    assert list(paced) == requests
+    # Four came from the burst and two waited for a refill; none are left.
+    assert limiter.check("ProcessBank", client_identity(Context())) > 0.0
+
+
+def test_async_stream_messages_are_paced_by_the_bucket():
+    limiter = RateLimiter(LIMITS)
+    interceptor = AsyncRateLimitInterceptor(limiter)
+    requests = [bank_pb2.Transaction(id=str(i)) for i in range(6)]
+
+    async def source():
+        for request in requests:
+            yield request
+
+    async def consume(request_iterator, context):
+        return [request async for request in request_iterator]
+
+    async def run():
+        return await interceptor.intercept(consume, source(), Context(), "/GatewayService/PaymentStream")
+
+    assert asyncio.run(run()) == requests
@@ -0,0 +1,68 @@
+import pytest
+
+from bank_pool import BankChannelPool
+from conftest import payment
+from coordinator_log import COMMIT, CoordinatorLog
+from idempotency import COMMITTED, IdempotencyStore
+from recovery import recover_in_doubt
+
+
+@pytest.fixture
+def channels(bank_configs):
+    pool = BankChannelPool(bank_configs)
+    yield pool
+    pool.close()
+
+
+def prepare_everywhere(banks, txn):
+    for bank_name in (txn.from_bank, txn.to_bank):
+        assert banks[bank_name].store.prepare(txn)
+
+
+def test_restart_finishes_every_in_doubt_payment(banks, channels, tmp_path):
+    payer, key = banks["bank_a"].open_account(100.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    committed = payment(payer, "bank_a", payee, "bank_b", 30.0, key)
+    undecided = payment(payer, "bank_a", payee, "bank_b", 20.0, key)
+    path = str(tmp_path / "coordinator.log")
+
+    # The gateway crashed after logging COMMIT for one payment and before
+    # deciding the other; both are on hold at the banks.
+    log = CoordinatorLog(path)
+    for txn in (committed, undecided):
+        log.begin(txn, [txn.from_bank, txn.to_bank])
+        prepare_everywhere(banks, txn)
+    log.decide(committed.id, COMMIT)
+    log.close()
+
+    log = CoordinatorLog(path)
+    assert len(log.in_doubt()) == 2
+    transactions = IdempotencyStore(str(tmp_path / "idem.log"))
+    assert recover_in_doubt(log, channels, transactions) == 0
+    assert log.in_doubt() == []
+    assert banks["bank_a"].balance(payer) == 70.0
+    assert banks["bank_b"].balance(payee) == 30.0
+    assert banks["bank_a"].store.prepared_count() == banks["bank_b"].store.prepared_count() == 0
+    assert transactions.begin(committed.id).state == COMMITTED
+    log.close()
+
+    # The checkpoint recovery ends with leaves nothing to replay.
+    assert CoordinatorLog(path).in_doubt() == []
+
+
+def test_unreachable_bank_stays_in_doubt(banks, bank_configs, tmp_path):
+    payer, key = banks["bank_a"].open_account(100.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    txn = payment(payer, "bank_a", payee, "bank_b", 30.0, key)
+    log = CoordinatorLog(str(tmp_path / "coordinator.log"))
+    log.begin(txn, ["bank_a", "bank_b"])
+    prepare_everywhere(banks, txn)
+    banks["bank_b"].server.stop(None)
+
+    pool = BankChannelPool(bank_configs)
+    assert recover_in_doubt(log, pool) == 1
+    assert [entry.txn_id for entry in log.in_doubt()] == [txn.id]
+    # bank_a, which did answer, has released the payer's hold.
+    assert banks["bank_a"].balance(payer) == 100.0
+    pool.close()
+    log.close()
@@ -0,0 +1,77 @@
+import pytest
+
+import auth_pb2
+import bank_pb2
+from conftest import Context, payment
+from gateway_server import GatewayService
+from session_tokens import InvalidToken, SessionTokens
+
+SECRET = b"s" * 32
+
+
+@pytest.fixture
+def tokens():
+    return SessionTokens(SECRET)
+
+
+def test_issued_token_verifies(tokens):
+    session = tokens.verify(tokens.issue("bank_a", "acct-1", "bank-key"))
+    assert (session.bank_name, session.account_number, session.bank_key) == ("bank_a", "acct-1", "bank-key")
+
+
+@pytest.mark.parametrize("token", ["", "v1", "v1.a.b", "v2.x.y", "not-a-token.at.all"])
+def test_malformed_token_is_rejected(tokens, token):
+    with pytest.raises(InvalidToken):
+        tokens.verify(token)
+
+
+def test_tampered_or_foreign_token_is_rejected(tokens):
+    version, payload, signature = tokens.issue("bank_a", "acct-1", "bank-key").split(".")
+    other = tokens.issue("bank_a", "acct-2", "other-key").split(".")[1]
+    for token in (f"{version}.{other}.{signature}",
+                  f"{version}.{payload}.{signature[:-2]}AA",
+                  SessionTokens(b"t" * 32).issue("bank_a", "acct-1", "bank-key")):
+        with pytest.raises(InvalidToken):
+            tokens.verify(token)
+
+
+def test_expired_token_is_rejected():
+    expired = SessionTokens(SECRET, ttl=-1)
+    with pytest.raises(InvalidToken, match="expired"):
+        expired.verify(expired.issue("bank_a", "acct-1", "bank-key"))
+
+
+def test_cached_token_still_expires(tokens, monkeypatch):
+    token = tokens.issue("bank_a", "acct-1", "bank-key")
+    tokens.verify(token)  # now in the verified cache
+    monkeypatch.setattr("session_tokens.time.time", lambda: 2 ** 40)
+    with pytest.raises(InvalidToken, match="expired"):
+        tokens.verify(token)
+
+
+def test_token_only_authorizes_its_own_account(tokens):
+    token = tokens.issue("bank_a", "acct-1", "bank-key")
+    assert tokens.authorize(token, "bank_a", "acct-1").bank_key == "bank-key"
+    for bank_name, account_number in (("bank_a", "acct-2"), ("bank_b", "acct-1")):
+        with pytest.raises(InvalidToken, match="another account"):
+            tokens.authorize(token, bank_name, account_number)
+
+
+def test_gateway_login_token_pays_only_from_its_account(banks, bank_configs, tokens):
+    gateway = GatewayService(bank_configs, idempotency_log=None, coordinator_log=None, tokens=tokens)
+    payer, _ = banks["bank_a"].open_account(100.0, username="alice")
+    other, _ = banks["bank_a"].open_account(100.0, username="bob")
+    payee, _ = banks["bank_b"].open_account(0.0)
+    login = gateway.Login(auth_pb2.LoginRequest(username="alice", password="pw", bank_name="bank_a"), Context())
+    assert login.account_number == payer
+
+    # The bank is asked with its own key, which the token carries.
+    balance = gateway.GetBalance(bank_pb2.Account(number=payer, bank_name="bank_a", key=login.key), Context())
+    assert not balance.error and balance.balance == 100.0
+    stolen = gateway.ProcessBank(payment(other, "bank_a", payee, "bank_b", 10.0, login.key), Context())
+    assert not stolen.success and "another account" in stolen.message
+    paid = gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 10.0, login.key), Context())
+    assert paid.success
+    assert banks["bank_a"].balance(other) == 100.0
+    assert banks["bank_b"].balance(payee) == 10.0
+    gateway.channels.close()
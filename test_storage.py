@@ -0,0 +1,94 @@
+import bank_pb2
+import pytest
+
+from ledger import Ledger
+from storage import MemoryStore, SqliteStore
+
+BANK = "bank_a"
+
+
+def txn(txn_id, from_, from_bank, to, to_bank, amount):
+    return bank_pb2.Transaction(id=txn_id, from_=from_, from_bank=from_bank, to=to, to_bank=to_bank, amount=amount)
+
+
+# Each step is (method, arguments); every store must give the answer in ANSWERS to each.
+SCRIPT = [
+    ("add_account", "alice", "alice", 100.0),
+    ("add_account", "bob", "bob", 50.0),
+    ("add_account", "alice2", "alice", 10.0),  # username taken
+    ("prepare", txn("p1", "alice", BANK, "x", "bank_b", 30.0)),
+    ("prepare", txn("p1", "alice", BANK, "x", "bank_b", 30.0)),  # duplicate ID
+    ("prepare", txn("p2", "alice", BANK, "x", "bank_b", 500.0)),  # insufficient funds
+    ("prepare", txn("p3", "nobody", BANK, "x", "bank_b", 1.0)),  # unknown account
+    ("prepare", txn("p4", "y", "bank_b", "bob", BANK, 20.0)),  # as recipient
+    ("commit", txn("p1", "alice", BANK, "x", "bank_b", 30.0)),
+    ("commit", txn("p1", "alice", BANK, "x", "bank_b", 30.0)),  # already settled
+    ("commit", txn("p4", "y", "bank_b", "bob", BANK, 20.0)),
+    ("prepare", txn("p5", "alice", BANK, "x", "bank_b", 15.0)),
+    ("abort", txn("p5", "alice", BANK, "x", "bank_b", 15.0)),
+    ("abort", txn("p6", "alice", BANK, "x", "bank_b", 15.0)),  # never prepared
+    ("prepare", txn("p7", "bob", BANK, "x", "bank_b", 5.0)),  # left on hold
+    ("transfer", txn("t1", "alice", BANK, "bob", BANK, 25.0)),
+    ("transfer", txn("t1", "alice", BANK, "bob", BANK, 25.0)),  # duplicate ID
+    ("transfer", txn("t2", "alice", BANK, "bob", BANK, 1000.0)),  # insufficient funds
+    ("transfer", txn("t3", "alice", BANK, "nobody", BANK, 1.0)),  # unknown recipient
+    ("transfer", txn("t4", "alice", BANK, "bob", BANK, -1.0)),  # not a payment
+    ("transfer", txn("p7", "alice", BANK, "bob", BANK, 1.0)),  # ID of a prepared payment
+    ("transfer", txn("t5", "alice", "bank_b", "bob", BANK, 1.0)),  # not in-bank
+]
+ANSWERS = [True, True, False, True, False, False, False, True, True, False, True,
+           True, True, False, True, True, False, False, False, False, False, False]
+
+
+def run(store):
+    answers = []
+    for method, *args in SCRIPT:
+        if method == "add_account":
+            number, username, balance = args
+            answers.append(store.add_account(number, {
+                'username': username, 'password_hash': "x", 'balance': balance, 'key': f"key-{number}"}))
+        else:
+            answers.append(getattr(store, method)(*args))
+    return answers
+
+
+def contents(store):
+    return {username: store.find_username(username)[1]["balance"] for username in ("alice", "bob")}, \
+        store.prepared_count()
+
+
+@pytest.fixture(params=["memory", "ledger", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStore(BANK)
+    elif request.param == "ledger":
+        store = MemoryStore(BANK, ledger=Ledger(BANK, str(tmp_path), sync=False))
+    else:
+        store = SqliteStore(BANK, str(tmp_path / "bank.db"), sync=False)
+    yield store
+    store.close()
+
+
+def test_stores_answer_alike(store, capsys):
+    assert run(store) == ANSWERS
+    assert contents(store) == ({"alice": 100.0 - 30.0 - 25.0, "bob": 50.0 + 20.0 - 5.0 + 25.0}, 1)
+    # Neither backend writes to the terminal.
+    assert capsys.readouterr().out == ""
+
+
+def test_sqlite_store_survives_reopening(tmp_path):
+    path = str(tmp_path / "bank.db")
+    store = SqliteStore(BANK, path, sync=False)
+    run(store)
+    before = contents(store)
+    number, account = store.find_username("alice")
+    store.close()
+
+    reopened = SqliteStore(BANK, path, sync=False)
+    assert contents(reopened) == before
+    assert reopened.account(number) == account
+    assert reopened.has_username("bob") and not reopened.has_username("carol")
+    # The hold left by p7 can still be settled, and t1 is still known.
+    assert reopened.abort(txn("p7", "bob", BANK, "x", "bank_b", 5.0))
+    assert not reopened.transfer(txn("t1", "alice", BANK, "bob", BANK, 25.0))
+    reopened.close()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from conftest import Context, payment
+from gateway_aio import AsyncGatewayService
+from gateway_server import GatewayService
+
+
+def eventually(check, timeout=5.0):
+    # A vote the gateway stopped waiting for is aborted, and ENDed, in the background.
+    deadline = time.monotonic() + timeout
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+@pytest.fixture
+def gateway(bank_configs, tmp_path):
+    service = GatewayService(bank_configs, idempotency_log=str(tmp_path / "idem.log"),
+                             coordinator_log=str(tmp_path / "coordinator.log"))
+    yield service
+    service.coordinator_log.close()
+    service.channels.close()
+
+
+@pytest.fixture
+def accounts(banks):
+    payer, key = banks["bank_a"].open_account(100.0)
+    payee, _ = banks["bank_b"].open_account(0.0)
+    return payer, key, payee
+
+
+def test_commit_moves_funds_and_ends(gateway, banks, accounts):
+    payer, key, payee = accounts
+    response = gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 30.0, key), Context())
+    assert response.success
+    assert banks["bank_a"].balance(payer) == 70.0
+    assert banks["bank_b"].balance(payee) == 30.0
+    assert gateway.coordinator_log.in_doubt() == []
+
+
+@pytest.mark.parametrize("amount, recipient", [(500.0, None), (10.0, "no-such-account")])
+def test_declined_payment_is_not_left_in_doubt(gateway, banks, accounts, amount, recipient):
+    # Insufficient funds, then an unknown recipient: a bank votes NO, its
+    # Abort finds nothing prepared, and the payment must still be ENDed.
+    payer, key, payee = accounts
+    response = gateway.ProcessBank(payment(payer, "bank_a", recipient or payee, "bank_b", amount, key), Context())
+    assert not response.success
+    assert eventually(lambda: gateway.coordinator_log.in_doubt() == [])
+    assert banks["bank_a"].balance(payer) == 100.0
+    assert banks["bank_a"].store.prepared_count() == 0
+    assert banks["bank_b"].store.prepared_count() == 0
+
+
+def test_declined_payment_is_not_left_in_doubt_after_restart(gateway, accounts, tmp_path):
+    payer, key, payee = accounts
+    gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 500.0, key), Context())
+    assert eventually(lambda: gateway.coordinator_log.in_doubt() == [])
+    gateway.coordinator_log.checkpoint()
+    gateway.coordinator_log.close()
+    with open(tmp_path / "coordinator.log") as f:
+        assert f.read() == ""
+
+
+def test_aio_declined_payment_is_not_left_in_doubt(bank_configs, accounts, tmp_path):
+    payer, key, payee = accounts
+
+    async def pay():
+        gateway = AsyncGatewayService(bank_configs, idempotency_log=os.path.join(tmp_path, "idem.log"),
+                                      coordinator_log=os.path.join(tmp_path, "coordinator.log"))
+        declined = await gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 500.0, key), Context())
+        paid = await gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 40.0, key), Context())
+        deadline = time.monotonic() + 5.0
+        while gateway.coordinator_log.in_doubt() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        in_doubt = gateway.coordinator_log.in_doubt()
+        gateway.coordinator_log.close()
+        await gateway.channels.close()
+        return declined, paid, in_doubt
+
+    declined, paid, in_doubt = asyncio.run(pay())
+    assert not declined.success
+    assert paid.success
+    assert in_doubt == []
+
+
+def test_bank_removed_mid_payment_still_gets_its_commit(gateway, banks, accounts, monkeypatch):
+    # The registry drops bank_b after both banks voted YES; its Commit must still go out.
+    payer, key, payee = accounts
+    decide = gateway.coordinator_log.decide
+
+    def decide_then_reload(txn_id, decision):
+        decide(txn_id, decision)
+        gateway.apply_bank_config({"bank_a": banks["bank_a"].config})
+
+    monkeypatch.setattr(gateway.coordinator_log, "decide", decide_then_reload)
+    response = gateway.ProcessBank(payment(payer, "bank_a", payee, "bank_b", 30.0, key), Context())
+    assert response.success
+    assert banks["bank_b"].balance(payee) == 30.0
+    assert gateway.coordinator_log.in_doubt() == []
+    assert "bank_b" not in gateway.channels
+    assert gateway.channels.draining.banks == {}
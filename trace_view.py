@@ -0,0 +1,103 @@
+"""Show payment traces written by the gateway and banks as waterfalls.
+
+Reads the span files (by default every data/*.trace.jsonl, so gateway and
+bank spans are joined up), lists the slowest traces and draws one:
+
+    python trace_view.py                  # slowest traces, then the slowest drawn
+    python trace_view.py --trace 3f2a     # the trace whose ID starts with 3f2a
+    python trace_view.py --txn <txn id>   # the trace of one payment
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+BAR_WIDTH = 40
+DEFAULT_FILES = os.path.join("data", "*.trace.jsonl")
+SHOWN_ATTRS = ("bank", "outcome", "vote", "status")  # printed after a span's name
+
+
+def load_traces(paths):
+    """trace_id -> its spans, from JSONL span files; lines that do not parse are skipped."""
+    traces = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def root_of(spans):
+    ids = {span["span_id"] for span in spans}
+    roots = [span for span in spans if span.get("parent_id") not in ids]
+    return min(roots, key=lambda span: span["start"])
+
+
+def summary(trace_id, spans):
+    root = root_of(spans)
+    result = {True: "success", False: "failed"}.get(root.get("success"), root.get("status", ""))
+    return f"{trace_id}  {root['name']:12} {root['duration_ms']:9.2f}ms  {result:17} {root.get('txn', '')}"
+
+
+def waterfall(spans, width=BAR_WIDTH):
+    """Lines drawing each span as a bar on a time axis, children under their parents."""
+    root = root_of(spans)
+    begin = root["start"]
+    total = max(max(s["start"] + s["duration_ms"] / 1000 for s in spans) - begin, 1e-9)
+    children = {}
+    for span in spans:
+        children.setdefault(span.get("parent_id"), []).append(span)
+
+    lines = [f"{'start':>9} {'took':>9}  {'span':44} timeline ({total * 1000:.2f}ms)"]
+
+    def draw(span, depth):
+        offset = span["start"] - begin
+        first = min(width - 1, int(offset / total * width))
+        length = max(1, round(span["duration_ms"] / 1000 / total * width))
+        bar = " " * first + "#" * min(length, width - first)
+        details = ", ".join(str(span[key]) for key in SHOWN_ATTRS if key in span)
+        label = "  " * depth + f"{span['name']} [{span['service']}{', ' + details if details else ''}]"
+        lines.append(f"{offset * 1000:8.2f}ms {span['duration_ms']:7.2f}ms  {label:44} |{bar:{width}}|")
+        for kid in sorted(children.get(span["span_id"], []), key=lambda s: s["start"]):
+            draw(kid, depth + 1)
+
+    draw(root, 0)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help=f"span files (default {DEFAULT_FILES})")
+    parser.add_argument("--trace", help="draw the trace whose ID starts with this")
+    parser.add_argument("--txn", help="draw the trace of this transaction ID")
+    parser.add_argument("--slowest", type=int, default=10, help="how many of the slowest traces to list")
+    args = parser.parse_args()
+
+    traces = load_traces(args.files or sorted(glob.glob(DEFAULT_FILES)))
+    if not traces:
+        sys.exit("No spans found")
+    if args.trace:
+        chosen = [t for t in traces if t.startswith(args.trace)]
+    elif args.txn:
+        chosen = [t for t, spans in traces.items() if any(s.get("txn") == args.txn for s in spans)]
+    else:
+        slowest = sorted(traces, key=lambda t: root_of(traces[t])["duration_ms"], reverse=True)[:args.slowest]
+        for trace_id in slowest:
+            print(summary(trace_id, traces[trace_id]))
+        print()
+        chosen = slowest[:1]
+    if not chosen:
+        sys.exit("No matching trace")
+    for trace_id in chosen:
+        print(summary(trace_id, traces[trace_id]))
+        print("\n".join(waterfall(traces[trace_id])))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Trace spans for payments, shared between the gateway and the banks through gRPC metadata.
+
+The gateway starts a trace for each traced RPC and sends its ID, with the
+ID of the span making the call, to every bank it calls; a bank's spans join
+the same trace. Spans are written to a local exporter (a JSONL file or an
+in-memory ring); trace_view.py draws a trace as a waterfall.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+from grpc_interceptor import AsyncServerInterceptor, ServerInterceptor
+
+from metrics import rpc_status
+
+TRACE_HEADER = "x-trace-id"
+PARENT_HEADER = "x-parent-span-id"
+DEFAULT_TRACE_FILE = os.path.join("data", "gateway.trace.jsonl")
+RING_SIZE = 10000  # spans kept by RingExporter
+TRACED_METHODS = ("ProcessBank",)  # gateway RPCs that start a trace
+
+# The span the running request (thread or asyncio task) is in, if it is traced.
+_current = contextvars.ContextVar("span", default=None)
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "start", "started", "duration", "attrs")
+
+    def __init__(self, tracer, trace_id, parent_id, name, attrs):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, **attrs):
+        self.attrs.update(attrs)
+        self.duration = time.perf_counter() - self.started
+        self.tracer.exporter.export(self)
+
+    def metadata(self):
+        """gRPC metadata that makes the callee's spans children of this one."""
+        return ((TRACE_HEADER, self.trace_id), (PARENT_HEADER, self.span_id))
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.tracer.service,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attrs,
+        }
+
+
+class RingExporter:
+    """Keeps the last `size` spans in memory."""
+
+    def __init__(self, size=RING_SIZE):
+        self.ring = collections.deque(maxlen=size)
+
+    def export(self, span):
+        self.ring.append(span.to_dict())
+
+    def spans(self, trace_id=None):
+        return [s for s in list(self.ring) if trace_id is None or s["trace_id"] == trace_id]
+
+
+class JsonlExporter:
+    """Appends one JSON line per span to `path`, opened on the first span."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.file = open(self.path, "a", buffering=1)
+            self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class Tracer:
+    def __init__(self, service, exporter):
+        self.service = service
+        self.exporter = exporter
+
+    def start(self, name, trace_id=None, parent_id=None, **attrs):
+        return Span(self, trace_id or _new_id(128), parent_id, name, attrs)
+
+
+def _incoming(context):
+    """(trace_id, parent span ID) from the caller's metadata; both None if it sent none."""
+    trace_id = parent_id = None
+    for key, value in context.invocation_metadata() or ():
+        if key == TRACE_HEADER:
+            trace_id = value
+        elif key == PARENT_HEADER:
+            parent_id = value
+    return trace_id, parent_id
+
+
+def child(name, **attrs):
+    """Start a span under the current one; None if the request is not traced."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return parent.tracer.start(name, parent.trace_id, parent.span_id, **attrs)
+
+
+def end(span, **attrs):
+    if span is not None:
+        span.end(**attrs)
+
+
+def metadata(span):
+    return span.metadata() if span is not None else None
+
+
+def record(name, seconds, **attrs):
+    """Add a span for something that has just finished after `seconds`, such as a wait in a queue."""
+    span = child(name, **attrs)
+    if span is not None:
+        span.start -= seconds
+        span.started -= seconds
+        span.end()
+
+
+@contextlib.contextmanager
+def phase(name, **attrs):
+    """A span under the current one for the body of the with block; yields None if not traced."""
+    span = child(name, **attrs)
+    if span is None:
+        yield None
+        return
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+        span.end()
+
+
+def _begin(tracer, methods, method_name, request, context, queued):
+    trace_id, parent_id = _incoming(context)
+    if trace_id is None and method_name not in methods:
+        return None
+    span = tracer.start(method_name, trace_id, parent_id)
+    if getattr(request, "id", ""):
+        span.attrs["txn"] = request.id
+    if queued:
+        # The request was waiting for a worker before its handler started.
+        span.start -= queued
+        span.started -= queued
+        admission = tracer.start("admission", span.trace_id, span.span_id)
+        admission.start, admission.started = span.start, span.started
+        admission.end()
+    return span
+
+
+def _outcome(span, response):
+    # A payment that was refused still ends with status OK; keep its answer.
+    if hasattr(response, "success"):
+        span.attrs["success"] = response.success
+    elif hasattr(response, "can_commit") and isinstance(response.can_commit, bool):
+        span.attrs["vote"] = "YES" if response.can_commit else "NO"
+
+
+class TracingInterceptor(ServerInterceptor):
+    """Starts a span for every call that carries a trace ID, and a new trace for `methods`.
+
+    `queued`, if given, returns how long the current request waited to be
+    served; that wait is recorded as an "admission" span.
+    """
+
+    def __init__(self, tracer, methods=(), queued=None):
+        self.tracer = tracer
+        self.methods = methods
+        self.queued = queued
+
+    def intercept(self, method, request, context, method_name):
+        method_name = str(method_name).split('/')[-1]
+        span = _begin(self.tracer, self.methods, method_name, request, context,
+                      self.queued() if self.queued else 0.0)
+        if span is None:
+            return method(request, context)
+        token = _current.set(span)
+        error = None
+        try:
+            response = method(request, context)
+            _outcome(span, response)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            span.end(status=rpc_status(error, context) if error else "OK")
+
+
+class AsyncTracingInterceptor(AsyncServerInterceptor):
+    """TracingInterceptor for grpc.aio servers."""
+
+    def __init__(self, tracer, methods=()):
+        self.tracer = tracer
+        self.methods = methods
+
+    async def intercept(self, method, request, context, method_name):
+        method_name = str(method_name).split('/')[-1]
+        span = _begin(self.tracer, self.methods, method_name, request, context, 0.0)
+        if span is None:
+            response = method(request, context)
+            if hasattr(response, "__aiter__"):
+                return response
+            return await response
+        token = _current.set(span)
+        error = None
+        try:
+            response = await method(request, context)
+            _outcome(span, response)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            span.end(status=rpc_status(error, context) if error else "OK")
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+
+
+class LogWriteError(IOError):
+    pass
+
+
+class GroupCommitLog:
+    """Append-only JSON-lines log whose concurrent writers share one fsync.
+
+    append() returns once the record is on disk. The first waiting writer
+    flushes everything queued so far, and the others sleep until that
+    flush covers their record. Under load a single fsync makes a whole
+    batch durable. append_nowait() queues a record for the next flush
+    without waiting for it.
+    """
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "ab")
+        self.cond = threading.Condition()
+        self.buffer = []
+        self.appended = 0
+        self.durable = 0
+        self.flushing = False
+        self.error = None
+        self.flushes = 0
+
+    def append(self, record):
+        with self.cond:
+            seq = self._enqueue(record)
+            while self.durable < seq:
+                if self.error is not None:
+                    raise LogWriteError(f"{self.path} is not writable") from self.error
+                if self.flushing:
+                    self.cond.wait()
+                else:
+                    self._flush_locked()
+            if self.error is not None:
+                raise LogWriteError(f"{self.path} is not writable") from self.error
+
+    def append_nowait(self, record):
+        with self.cond:
+            self._enqueue(record)
+
+    def flush(self):
+        with self.cond:
+            while self.durable < self.appended and self.error is None:
+                if self.flushing:
+                    self.cond.wait()
+                else:
+                    self._flush_locked()
+            if self.error is not None:
+                raise LogWriteError(f"{self.path} is not writable") from self.error
+
+    def _enqueue(self, record):
+        self.buffer.append(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self.appended += 1
+        return self.appended
+
+    def _flush_locked(self):
+        # Called with the condition held; the write and fsync happen
+        # without it so new records can queue for the next batch.
+        self.flushing = True
+        batch, self.buffer = self.buffer, []
+        upto = self.appended
+        self.cond.release()
+        try:
+            self.file.write(b"".join(batch))
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+        except OSError as e:
+            error = e
+        else:
+            error = None
+        finally:
+            self.cond.acquire()
+            self.flushing = False
+            self.flushes += 1
+            if error is not None:
+                self.error = error
+            else:
+                self.durable = upto
+            self.cond.notify_all()
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.file.close()
+
+
+def read_records(path):
+    """Yield the records of a log written by GroupCommitLog, skipping a torn tail."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue